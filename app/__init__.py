@@ -1,3 +1,22 @@
-from app.prediction_api import format_prediction, predict_images_from_upload
-from app.main import app
-__all__ = "format_prediction","predict_images_from_upload"
+from app import startup
+
+# Resolved on first access (PEP 562): importing a submodule such as
+# app.config or app.model.variants does not build the FastAPI application
+_EXPORTS = {
+    "format_prediction": "app.prediction_api",
+    "format_predictions": "app.prediction_api",
+    "predict_images_from_upload": "app.prediction_api",
+    "app": "app.main",
+}
+
+__all__ = "format_prediction","format_predictions","predict_images_from_upload"
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    import importlib
+
+    value = getattr(importlib.import_module(_EXPORTS[name]), name)
+    globals()[name] = value
+    return value
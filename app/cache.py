@@ -0,0 +1,141 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from app import config
+from app.results import Prediction
+
+
+def prediction_key(content: bytes, model: str, **params) -> str:
+    """
+    Cache key of a prediction: hash of the raw image bytes, the model it was
+    predicted with (path and version) and the settings it was predicted
+    under (thresholds, decoding, NMS).
+    """
+    digest = hashlib.blake2b(content, digest_size=16).hexdigest()
+    settings = ",".join(f"{name}={params[name]}" for name in sorted(params))
+    return f"{digest}:{model}:{settings}"
+
+
+class PredictionCache:
+    """
+    Content-addressed cache of predictions. An in-memory LRU tier bounded by
+    `max_bytes` of serialized results, optionally backed by a SQLite file
+    that survives restarts and is shared by the workers of the host.
+
+    Results are stored without the image name, a hit on the same bytes under
+    a different name returns the cached boxes with the new name.
+    """
+
+    def __init__(self, max_bytes: int, disk_path: Optional[str] = None) -> None:
+        self.max_bytes = max_bytes
+        self.disk_path = disk_path
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._disk_initialized = False
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0 or bool(self.disk_path)
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self._disk_initialized:
+            directory = os.path.dirname(self.disk_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with sqlite3.connect(self.disk_path) as connection:
+                connection.execute("PRAGMA journal_mode=WAL")
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS predictions "
+                    "(key TEXT PRIMARY KEY, value BLOB NOT NULL)")
+            self._disk_initialized = True
+        return sqlite3.connect(self.disk_path, timeout=30)
+
+    def _remember(self, key: str, value: bytes) -> None:
+        # caller holds the lock
+        if len(value) > self.max_bytes:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._size -= len(previous)
+        self._entries[key] = value
+        self._size += len(value)
+        while self._size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted)
+
+    def get(self, key: str, image_name: str) -> Optional[Prediction]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+
+        if value is None and self.disk_path:
+            connection = self._connect()
+            try:
+                row = connection.execute(
+                    "SELECT value FROM predictions WHERE key = ?",
+                    (key, )).fetchone()
+            finally:
+                connection.close()
+            if row is not None:
+                value = row[0]
+                with self._lock:
+                    self.hits += 1
+                    self.disk_hits += 1
+                    self._remember(key, value)
+
+        if value is None:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        try:
+            return Prediction.from_bytes(value, image_name)
+        except ValueError:
+            # unreadable entry, predicted again and overwritten
+            return None
+
+    def put(self, key: str, prediction: Prediction) -> None:
+        # the image name is given back by `get`
+        value = prediction.to_bytes()
+
+        with self._lock:
+            self._remember(key, value)
+
+        if self.disk_path:
+            connection = self._connect()
+            try:
+                with connection:
+                    connection.execute(
+                        "INSERT OR REPLACE INTO predictions (key, value) "
+                        "VALUES (?, ?)", (key, value))
+            finally:
+                connection.close()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "bytes": self._size,
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+
+prediction_cache = PredictionCache(max_bytes=config.CACHE_BYTES,
+                                   disk_path=config.CACHE_PATH or None)
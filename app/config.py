@@ -0,0 +1,111 @@
+import os
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.environ.get(name)
+    return int(value) if value not in (None, "") else default
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.environ.get(name)
+    return float(value) if value not in (None, "") else default
+
+
+def _env_str(name: str, default: str) -> str:
+    value = os.environ.get(name)
+    return value if value not in (None, "") else default
+
+
+# ONNX Runtime session options
+# 0 lets onnxruntime pick the number of threads itself
+ORT_INTRA_OP_THREADS = _env_int("REMX_ORT_INTRA_OP_THREADS", 0)
+ORT_INTER_OP_THREADS = _env_int("REMX_ORT_INTER_OP_THREADS", 0)
+# one of: disable, basic, extended, all
+ORT_GRAPH_OPTIMIZATION = _env_str("REMX_ORT_GRAPH_OPTIMIZATION", "all")
+ORT_PROVIDER = _env_str("REMX_ORT_PROVIDER", "CPUExecutionProvider")
+# Directory where the graphs optimized by onnxruntime are saved, so later
+# starts skip most of the optimization ("" = disabled)
+ORT_CACHE_DIR = _env_str("REMX_ORT_CACHE_DIR", "")
+
+# Load and warm up the model after the server started listening (1), /ready
+# reports when it is done, or before it accepts any request (0)
+BACKGROUND_LOAD = _env_int("REMX_BACKGROUND_LOAD", 1)
+
+# Model variant served by default: fp32 (the exported model), optimized (ORT
+# graph optimized offline) or int8 (quantized), see app/model/variants.py
+MODEL_PRECISION = _env_str("REMX_MODEL_PRECISION", "fp32")
+
+# Decode large JPEGs directly at 1/2, 1/4 or 1/8 resolution when that still
+# covers the model input (1 = on)
+REDUCED_DECODE = _env_int("REMX_REDUCED_DECODE", 1)
+
+# Number of images stacked into one session call for multi-image uploads
+BATCH_SIZE = _env_int("REMX_BATCH_SIZE", 8)
+# Images read and decoded ahead of inference, bounds memory of large archives
+PREFETCH_SIZE = _env_int("REMX_PREFETCH_SIZE", 16)
+
+# Prediction executor: concurrent jobs, extra jobs allowed to wait before
+# requests are rejected with 503, and per-request timeout in seconds (0 = none)
+MAX_CONCURRENCY = _env_int("REMX_MAX_CONCURRENCY", 2)
+MAX_QUEUE = _env_int("REMX_MAX_QUEUE", 8)
+REQUEST_TIMEOUT = _env_int("REMX_REQUEST_TIMEOUT", 300)
+
+# Worker processes for large archives (0 = disabled): archives with at least
+# PROCESS_MIN_IMAGES images are spread over the pool. Intra-op threads of each
+# worker session, 0 shares the cores evenly between the workers
+PROCESS_WORKERS = _env_int("REMX_PROCESS_WORKERS", 0)
+PROCESS_MIN_IMAGES = _env_int("REMX_PROCESS_MIN_IMAGES", 64)
+PROCESS_INTRA_OP_THREADS = _env_int("REMX_PROCESS_INTRA_OP_THREADS", 0)
+
+# Micro-batching of single image uploads (0 = disabled): the inferences of
+# concurrent requests are run together, up to MICRO_BATCH_SIZE images after
+# waiting at most MICRO_BATCH_WAIT_MS milliseconds for more to arrive
+MICRO_BATCH_SIZE = _env_int("REMX_MICRO_BATCH_SIZE", 0)
+MICRO_BATCH_WAIT_MS = _env_float("REMX_MICRO_BATCH_WAIT_MS", 5.0)
+
+# Asynchronous job queue: SQLite database and uploaded archives live here
+JOBS_DIR = _env_str("REMX_JOBS_DIR", "jobs")
+JOB_WORKERS = _env_int("REMX_JOB_WORKERS", 1)
+# Seconds without progress after which a running job is considered abandoned
+# by a dead worker and picked up again
+JOB_LEASE = _env_int("REMX_JOB_LEASE", 120)
+
+# Directory scans (/api/predict/scan): the directories on the server whose
+# images may be predicted in place, separated by os.pathsep ("" = disabled)
+SCAN_ROOTS = _env_str("REMX_SCAN_ROOTS", "")
+
+# Prediction cache: in-memory LRU size in bytes (0 disables it) and optional
+# SQLite file for a persistent tier
+CACHE_BYTES = _env_int("REMX_CACHE_BYTES", 64 * 1024 * 1024)
+CACHE_PATH = _env_str("REMX_CACHE_PATH", "")
+
+# Default thresholds, both can be set per request: minimum class score of a
+# box, and overlap (IoU) above which NMS merges two boxes
+CONFIDENCE_THRESHOLD = _env_float("REMX_CONFIDENCE_THRESHOLD", 0.5)
+IOU_THRESHOLD = _env_float("REMX_IOU_THRESHOLD", 0.6)
+
+# Near duplicate frames (?dedup=true): largest perceptual hash distance in
+# bits, out of 64, and number of recent distinct frames compared against
+DEDUP_THRESHOLD = _env_int("REMX_DEDUP_THRESHOLD", 4)
+DEDUP_WINDOW = _env_int("REMX_DEDUP_WINDOW", 8)
+
+# Non-maximum suppression: backend (cv2, matrix, greedy) and the number of
+# best scoring candidates considered (0 = all)
+NMS_BACKEND = _env_str("REMX_NMS_BACKEND", "cv2")
+NMS_TOP_K = _env_int("REMX_NMS_TOP_K", 3000)
+
+# Tiled inference (?tiled=true): tile size in pixels, overlap between
+# neighbouring tiles as a fraction of a tile, cap on the number of tiles per
+# image (larger tiles beyond it, 0 = the whole image only) and the grayscale
+# standard deviation below which a tile is skipped as featureless (0 = run
+# every tile)
+TILE_SIZE = _env_int("REMX_TILE_SIZE", 640)
+TILE_OVERLAP = _env_float("REMX_TILE_OVERLAP", 0.2)
+if not 0 <= TILE_OVERLAP < 1:
+    raise ValueError(f"REMX_TILE_OVERLAP must be in [0, 1), got {TILE_OVERLAP}")
+TILE_MAX = _env_int("REMX_TILE_MAX", 16)
+TILE_MIN_STD = _env_float("REMX_TILE_MIN_STD", 6.0)
+
+# Add a Server-Timing header with the time spent in each pipeline stage to
+# prediction responses (1 = on), for debugging from the browser dev tools
+SERVER_TIMING = _env_int("REMX_SERVER_TIMING", 0)
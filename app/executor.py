@@ -0,0 +1,179 @@
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Awaitable, Callable, Iterable, Optional
+
+from fastapi import HTTPException
+
+from app import config
+
+_DONE = object()
+
+
+class _Failure:
+
+    def __init__(self, error: BaseException) -> None:
+        self.error = error
+
+
+class PredictionExecutor:
+    """
+    Bounded thread pool for the CPU-bound prediction work, so the event loop
+    keeps serving other requests. onnxruntime and OpenCV release the GIL
+    while they compute.
+
+    At most `max_workers` jobs run at once and `max_queue` more may wait,
+    anything beyond that is rejected with 503 instead of piling up. A job
+    keeps its slot until its thread really finishes, even when the caller
+    already gave up on it after `timeout` seconds.
+    """
+
+    def __init__(self,
+                 max_workers: int,
+                 max_queue: int,
+                 timeout: Optional[float] = None) -> None:
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="remx-predict")
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def _acquire(self, admitted: bool = False) -> bool:
+        with self._lock:
+            if (not admitted
+                    and self._pending >= self.max_workers + self.max_queue):
+                return False
+            self._pending += 1
+            return True
+
+    def _release(self, _future=None) -> None:
+        with self._lock:
+            self._pending -= 1
+
+    async def run(self, fn: Callable, *args, **kwargs):
+        if not self._acquire():
+            raise HTTPException(status_code=503,
+                                detail="Prediction queue is full, retry later",
+                                headers={"Retry-After": "1"})
+        return await self._submit(fn, *args, **kwargs)
+
+    async def run_admitted(self, fn: Callable, *args, **kwargs):
+        """
+        `run` for a later step of a request that `run` already admitted,
+        never rejected: the work done in the earlier steps (e.g. its
+        inference) is not thrown away when the queue filled up meanwhile.
+        """
+        self._acquire(admitted=True)
+        return await self._submit(fn, *args, **kwargs)
+
+    async def wait(self, awaitable: Awaitable):
+        # The request timeout, for work done outside the pool
+        try:
+            return await asyncio.wait_for(awaitable, timeout=self.timeout)
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=504,
+                                detail="Prediction timed out")
+
+    async def _submit(self, fn: Callable, *args, **kwargs):
+        try:
+            # Carries the request context (e.g. its stage timings) over
+            future = self._executor.submit(contextvars.copy_context().run, fn,
+                                           *args, **kwargs)
+        except BaseException:
+            self._release()
+            raise
+        future.add_done_callback(self._release)
+
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future),
+                                          timeout=self.timeout)
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=504,
+                                detail="Prediction timed out")
+
+    def stream(self,
+               fn: Callable[..., Iterable],
+               *args,
+               maxsize: int = 16,
+               **kwargs) -> AsyncIterator:
+        """
+        Run the generator function `fn` on the pool and return an async
+        iterator over its items, for streaming responses. The worker stays at
+        most `maxsize` items ahead of the consumer and stops when the consumer
+        goes away (e.g. the client disconnects). `timeout` applies to the wait
+        for each item rather than to the whole stream.
+
+        The slot is taken eagerly so a full queue is reported with 503 before
+        the response starts.
+        """
+        if not self._acquire():
+            raise HTTPException(status_code=503,
+                                detail="Prediction queue is full, retry later",
+                                headers={"Retry-After": "1"})
+
+        loop = asyncio.get_running_loop()
+        items = asyncio.Queue()
+        space = threading.Semaphore(max(1, maxsize))
+        stop = threading.Event()
+
+        def put(item) -> bool:
+            while not stop.is_set():
+                if space.acquire(timeout=0.1):
+                    loop.call_soon_threadsafe(items.put_nowait, item)
+                    return True
+            return False
+
+        def produce():
+            try:
+                for item in fn(*args, **kwargs):
+                    if not put(item):
+                        return
+            except BaseException as error:
+                put(_Failure(error))
+            else:
+                put(_DONE)
+
+        try:
+            future = self._executor.submit(contextvars.copy_context().run,
+                                           produce)
+        except BaseException:
+            self._release()
+            raise
+        future.add_done_callback(self._release)
+
+        async def consume():
+            try:
+                while True:
+                    try:
+                        item = await asyncio.wait_for(items.get(),
+                                                      timeout=self.timeout)
+                    except asyncio.TimeoutError:
+                        raise HTTPException(status_code=504,
+                                            detail="Prediction timed out")
+                    space.release()
+                    if item is _DONE:
+                        return
+                    if isinstance(item, _Failure):
+                        raise item.error
+                    yield item
+            finally:
+                stop.set()
+
+        return consume()
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+
+prediction_executor = PredictionExecutor(
+    max_workers=config.MAX_CONCURRENCY,
+    max_queue=config.MAX_QUEUE,
+    timeout=config.REQUEST_TIMEOUT or None,
+)
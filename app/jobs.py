@@ -0,0 +1,273 @@
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+import zipfile
+from typing import BinaryIO, Dict, List, Optional
+
+from app import config
+from app.prediction_api import format_predictions, zip_image_infos, zip_images
+from app.results import dumps
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    filename TEXT NOT NULL,
+    archive_path TEXT NOT NULL,
+    status TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    done INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    started_done INTEGER NOT NULL DEFAULT 0,
+    heartbeat_at REAL,
+    finished_at REAL
+);
+CREATE TABLE IF NOT EXISTS results (
+    job_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    image TEXT,
+    result TEXT NOT NULL,
+    PRIMARY KEY (job_id, idx)
+);
+"""
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+class JobStore:
+    """
+    SQLite backed job queue and result store. Archives are kept next to the
+    database until their job is finished.
+    """
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        self.path = os.path.join(directory, "jobs.sqlite3")
+        self._initialized = False
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self._initialized:
+            with self._lock:
+                if not self._initialized:
+                    os.makedirs(self.directory, exist_ok=True)
+                    with sqlite3.connect(self.path) as connection:
+                        connection.execute("PRAGMA journal_mode=WAL")
+                        connection.executescript(SCHEMA)
+                    self._initialized = True
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.row_factory = sqlite3.Row
+        return connection
+
+    def create(self, archive: BinaryIO, filename: str) -> Dict:
+        job_id = uuid.uuid4().hex
+        self._connect().close()
+        archive_path = os.path.join(self.directory, f"{job_id}.zip")
+        with open(archive_path, "wb") as f:
+            shutil.copyfileobj(archive, f)
+
+        try:
+            with zipfile.ZipFile(archive_path) as zip_file:
+                total = len(zip_image_infos(zip_file))
+        except zipfile.BadZipFile:
+            os.remove(archive_path)
+            raise
+
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT INTO jobs (id, filename, archive_path, status, total, "
+                "created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, filename, archive_path, QUEUED, total, time.time()))
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._connect() as connection:
+            row = connection.execute("SELECT * FROM jobs WHERE id = ?",
+                                     (job_id, )).fetchone()
+        return dict(row) if row else None
+
+    def done_indices(self, job_id: str) -> set:
+        with self._connect() as connection:
+            rows = connection.execute(
+                "SELECT idx FROM results WHERE job_id = ?", (job_id, ))
+            return {row["idx"] for row in rows}
+
+    def claim(self, lease: float) -> Optional[Dict]:
+        """
+        Atomically take the oldest queued job, or a running one whose worker
+        stopped sending heartbeats for `lease` seconds (e.g. it was killed).
+        Safe to call from several worker processes sharing the database.
+        """
+        now = time.time()
+        connection = self._connect()
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            row = connection.execute(
+                "SELECT id FROM jobs WHERE status = ? OR "
+                "(status = ? AND heartbeat_at < ?) ORDER BY created_at LIMIT 1",
+                (QUEUED, RUNNING, now - lease)).fetchone()
+            if row is not None:
+                connection.execute(
+                    "UPDATE jobs SET status = ?, started_at = ?, "
+                    "started_done = done, heartbeat_at = ? WHERE id = ?",
+                    (RUNNING, now, now, row["id"]))
+            connection.commit()
+        finally:
+            connection.close()
+        return self.get(row["id"]) if row is not None else None
+
+    def release(self, job_id: str) -> None:
+        # Hand an unfinished job back to the queue, e.g. on shutdown
+        with self._connect() as connection:
+            connection.execute(
+                "UPDATE jobs SET status = ? WHERE id = ? AND status = ?",
+                (QUEUED, job_id, RUNNING))
+
+    def add_results(self, job_id: str, results: List) -> None:
+        # results: [(index, image name, prediction)]
+        with self._connect() as connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO results (job_id, idx, image, result) "
+                "VALUES (?, ?, ?, ?)",
+                [(job_id, index, image, dumps(result).decode())
+                 for index, image, result in results])
+            connection.execute(
+                "UPDATE jobs SET done = (SELECT COUNT(*) FROM results "
+                "WHERE job_id = ?), heartbeat_at = ? WHERE id = ?",
+                (job_id, time.time(), job_id))
+
+    def finish(self, job_id: str, error: Optional[str] = None) -> None:
+        with self._connect() as connection:
+            connection.execute(
+                "UPDATE jobs SET status = ?, error = ?, finished_at = ? "
+                "WHERE id = ?",
+                (FAILED if error else DONE, error, time.time(), job_id))
+
+    def results(self, job_id: str, offset: int, limit: int) -> List[Dict]:
+        with self._connect() as connection:
+            rows = connection.execute(
+                "SELECT idx, result FROM results WHERE job_id = ? "
+                "ORDER BY idx LIMIT ? OFFSET ?", (job_id, limit, offset))
+            return [{"index": row["idx"], **json.loads(row["result"])}
+                    for row in rows]
+
+
+def job_progress(job: Dict) -> Dict:
+    images_per_second = 0.0
+    if job["started_at"]:
+        elapsed = (job["finished_at"] or time.time()) - job["started_at"]
+        if elapsed > 0:
+            images_per_second = (job["done"] - job["started_done"]) / elapsed
+
+    return {
+        "id": job["id"],
+        "filename": job["filename"],
+        "status": job["status"],
+        "done": job["done"],
+        "total": job["total"],
+        "images_per_second": round(images_per_second, 3),
+        "error": job["error"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+    }
+
+
+class JobManager:
+    """
+    Drains the job queue with a pool of worker threads running the regular
+    batched prediction pipeline. Results are committed batch by batch, so a
+    job interrupted by a restart resumes where it stopped. Jobs are claimed
+    through the database, so several server processes can share one store.
+    """
+
+    def __init__(self,
+                 store: JobStore,
+                 workers: int = 1,
+                 lease: float = 60.0) -> None:
+        self.store = store
+        self.workers = workers
+        self.lease = lease
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def start(self) -> None:
+        self._stop.clear()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work,
+                                      name=f"remx-job-{i}",
+                                      daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self) -> None:
+        # Running jobs are handed back to the queue and resume on next start
+        self._stop.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def submit(self, archive: BinaryIO, filename: str) -> Dict:
+        job = self.store.create(archive, filename)
+        self._wakeup.set()
+        return job
+
+    def _work(self) -> None:
+        while not self._stop.is_set():
+            job = self.store.claim(self.lease)
+            if job is None:
+                self._wakeup.wait(timeout=1.0)
+                self._wakeup.clear()
+                continue
+            try:
+                self.run(job)
+            except Exception as error:
+                logger.exception("Job %s failed", job["id"])
+                self.store.finish(job["id"], error=str(error))
+
+    def run(self, job: Dict) -> None:
+        job_id = job["id"]
+        done = self.store.done_indices(job_id)
+        flush_size = config.BATCH_SIZE
+
+        with zipfile.ZipFile(job["archive_path"]) as zip_file:
+            pending = [(index, zip_info)
+                       for index, zip_info in enumerate(zip_image_infos(zip_file))
+                       if index not in done]
+            predictions = format_predictions(
+                zip_images(zip_file, [zip_info for _, zip_info in pending]),
+                len(pending))
+
+            results = []
+            for (index, zip_info), prediction in zip(pending, predictions):
+                results.append((index, zip_info.filename, prediction))
+                if len(results) >= flush_size:
+                    self.store.add_results(job_id, results)
+                    results = []
+                if self._stop.is_set():
+                    predictions.close()
+                    break
+            if results:
+                self.store.add_results(job_id, results)
+
+        if self._stop.is_set():
+            self.store.release(job_id)
+            return
+
+        self.store.finish(job_id)
+        os.remove(job["archive_path"])
+
+
+job_manager = JobManager(JobStore(config.JOBS_DIR),
+                         workers=config.JOB_WORKERS,
+                         lease=config.JOB_LEASE)
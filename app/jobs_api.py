@@ -0,0 +1,45 @@
+from fastapi import APIRouter, UploadFile, File, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+import zipfile
+
+from app.jobs import job_manager, job_progress
+
+jobs_router = APIRouter()
+
+def get_job(job_id: str):
+    job = job_manager.store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    return job
+
+@jobs_router.post("/jobs", status_code=202, summary="Queue a ZIP archive for background prediction")
+async def create_job(file: UploadFile = File(...)):
+    if not file.filename.lower().endswith(".zip"):
+        raise HTTPException(status_code=400, detail=f"Unsupported file: {file.filename}")
+
+    try:
+        job = await run_in_threadpool(job_manager.submit, file.file, file.filename)
+    except zipfile.BadZipFile:
+        raise HTTPException(status_code=400, detail=f"Not a valid ZIP archive: {file.filename}")
+
+    return job_progress(job)
+
+@jobs_router.get("/jobs/{job_id}", summary="Job progress")
+async def read_job(job_id: str):
+    job = await run_in_threadpool(get_job, job_id)
+    return job_progress(job)
+
+@jobs_router.get("/jobs/{job_id}/results", summary="Page through the results of a job")
+async def read_job_results(job_id: str,
+                           offset: int = Query(0, ge=0),
+                           limit: int = Query(100, ge=1, le=1000)):
+    job = await run_in_threadpool(get_job, job_id)
+    results = await run_in_threadpool(job_manager.store.results, job_id, offset, limit)
+    return {
+        "id": job_id,
+        "status": job["status"],
+        "total": job["total"],
+        "offset": offset,
+        "limit": limit,
+        "results": results,
+    }
@@ -1,14 +1,64 @@
+import logging
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, Request
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.openapi.docs import get_redoc_html, get_swagger_ui_html
 
-from app.model.model import __version__ as model_version
+from app import config
+from app.jobs import job_manager
+from app.jobs_api import jobs_router
+from app.metrics import collect_request_timings
+from app.metrics_api import metrics_router
+from app.model.model import __version__ as model_version, warm_up
+from app.model.batcher import shutdown_micro_batchers
+from app.model.parallel import shutdown_parallel_predictor
 from app.prediction_api import prediction_router 
+from app.scan_api import scan_router
+from app.startup import startup
+from app.startup_api import startup_router
+
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Build and warm up the ONNX session and the image pre-processing, /ready
+    # turns green when it is done. Requests arriving before wait for it.
+    if config.BACKGROUND_LOAD:
+        startup.load_in_background(warm_up)
+    else:
+        startup.load(warm_up)
+    # Resumes jobs interrupted by the previous shutdown
+    job_manager.start()
+    yield
+    job_manager.stop()
+    shutdown_parallel_predictor()
+    await shutdown_micro_batchers()
+
 
-app = FastAPI(title="Remx REST API", version=model_version)
+app = FastAPI(title="Remx REST API", version=model_version, lifespan=lifespan)
 
 app.include_router(prediction_router, prefix="/api", tags=["Prediction"])
+app.include_router(jobs_router, prefix="/api", tags=["Jobs"])
+app.include_router(scan_router, prefix="/api", tags=["Prediction"])
+app.include_router(metrics_router)
+app.include_router(startup_router)
+
+
+async def server_timing(request: Request, call_next):
+    with collect_request_timings() as timings:
+        response = await call_next(request)
+    # Streaming bodies are still running here, only work done before the
+    # response started is reported
+    if timings.seconds:
+        response.headers["Server-Timing"] = timings.server_timing()
+    return response
+
+# Only when enabled, the middleware wraps every request otherwise
+if config.SERVER_TIMING:
+    app.middleware("http")(server_timing)
 
 # Static & template setup
 app.mount("/static", StaticFiles(directory="static"), name="static")
@@ -37,3 +87,5 @@ def custom_redoc_ui():
         title="Remx Redoc",
         redoc_favicon_url="/static/images/favicon.png"
     )
+
+startup.mark("imported")
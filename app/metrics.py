@@ -0,0 +1,233 @@
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Seconds, from sub-millisecond NMS up to minutes long archive uploads
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                   0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace(
+        "\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{name}="{value}"'
+                          for (name, _), value in zip(labels, escaped)) + "}"
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+
+    def __init__(self, name: str, help: str) -> None:
+        self.name = name
+        self.help = help
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, value: float = 1, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(sorted(labels.items())), 0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}",
+                 f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in self._values.items():
+                lines.append(f"{self.name}{_labels(key)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    """
+    Cumulative histogram in the Prometheus layout: fixed upper bounds, a sum
+    and a count per label set. An observation is a bisect and three
+    additions under a lock.
+    """
+
+    def __init__(self,
+                 name: str,
+                 help: str,
+                 buckets: Iterable[float] = DEFAULT_BUCKETS) -> None:
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        # label set -> [per bucket counts (+Inf last), sum, count]
+        self._values: Dict[Tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1),
+                                             0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def count(self, **labels) -> int:
+        entry = self._values.get(tuple(sorted(labels.items())))
+        return entry[2] if entry else 0
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}",
+                 f"# TYPE {self.name} histogram"]
+        with self._lock:
+            values = [(key, list(counts), total, count)
+                      for key, (counts, total, count) in self._values.items()]
+        for key, counts, total, count in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"), ),
+                                           counts):
+                cumulative += bucket_count
+                bucket_labels = _labels(key + (("le", _number(bound)), ))
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(key)} {count}")
+        return lines
+
+
+class Gauge:
+    """
+    Gauge read when the metrics are scraped: `collect` returns
+    `[(labels, value)]`, so nothing is tracked on the hot path.
+    """
+    type = "gauge"
+
+    def __init__(self, name: str, help: str,
+                 collect: Callable[[], Iterable[Tuple[Dict, float]]]) -> None:
+        self.name = name
+        self.help = help
+        self.collect = collect
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}",
+                 f"# TYPE {self.name} {self.type}"]
+        for labels, value in self.collect():
+            lines.append(f"{self.name}{_labels(tuple(sorted(labels.items())))} "
+                         f"{_number(value)}")
+        return lines
+
+
+class CollectedCounter(Gauge):
+    # Counter kept elsewhere (e.g. the cache statistics), read when scraped
+    type = "counter"
+
+
+class MetricsRegistry:
+
+    def __init__(self) -> None:
+        self._metrics: Dict[str, object] = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self.register(Counter(name, help))
+
+    def histogram(self,
+                  name: str,
+                  help: str,
+                  buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, buckets))
+
+    def gauge(self, name: str, help: str, collect: Callable) -> Gauge:
+        return self.register(Gauge(name, help, collect))
+
+    def collected_counter(self, name: str, help: str,
+                          collect: Callable) -> CollectedCounter:
+        return self.register(CollectedCounter(name, help, collect))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class StageTimings:
+    # Per-request totals by stage, filled from the request's worker threads
+
+    def __init__(self) -> None:
+        self.seconds: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+
+    def server_timing(self) -> str:
+        with self._lock:
+            return ", ".join(f"{stage};dur={seconds * 1000:.2f}"
+                             for stage, seconds in self.seconds.items())
+
+
+metrics = MetricsRegistry()
+
+stage_seconds = metrics.histogram(
+    "remx_stage_seconds",
+    "Time spent in each stage of the prediction pipeline")
+images_total = metrics.counter(
+    "remx_images_total",
+    "Images handled, by result (predicted, cached, duplicate, unsupported: "
+    "could not be decoded)")
+candidates_total = metrics.counter(
+    "remx_candidates_total",
+    "Candidate boxes above the confidence threshold, before NMS")
+boxes_total = metrics.counter("remx_boxes_total", "Boxes kept after NMS")
+microbatch_size = metrics.histogram(
+    "remx_microbatch_size",
+    "Images per inference coalesced from concurrent single image requests",
+    buckets=(1, 2, 4, 8, 16, 32, 64))
+
+_request_timings: contextvars.ContextVar[Optional[StageTimings]] = (
+    contextvars.ContextVar("remx_request_timings", default=None))
+
+
+@contextmanager
+def stage(name: str):
+    """
+    Time the enclosed block into `remx_stage_seconds{stage=name}`, and into
+    the current request's `Server-Timing` when it is being collected.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - start)
+
+
+def record_stage(name: str, seconds: float) -> None:
+    # A stage timed elsewhere, e.g. in a worker process, as `stage` does
+    stage_seconds.observe(seconds, stage=name)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.add(name, seconds)
+
+
+@contextmanager
+def collect_request_timings():
+    # Stages timed in this context, including threads started with a copy of
+    # it, are added to the yielded StageTimings
+    timings = StageTimings()
+    token = _request_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _request_timings.reset(token)
@@ -0,0 +1,73 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from app.cache import prediction_cache
+from app.executor import prediction_executor
+from app.metrics import metrics
+from app.model.registry import registry
+from app.startup import startup
+
+metrics_router = APIRouter()
+
+
+def cache_lookups():
+    stats = prediction_cache.stats()
+    return [({"result": "hit"}, stats["hits"] - stats["disk_hits"]),
+            ({"result": "disk_hit"}, stats["disk_hits"]),
+            ({"result": "miss"}, stats["misses"])]
+
+
+def executor_slots():
+    return [({"state": "pending"}, prediction_executor.pending),
+            ({"state": "workers"}, prediction_executor.max_workers),
+            ({"state": "queue"}, prediction_executor.max_queue)]
+
+
+def model_info():
+    info = []
+    for model in registry.loaded().values():
+        session = model["session"]
+        options = session.get_session_options()
+        info.append(({
+            "path": model["model_path"],
+            "version": model["version"],
+            "providers": ",".join(session.get_providers()),
+            "input_shape": str(model["input_shape"]),
+            "intra_op_threads": options.intra_op_num_threads,
+            "inter_op_threads": options.inter_op_num_threads,
+            "graph_optimization": options.graph_optimization_level.name,
+        }, 1))
+    return info
+
+
+def model_seconds(name):
+    return lambda: [({"path": model["model_path"],
+                      "version": model["version"]}, model[name])
+                    for model in registry.loaded().values()]
+
+
+metrics.collected_counter("remx_cache_lookups_total",
+                          "Prediction cache lookups by result", cache_lookups)
+metrics.gauge("remx_cache_entries", "Predictions held in memory",
+              lambda: [({}, prediction_cache.stats()["entries"])])
+metrics.gauge("remx_cache_bytes", "Serialized size of the in-memory cache",
+              lambda: [({}, prediction_cache.stats()["bytes"])])
+metrics.gauge("remx_executor_slots",
+              "Prediction jobs running or waiting, and the executor limits",
+              executor_slots)
+metrics.gauge("remx_model_info", "Loaded ONNX Runtime sessions", model_info)
+metrics.gauge("remx_model_load_seconds", "Time to build the session",
+              model_seconds("load_seconds"))
+metrics.gauge("remx_model_warmup_seconds", "Time of the warm-up inference",
+              model_seconds("warmup_seconds"))
+metrics.gauge("remx_startup_seconds",
+              "Seconds from the first import of the app to each startup phase",
+              lambda: [({"phase": phase}, seconds)
+                       for phase, seconds in startup.timings.items()])
+
+
+@metrics_router.get("/metrics", include_in_schema=False)
+def read_metrics():
+    # Prometheus text exposition format
+    return PlainTextResponse(metrics.render(),
+                             media_type="text/plain; version=0.0.4")
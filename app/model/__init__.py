@@ -1,3 +1,9 @@
-from app.model.model import predict_images, __version__
+from app.model.model import (predict_images, predict_images_batch,
+                             load_model, __version__)
+from app.model.batcher import predict_image_batched
+from app.model.parallel import predict_images_parallel
+from app.model.tiling import predict_images_tiled
 
-__all__ = "predict_images", "__version__"
+__all__ = ("predict_images", "predict_images_batch", "predict_images_parallel",
+           "predict_images_tiled",
+           "predict_image_batched", "load_model", "__version__")
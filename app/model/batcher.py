@@ -0,0 +1,205 @@
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app import config
+from app.cache import PredictionCache, prediction_cache
+from app.executor import PredictionExecutor
+from app.metrics import images_total, microbatch_size, stage
+from app.model.model import (MODEL, cache_key, decode_failed, load_model,
+                             postprocess_prediction, run_model, thresholds)
+from app.utils.decode import DecodeError
+from app.utils.images_predict_fn import (batch_tensor_pool,
+                                         final_image_pre_process,
+                                         model_input_size)
+
+
+class MicroBatcher:
+    """
+    Coalesces the single image inferences of concurrent requests into
+    batched session calls.
+
+    `infer` queues a `(1, 3, H, W)` tensor and waits for its output. A task
+    on the event loop takes the first queued tensor, gathers more for up to
+    `max_wait` seconds or until `max_batch` are queued, and runs them
+    through the model as one batch on its own thread. Tensors queued while
+    a batch runs make up the next one.
+    """
+
+    def __init__(self, model_path: str, max_batch: int,
+                 max_wait: float) -> None:
+        self.model_path = model_path
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        # batches run one at a time, the session uses all the cores
+        self._executor = ThreadPoolExecutor(max_workers=1,
+                                            thread_name_prefix="remx-batch")
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def _start(self) -> None:
+        loop = asyncio.get_running_loop()
+        if (self._loop is loop and self._task is not None
+                and not self._task.done()):
+            return
+        self._loop = loop
+        self._queue = asyncio.Queue()
+        # not in the context of the request that happened to start it, its
+        # stage timings would collect every batch
+        self._task = contextvars.Context().run(loop.create_task,
+                                               self._gather())
+
+    async def infer(self, input_tensor: np.ndarray) -> np.ndarray:
+        self._start()
+        future = self._loop.create_future()
+        await self._queue.put((input_tensor, future))
+        return await future
+
+    async def _gather(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(
+                        self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # callers that gave up (timeout, disconnect) are left out
+            batch = [(tensor, future) for tensor, future in batch
+                     if not future.done()]
+            if not batch:
+                continue
+            microbatch_size.observe(len(batch))
+            try:
+                outputs = await loop.run_in_executor(
+                    self._executor, self._run, [tensor for tensor, _ in batch])
+            except Exception as error:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(error)
+                continue
+            for row, (_, future) in enumerate(batch):
+                if not future.done():
+                    future.set_result(outputs[row:row + 1])
+
+    def _run(self, tensors: List[np.ndarray]) -> np.ndarray:
+        model = load_model(self.model_path)
+        batch_tensor = batch_tensor_pool.acquire(
+            (len(tensors), ) + tensors[0].shape[1:])
+        try:
+            for row, tensor in enumerate(tensors):
+                batch_tensor[row] = tensor[0]
+            return run_model(model, batch_tensor)
+        finally:
+            batch_tensor_pool.release(batch_tensor)
+
+    async def shutdown(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, RuntimeError):
+                # RuntimeError: the task belongs to a loop that is closed
+                pass
+            self._task = None
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+
+# model path -> its batcher
+_batchers: Dict[str, MicroBatcher] = {}
+
+
+def get_micro_batcher(MODEL=MODEL) -> MicroBatcher:
+    # Started on first use, one per model variant, on the event loop thread
+    batcher = _batchers.get(MODEL)
+    if batcher is None:
+        batcher = _batchers[MODEL] = MicroBatcher(
+            MODEL, config.MICRO_BATCH_SIZE,
+            config.MICRO_BATCH_WAIT_MS / 1000)
+    return batcher
+
+
+async def shutdown_micro_batchers() -> None:
+    while _batchers:
+        await _batchers.popitem()[1].shutdown()
+
+
+def _prepare(content: bytes, image_name: str, confidence: float,
+             iou_threshold: float, MODEL,
+             cache: Optional[PredictionCache]) -> Tuple[Optional[Dict], Tuple]:
+    # (prediction, None) when there is nothing to infer, otherwise
+    # (None, (cache key, pre_process_image))
+    key = None
+    if cache is not None and cache.enabled:
+        with stage("cache"):
+            key = cache_key(content, confidence, iou_threshold, MODEL)
+            cached = cache.get(key, image_name)
+        if cached is not None:
+            images_total.inc(result="cached")
+            return cached, None
+
+    input_shape = load_model(MODEL)["input_shape"]
+    input_size = model_input_size(input_shape)
+    # its own tensor, it waits in the queue after this thread moved on
+    out = np.empty((1, 3, input_size.height, input_size.width),
+                   dtype=np.float32)
+    try:
+        pre_process_image = final_image_pre_process(content, input_shape, out)
+    except DecodeError as error:
+        return decode_failed(image_name, error), None
+    return None, (key, pre_process_image)
+
+
+def _finish(outputs: np.ndarray, pre_process_image: Dict, image_name: str,
+            confidence: float, iou_threshold: float, key: Optional[str],
+            cache: Optional[PredictionCache]):
+    prediction = postprocess_prediction(outputs, pre_process_image,
+                                        image_name, confidence, iou_threshold)
+    if key is not None:
+        cache.put(key, prediction)
+    images_total.inc(result="predicted")
+    return prediction
+
+
+async def predict_image_batched(
+        content: bytes,
+        image_name: str,
+        executor: PredictionExecutor,
+        confidence: Optional[float] = None,
+        iou_threshold: Optional[float] = None,
+        MODEL=MODEL,
+        cache: Optional[PredictionCache] = prediction_cache):
+    """
+    `predict_images` for the event loop, with the inference coalesced with
+    that of concurrent requests by the `MicroBatcher` of the model. The
+    CPU-bound decode and post-processing run on `executor`, which admits
+    the request (or rejects it with 503) once, before the decode; the wait
+    for the batch is bound by its timeout.
+    """
+    confidence, iou_threshold = thresholds(confidence, iou_threshold)
+    prediction, pending = await executor.run(_prepare, content, image_name,
+                                             confidence, iou_threshold, MODEL,
+                                             cache)
+    if pending is None:
+        return prediction
+
+    key, pre_process_image = pending
+    with stage("microbatch"):
+        outputs = await executor.wait(get_micro_batcher(MODEL).infer(
+            pre_process_image["input_tensor"]))
+    return await executor.run_admitted(_finish, outputs, pre_process_image,
+                                       image_name, confidence, iou_threshold,
+                                       key, cache)
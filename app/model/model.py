@@ -1,53 +1,150 @@
+import time
+
 import numpy as np
 from fastapi import  UploadFile
 
 from pathlib import Path
-from typing import Dict
+from typing import Dict, Iterable, Iterator, Optional, Tuple
 
+from app import config
+from app.cache import PredictionCache, prediction_cache, prediction_key
+from app.metrics import boxes_total, candidates_total, images_total, stage
+from app.results import Prediction
+from app.utils.decode import DecodeError
 from app.utils.images_predict_fn import (map_lb_original_img, bboxs_filter,
                                          nms, compute_iou, xywh2xyxy,
                                          model_ort_session,
                                          final_image_pre_process,
-                                         letterboxed_result)
+                                         letterboxed_result, model_input_size,
+                                         decode_letterbox, fill_input_tensor,
+                                         batch_tensor_pool)
+from app.utils.nms import non_max_suppression
+from app.utils.pipeline import prefetch
+from app.model.registry import registry
 
 __version__ = "1.0.0"
 
 BASE_DIR = Path(__file__).resolve(strict=True).parent
-MODEL = f"{BASE_DIR}/remx_model_{__version__}.onnx"
+# Precision variants of the model, file name suffix of each
+PRECISIONS = {"fp32": "", "optimized": ".opt", "int8": ".int8"}
+
+
+def model_path(precision: str = "fp32") -> str:
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown model precision: {precision!r}, "
+                         f"expected one of {sorted(PRECISIONS)}")
+    return f"{BASE_DIR}/remx_model_{__version__}{PRECISIONS[precision]}.onnx"
+
+
+def available_precisions() -> Dict[str, str]:
+    # precision -> model path, for the variants present on disk
+    return {precision: model_path(precision)
+            for precision in PRECISIONS
+            if Path(model_path(precision)).exists()}
+
+
+MODEL = model_path(config.MODEL_PRECISION)
 # MODEL=r"C:\Users\97597\Downloads\remx_model_1.0.0.onnx"
 
 
-def predict_images(content: UploadFile,
-                   image_name: str,
-                   confidence: float = 0.5,
-                   MODEL=MODEL) -> Dict:
+def load_model(MODEL=MODEL) -> Dict:
+    # One warmed-up session per (model path, version), shared by all requests
+    return registry.get(MODEL, __version__)
 
-    if image_name.endswith(".jpg") or image_name.endswith(".png"):
 
-        model = model_ort_session(MODEL)
-        pre_process_image = final_image_pre_process(content,
-                                                    model["input_shape"])
+def warm_up(MODEL=MODEL) -> Dict:
+    """
+    `load_model`, then one pre-processing pass on a blank JPEG. OpenCV is
+    imported lazily, the first request after the worker reports ready
+    would pay for importing and initializing it otherwise.
+    """
+    model = load_model(MODEL)
+    start = time.perf_counter()
+    import cv2
+
+    content = cv2.imencode(".jpg", np.zeros((64, 64, 3), np.uint8))[1]
+    final_image_pre_process(content.tobytes(), model["input_shape"])
+    model["warmup_seconds"] += time.perf_counter() - start
+    return model
 
-        outputs = model["session"].run(
+
+def decode_failed(image_name: str, error: DecodeError) -> Dict:
+    # Error record of an image that cannot be decoded, in place of its
+    # prediction: the other images of a batch are not affected
+    images_total.inc(result="unsupported")
+    return {"image": image_name, "error": str(error)}
+
+
+def run_model(model: Dict, input_tensor: np.ndarray) -> np.ndarray:
+    """
+    Run a `(N, 3, H, W)` batch through the session and return the
+    `(N, 4+C, anchors)` output. Models exported with a fixed batch axis are
+    fed in chunks of that size, the ragged last chunk is zero padded.
+    """
+    with stage("inference"):
+        return _run_model(model, input_tensor)
+
+
+def _run_model(model: Dict, input_tensor: np.ndarray) -> np.ndarray:
+    batch_axis = model["input_shape"][0]
+    size = len(input_tensor)
+
+    if not isinstance(batch_axis, int) or batch_axis <= 0 or batch_axis == size:
+        return model["session"].run(
             model["output_names"],
-            {model["input_names"][0]: pre_process_image["input_tensor"]},
+            {model["input_names"][0]: input_tensor},
         )[0]
 
+    outputs = []
+    for start in range(0, size, batch_axis):
+        chunk = input_tensor[start:start + batch_axis]
+        if len(chunk) < batch_axis:
+            padding = np.zeros((batch_axis - len(chunk), ) + chunk.shape[1:],
+                               dtype=chunk.dtype)
+            chunk = np.concatenate([chunk, padding])
+        outputs.append(model["session"].run(
+            model["output_names"],
+            {model["input_names"][0]: chunk},
+        )[0])
+    return np.concatenate(outputs)[:size]
+
+
+def thresholds(confidence: Optional[float] = None,
+               iou_threshold: Optional[float] = None) -> Tuple[float, float]:
+    # (confidence, NMS IoU) thresholds, the configured ones when not given
+    return (config.CONFIDENCE_THRESHOLD if confidence is None else confidence,
+            config.IOU_THRESHOLD if iou_threshold is None else iou_threshold)
+
+
+def postprocess_prediction(outputs: np.ndarray,
+                           pre_process_image: Dict,
+                           image_name: str,
+                           confidence: float = 0.5,
+                           iou_threshold: float = 0.6) -> Prediction:
+    # outputs: (1, 4+C, anchors) model output of a single image
+    with stage("filter"):
         bboxs_outputs = bboxs_filter(
             outputs,
             pre_process_image["input_width"],
             pre_process_image["input_height"],
             pre_process_image["image_width"],
             pre_process_image["image_height"],
+            conf_threshold=confidence,
+            # NMS only ever looks at the best candidates, drop the rest early
+            top_k=config.NMS_TOP_K,
         )
 
-        # Apply non-maxima suppression to suppress weak, overlapping bounding boxes
-        indices = nms(
-            bboxs_outputs["boxes"],
+    # Apply non-maxima suppression to suppress weak, overlapping bounding boxes
+    with stage("nms"):
+        indices = non_max_suppression(
+            xywh2xyxy(bboxs_outputs["boxes"]),
             bboxs_outputs["scores"],
-            iou_threshold=confidence,  # Threshold
+            iou_threshold=iou_threshold,
         )
+    candidates_total.inc(len(bboxs_outputs["scores"]))
+    boxes_total.inc(len(indices))
 
+    with stage("postprocess"):
         letterboxed_output = letterboxed_result(
             boxes=bboxs_outputs["boxes"],
             indices=indices,
@@ -56,16 +153,162 @@ def predict_images(content: UploadFile,
         )
 
         inverse_coordinate = map_lb_original_img(
-            content, letterboxed_output["letterboxed_boxes"])
-
-        return {
-            "image":
-            image_name,
-            "coordinates":
-            inverse_coordinate,
-            # "labels": label,
-            "max_confidence_coordinate":
-            inverse_coordinate[letterboxed_output["max_score_index"]]
-            if letterboxed_output["scores"] else
-            (-1, -1, -1, -1),  # Negative for does exist
-        }
+            pre_process_image, letterboxed_output["letterboxed_boxes"])
+
+    # Arrays all the way, JSON-ready tuples are only built at the response
+    # boundary (see `Prediction`)
+    return Prediction(image_name, inverse_coordinate,
+                      letterboxed_output["scores"],
+                      letterboxed_output["labels"])
+
+
+def cache_key(content: bytes,
+              confidence: float,
+              iou_threshold: float,
+              MODEL=MODEL) -> str:
+    # and every setting that changes the boxes, a persistent cache must not
+    # serve results computed under other settings
+    return prediction_key(content, f"{MODEL}@{__version__}",
+                          confidence=confidence,
+                          iou=iou_threshold,
+                          reduced_decode=config.REDUCED_DECODE,
+                          nms=config.NMS_BACKEND,
+                          nms_top_k=config.NMS_TOP_K)
+
+
+def predict_images(content: UploadFile,
+                   image_name: str,
+                   confidence: Optional[float] = None,
+                   iou_threshold: Optional[float] = None,
+                   MODEL=MODEL,
+                   cache: Optional[PredictionCache] = prediction_cache) -> Dict:
+    """
+    Predict one image. `confidence` is the minimum class score of a box and
+    `iou_threshold` the overlap above which NMS merges two boxes, both
+    default to the configured values. The format is detected from the
+    content; an image that cannot be decoded gets an `{"image", "error"}`
+    record.
+    """
+    confidence, iou_threshold = thresholds(confidence, iou_threshold)
+
+    if cache is not None and cache.enabled:
+        with stage("cache"):
+            key = cache_key(content, confidence, iou_threshold, MODEL)
+            cached = cache.get(key, image_name)
+        if cached is not None:
+            images_total.inc(result="cached")
+            return cached
+
+    model = load_model(MODEL)
+    try:
+        pre_process_image = final_image_pre_process(content,
+                                                    model["input_shape"])
+    except DecodeError as error:
+        return decode_failed(image_name, error)
+
+    outputs = run_model(model, pre_process_image["input_tensor"])
+
+    prediction = postprocess_prediction(outputs, pre_process_image,
+                                        image_name, confidence,
+                                        iou_threshold)
+    if cache is not None and cache.enabled:
+        cache.put(key, prediction)
+    images_total.inc(result="predicted")
+    return prediction
+
+
+def predict_images_batch(images: Iterable[Tuple[bytes, str]],
+                         confidence: Optional[float] = None,
+                         iou_threshold: Optional[float] = None,
+                         batch_size: Optional[int] = None,
+                         prefetch_size: Optional[int] = None,
+                         MODEL=MODEL,
+                         cache: Optional[PredictionCache] = prediction_cache
+                         ) -> Iterator[Dict]:
+    """
+    Batched counterpart of `predict_images`: `images` is an iterable of
+    `(content, image_name)` pairs, predictions are yielded in input order
+    after each batch of `batch_size` images has been through the model in a
+    single session call.
+
+    `images` is consumed lazily; reading and decoding run on a background
+    thread at most `prefetch_size` images ahead of inference, so memory does
+    not grow with the number of images. Images found in `cache` skip decode
+    and inference.
+    """
+    confidence, iou_threshold = thresholds(confidence, iou_threshold)
+    batch_size = batch_size or config.BATCH_SIZE
+    if prefetch_size is None:
+        prefetch_size = config.PREFETCH_SIZE
+    if cache is not None and not cache.enabled:
+        cache = None
+    model = load_model(MODEL)
+    input_size = model_input_size(model["input_shape"])
+    # Owned by this generator until it finishes, it may be resumed from
+    # different threads
+    batch_tensor = batch_tensor_pool.acquire(
+        (batch_size, 3, input_size.height, input_size.width))
+
+    def decode(images):
+        # yields (image_name, cache key, pre_process_image, cached prediction)
+        for content, image_name in images:
+            key = None
+            if cache is not None:
+                with stage("cache"):
+                    key = cache_key(content, confidence, iou_threshold,
+                                    MODEL)
+                    cached = cache.get(key, image_name)
+                if cached is not None:
+                    images_total.inc(result="cached")
+                    yield image_name, key, None, cached
+                    continue
+            try:
+                pre_process_image = decode_letterbox(content, input_size)
+            except DecodeError as error:
+                yield image_name, None, None, decode_failed(image_name, error)
+                continue
+            yield image_name, key, pre_process_image, None
+
+    def flush(batch):
+        size = sum(1 for _, _, pre_process_image, _ in batch
+                   if pre_process_image is not None)
+        outputs = run_model(model, batch_tensor[:size]) if size else None
+
+        row = 0
+        for image_name, key, pre_process_image, cached in batch:
+            if pre_process_image is None:
+                yield cached
+                continue
+            prediction = postprocess_prediction(outputs[row:row + 1],
+                                                pre_process_image, image_name,
+                                                confidence, iou_threshold)
+            row += 1
+            if key is not None:
+                cache.put(key, prediction)
+            images_total.inc(result="predicted")
+            yield prediction
+
+    decoded = decode(images)
+    if prefetch_size > 0:
+        decoded = prefetch(decoded, maxsize=prefetch_size)
+
+    try:
+        batch = []
+        filled = 0
+        for item in decoded:
+            pre_process_image = item[2]
+            if pre_process_image is not None:
+                fill_input_tensor(pre_process_image, batch_tensor[filled])
+                filled += 1
+            batch.append(item)
+
+            if filled == batch_size:
+                yield from flush(batch)
+                batch = []
+                filled = 0
+
+        if batch:
+            yield from flush(batch)
+    finally:
+        decoded.close()
+        batch_tensor_pool.release(batch_tensor)
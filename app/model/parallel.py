@@ -0,0 +1,285 @@
+import contextvars
+import multiprocessing
+import os
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import shared_memory
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from app import config
+from app.cache import PredictionCache, prediction_cache
+from app.metrics import (boxes_total, candidates_total, collect_request_timings,
+                         images_total, record_stage)
+from app.model.model import (MODEL, __version__, cache_key, decode_failed,
+                             load_model, postprocess_prediction, run_model,
+                             thresholds)
+from app.model.registry import registry
+from app.utils.decode import DecodeError
+from app.utils.images_predict_fn import (decode_letterbox, fill_input_tensor,
+                                         model_input_size)
+
+# State of a pool worker process: its session and the shared tensor slots
+_worker: Dict = {}
+
+
+def worker_intra_op_threads(workers: int) -> int:
+    """
+    Intra-op threads of each worker session: the explicit setting, or an
+    even share of the cores so the workers do not oversubscribe them.
+    """
+    if config.PROCESS_INTRA_OP_THREADS > 0:
+        return config.PROCESS_INTRA_OP_THREADS
+    return max(1, (os.cpu_count() or 1) // workers)
+
+
+def _init_worker(shm_name: str, shape: Tuple[int, ...], model_path: str,
+                 version: str, intra_op_threads: int) -> None:
+    config.ORT_INTRA_OP_THREADS = intra_op_threads
+    config.ORT_INTER_OP_THREADS = 1
+
+    # Spawned workers share the parent's resource tracker, the block is
+    # unlinked once by the parent on shutdown
+    shm = shared_memory.SharedMemory(name=shm_name)
+    _worker["shm"] = shm
+    _worker["tensors"] = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)
+    _worker["model"] = registry.get(model_path, version)
+
+
+def _predict_slot(slot: int, images: List[Tuple[str, Dict]],
+                  confidence: float, iou_threshold: float
+                  ) -> Tuple[List[Dict], Dict, List[Optional[Tuple]]]:
+    # images: [(image_name, pre_process_image)] in the rows of the slot,
+    # an error record instead for the rows that could not be decoded.
+    # Metrics of a worker process are never scraped: returns the stage
+    # timings of the batch inference and, for each row, those of its
+    # post-processing with its candidate and box counts, for the parent.
+    with collect_request_timings() as timings:
+        outputs = run_model(_worker["model"],
+                            _worker["tensors"][slot, :len(images)])
+    predictions, measures = [], []
+    for row, (image_name, pre_process_image) in enumerate(images):
+        if "error" in pre_process_image:
+            predictions.append(pre_process_image)
+            measures.append(None)
+            continue
+        candidates = candidates_total.value()
+        boxes = boxes_total.value()
+        with collect_request_timings() as row_timings:
+            predictions.append(postprocess_prediction(
+                outputs[row:row + 1], pre_process_image, image_name,
+                confidence, iou_threshold))
+        measures.append((row_timings.seconds,
+                         (candidates_total.value() - candidates,
+                          boxes_total.value() - boxes)))
+    return predictions, timings.seconds, measures
+
+
+def _record_measures(seconds: Dict[str, float],
+                     counts: Optional[Tuple] = None) -> None:
+    # In the parent, metrics measured in a worker by `_predict_slot`
+    for name, value in seconds.items():
+        record_stage(name, value)
+    if counts is not None:
+        candidates, boxes = counts
+        candidates_total.inc(candidates)
+        boxes_total.inc(boxes)
+        images_total.inc(result="predicted")
+
+
+class ParallelPredictor:
+    """
+    Pool of worker processes, each holding its own ONNX Runtime session,
+    for spreading one large archive over all the cores.
+
+    The parent reads and decodes the images (on threads, OpenCV releases the
+    GIL) straight into batch slots of one shared-memory block; workers run
+    inference and postprocessing on a slot and only the small predictions
+    are pickled back. Each worker gets `cpu_count // workers` intra-op
+    threads. There are two slots per worker, so decoding the next batches
+    overlaps with inference and memory stays bounded.
+    """
+
+    def __init__(self,
+                 model_path: str,
+                 version: str,
+                 workers: int,
+                 batch_size: int) -> None:
+        self.model_path = model_path
+        self.version = version
+        self.workers = workers
+        self.batch_size = batch_size
+
+        self.input_size = model_input_size(
+            load_model(model_path)["input_shape"])
+        slots = 2 * workers
+        self.shape = (slots, batch_size, 3, self.input_size.height,
+                      self.input_size.width)
+        self._shm = shared_memory.SharedMemory(
+            create=True, size=int(np.prod(self.shape)) * 4)
+        self.tensors = np.ndarray(self.shape,
+                                  dtype=np.float32,
+                                  buffer=self._shm.buf)
+        self._free = queue.Queue()
+        for slot in range(slots):
+            self._free.put(slot)
+
+        self._decoder = ThreadPoolExecutor(max_workers=workers,
+                                           thread_name_prefix="remx-decode")
+        self._pool = ProcessPoolExecutor(
+            max_workers=workers,
+            # fork would copy the parent's onnxruntime and server threads
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self._shm.name, self.shape, model_path, version,
+                      worker_intra_op_threads(workers)),
+        )
+
+    def _submit(self, batch: List, confidence: float, iou_threshold: float):
+        # batch: [(content, image_name)] of images to predict
+        slot = self._free.get()
+        try:
+            tensors = self.tensors[slot]
+
+            def decode(row):
+                content, image_name = batch[row]
+                try:
+                    pre_process_image = decode_letterbox(content,
+                                                         self.input_size)
+                except DecodeError as error:
+                    # its row is left as is, the prediction is dropped
+                    return image_name, decode_failed(image_name, error)
+                fill_input_tensor(pre_process_image, tensors[row])
+                return image_name, pre_process_image
+
+            # Each decode thread runs in a copy of the caller's context, for
+            # its request timings
+            rows = range(len(batch))
+            contexts = [contextvars.copy_context() for _ in rows]
+            images = list(
+                self._decoder.map(lambda row, context: context.run(decode, row),
+                                  rows, contexts))
+            future = self._pool.submit(_predict_slot, slot, images, confidence,
+                                       iou_threshold)
+        except BaseException:
+            self._free.put(slot)
+            raise
+        future.add_done_callback(lambda _: self._free.put(slot))
+        return future
+
+    def predict(self,
+                images: Iterable[Tuple[bytes, str]],
+                confidence: float = 0.5,
+                iou_threshold: float = 0.6,
+                model_path: str = MODEL,
+                cache: Optional[PredictionCache] = None
+                ) -> Iterator[Dict]:
+        """
+        Same contract as `predict_images_batch`: predictions (error records
+        for images that cannot be decoded) are yielded in input order.
+        """
+        # One entry per image, in input order: [prediction] when it is known
+        # already, [batch, row] for images sent to the pool. A batch is
+        # [future, keys], its future is None until the batch is full.
+        pending = deque()
+        batch, keys = [], []
+        current = [None, keys]
+
+        def ready(block: bool):
+            while pending:
+                entry = pending[0]
+                if len(entry) == 2:
+                    (future, batch_keys), row = entry
+                    if future is None or not (block or future.done()):
+                        return
+                    predictions, inference, measures = future.result()
+                    if row == 0:
+                        _record_measures(inference)
+                    prediction = predictions[row]
+                    if measures[row] is not None:
+                        _record_measures(*measures[row])
+                    if (batch_keys[row] is not None
+                            and "error" not in prediction):
+                        cache.put(batch_keys[row], prediction)
+                    entry = [prediction]
+                pending.popleft()
+                yield entry[0]
+
+        for content, image_name in images:
+            key = None
+            if cache is not None:
+                key = cache_key(content, confidence, iou_threshold,
+                                model_path)
+                cached = cache.get(key, image_name)
+                if cached is not None:
+                    images_total.inc(result="cached")
+                    pending.append([cached])
+                    continue
+
+            pending.append([current, len(batch)])
+            batch.append((content, image_name))
+            keys.append(key)
+            if len(batch) == self.batch_size:
+                current[0] = self._submit(batch, confidence, iou_threshold)
+                batch, keys = [], []
+                current = [None, keys]
+            yield from ready(block=False)
+
+        if batch:
+            current[0] = self._submit(batch, confidence, iou_threshold)
+        yield from ready(block=True)
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=True, cancel_futures=True)
+        self._decoder.shutdown(wait=True)
+        self._shm.close()
+        self._shm.unlink()
+
+
+# (model path, workers, batch size) -> its pool. A pool is never replaced,
+# requests and background jobs may still be using it.
+_predictors: Dict[Tuple[str, int, int], ParallelPredictor] = {}
+_predictor_lock = threading.Lock()
+
+
+def get_parallel_predictor(MODEL=MODEL,
+                           workers: Optional[int] = None,
+                           batch_size: Optional[int] = None
+                           ) -> ParallelPredictor:
+    # Started on first use, one per model variant, shared by every request
+    key = (MODEL, workers or config.PROCESS_WORKERS,
+           batch_size or config.BATCH_SIZE)
+    with _predictor_lock:
+        predictor = _predictors.get(key)
+        if predictor is None:
+            predictor = _predictors[key] = ParallelPredictor(
+                MODEL, __version__, key[1], key[2])
+        return predictor
+
+
+def shutdown_parallel_predictor() -> None:
+    with _predictor_lock:
+        while _predictors:
+            _predictors.popitem()[1].shutdown()
+
+
+def predict_images_parallel(images: Iterable[Tuple[bytes, str]],
+                            confidence: Optional[float] = None,
+                            iou_threshold: Optional[float] = None,
+                            workers: Optional[int] = None,
+                            batch_size: Optional[int] = None,
+                            MODEL=MODEL,
+                            cache: Optional[PredictionCache] = prediction_cache
+                            ) -> Iterator[Dict]:
+    """
+    Multi-process counterpart of `predict_images_batch` for large archives,
+    predictions are yielded in input order. See `ParallelPredictor`.
+    """
+    confidence, iou_threshold = thresholds(confidence, iou_threshold)
+    if cache is not None and not cache.enabled:
+        cache = None
+    predictor = get_parallel_predictor(MODEL, workers, batch_size)
+    return predictor.predict(images, confidence, iou_threshold, MODEL, cache)
@@ -0,0 +1,133 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Tuple
+
+import numpy as np
+
+from app import config
+from app.utils.images_predict_fn import model_ort_session, ort_session_options
+
+logger = logging.getLogger(__name__)
+
+
+def warmup_input_shape(input_shape) -> Tuple[int, ...]:
+    """
+    Concrete shape for a dummy input, dynamic axes (None or named) are
+    replaced by 1 for the batch axis and 640 for the spatial axes.
+    """
+    defaults = (1, 3, 640, 640)
+    return tuple(dim if isinstance(dim, int) and dim > 0 else defaults[i]
+                 for i, dim in enumerate(input_shape))
+
+
+def optimized_model_cache(model_path: str, graph_optimization: str,
+                          cache_dir: str) -> Tuple[str, str]:
+    """
+    Path of the graph of `model_path` optimized by onnxruntime in
+    `cache_dir`, written on the first call, and the optimization level to
+    load it with.
+
+    Entries are keyed by the model's SHA-256, the onnxruntime version, the
+    execution provider and the level. Graphs are saved optimized at most
+    up to "extended": the layout changes of "all" depend on the CPU, they
+    are redone (quickly) when the saved graph is loaded.
+    """
+    import onnxruntime as ort
+
+    level = "extended" if graph_optimization == "all" else graph_optimization
+    sha256 = hashlib.sha256()
+    with open(model_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha256.update(chunk)
+    digest = sha256.hexdigest()[:16]
+    path = os.path.join(
+        cache_dir, f"{Path(model_path).stem}-{digest}-ort{ort.__version__}-"
+        f"{config.ORT_PROVIDER}-{level}.onnx")
+
+    if not os.path.exists(path):
+        os.makedirs(cache_dir, exist_ok=True)
+        # workers starting together each write their own file, the last
+        # rename wins
+        partial = f"{path[:-len('.onnx')]}.{os.getpid()}.partial.onnx"
+        session_options = ort_session_options(graph_optimization=level)
+        session_options.optimized_model_filepath = partial
+        ort.InferenceSession(model_path,
+                             sess_options=session_options,
+                             providers=[config.ORT_PROVIDER])
+        os.replace(partial, path)
+
+    return path, "disable" if level == graph_optimization else graph_optimization
+
+
+class ModelRegistry:
+    """
+    Process-wide cache of configured ONNX Runtime sessions, one per model
+    path and model version. Sessions are built once, warmed up with a dummy
+    inference and then shared by every request of the worker.
+    """
+
+    def __init__(self) -> None:
+        self._models: Dict[Tuple[str, str], Dict] = {}
+        self._lock = threading.Lock()
+
+    def get(self, model_path: str, version: str) -> Dict:
+        key = (model_path, version)
+        model = self._models.get(key)
+        if model is None:
+            with self._lock:
+                model = self._models.get(key)
+                if model is None:
+                    model = self.load(model_path, version)
+                    self._models[key] = model
+        return model
+
+    def load(self, model_path: str, version: str, warmup: bool = True) -> Dict:
+        start = time.perf_counter()
+        graph_optimization = config.ORT_GRAPH_OPTIMIZATION
+        if model_path.endswith(".opt.onnx"):
+            # Optimized offline by app/model/variants.py, nothing left to do
+            graph_optimization = "disable"
+        session_path = model_path
+        if config.ORT_CACHE_DIR and graph_optimization != "disable":
+            try:
+                session_path, graph_optimization = optimized_model_cache(
+                    model_path, graph_optimization, config.ORT_CACHE_DIR)
+            except OSError as error:
+                logger.warning("Optimized model cache unavailable: %s", error)
+        session_options = ort_session_options(
+            intra_op_threads=config.ORT_INTRA_OP_THREADS,
+            inter_op_threads=config.ORT_INTER_OP_THREADS,
+            graph_optimization=graph_optimization,
+        )
+        model = model_ort_session(session_path,
+                                  session_options=session_options,
+                                  providers=[config.ORT_PROVIDER])
+        model["model_path"] = model_path
+        model["session_path"] = session_path
+        model["version"] = version
+        model["load_seconds"] = time.perf_counter() - start
+        model["warmup_seconds"] = self.warmup(model) if warmup else 0.0
+        return model
+
+    @staticmethod
+    def warmup(model: Dict) -> float:
+        start = time.perf_counter()
+        dummy = np.zeros(warmup_input_shape(model["input_shape"]),
+                         dtype=np.float32)
+        model["session"].run(model["output_names"],
+                             {model["input_names"][0]: dummy})
+        return time.perf_counter() - start
+
+    def loaded(self) -> Dict[Tuple[str, str], Dict]:
+        return dict(self._models)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._models.clear()
+
+
+registry = ModelRegistry()
@@ -0,0 +1,142 @@
+from typing import Dict, Optional
+
+import numpy as np
+
+from app import config
+from app.cache import PredictionCache, prediction_cache
+from app.metrics import boxes_total, candidates_total, images_total, stage
+from app.model.model import (MODEL, cache_key, decode_failed, load_model,
+                             run_model, thresholds)
+from app.results import Prediction
+from app.utils.decode import DecodeError, decode_image
+from app.utils.images import letterbox_resize, letterbox_tensor, tile_grid
+from app.utils.images_predict_fn import (batch_tensor_pool, bboxs_filter,
+                                         model_input_size, xywh2xyxy)
+from app.utils.nms import non_max_suppression
+
+
+def textured_tiles(img: np.ndarray, tiles, min_std: float):
+    """
+    The `tiles` worth running: the grayscale standard deviation of their
+    area is at least `min_std` (sky, water and blown out areas are not).
+    Measured on a 1/8 thumbnail.
+    """
+    import cv2
+
+    if min_std <= 0:
+        return tiles
+    factor = 8
+    thumbnail = cv2.cvtColor(
+        cv2.resize(img, (max(1, img.shape[1] // factor),
+                         max(1, img.shape[0] // factor)),
+                   interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+    return [(x1, y1, x2, y2) for x1, y1, x2, y2 in tiles
+            if thumbnail[y1 // factor:-(-y2 // factor),
+                         x1 // factor:-(-x2 // factor)].std() >= min_std]
+
+
+def predict_images_tiled(content: bytes,
+                         image_name: str,
+                         confidence: Optional[float] = None,
+                         iou_threshold: Optional[float] = None,
+                         tile_size: Optional[int] = None,
+                         max_tiles: Optional[int] = None,
+                         MODEL=MODEL,
+                         cache: Optional[PredictionCache] = prediction_cache
+                         ) -> Dict:
+    """
+    Predict one image on overlapping full resolution tiles, for small
+    animals that a single letterbox of the whole frame shrinks to a few
+    pixels.
+
+    The whole image and its textured tiles (see `tile_grid` and
+    `textured_tiles`) go through the model in one batch; boxes are mapped
+    back to image coordinates, where NMS merges the duplicates found in
+    overlapping tiles.
+    """
+    confidence, iou_threshold = thresholds(confidence, iou_threshold)
+    tile_size = tile_size or config.TILE_SIZE
+    max_tiles = config.TILE_MAX if max_tiles is None else max_tiles
+
+    if cache is not None and cache.enabled:
+        with stage("cache"):
+            key = cache_key(content, confidence, iou_threshold, MODEL) + (
+                f":tiles={tile_size},{max_tiles},{config.TILE_OVERLAP},"
+                f"{config.TILE_MIN_STD}")
+            cached = cache.get(key, image_name)
+        if cached is not None:
+            images_total.inc(result="cached")
+            return cached
+
+    model = load_model(MODEL)
+    input_size = model_input_size(model["input_shape"])
+
+    with stage("decode"):
+        # tiles are cut from the full resolution image
+        try:
+            img = decode_image(content)
+        except DecodeError as error:
+            return decode_failed(image_name, error)
+    height, width = img.shape[:2]
+
+    with stage("preprocess"):
+        tiles = textured_tiles(
+            img,
+            tile_grid(width, height, tile_size, config.TILE_OVERLAP,
+                      max_tiles), config.TILE_MIN_STD)
+        # the whole image first, for the animals larger than a tile
+        views = [(0, 0, width, height)] + tiles
+        tensor = batch_tensor_pool.acquire(
+            (len(views), 3, input_size.height, input_size.width))
+
+    try:
+        geometry = []
+        with stage("preprocess"):
+            for row, (x1, y1, x2, y2) in enumerate(views):
+                resized, params = letterbox_resize(img[y1:y2, x1:x2],
+                                                   input_size)
+                letterbox_tensor(resized, params["pad"], tensor[row])
+                geometry.append((params, (x1, y1)))
+
+        outputs = run_model(model, tensor)
+    finally:
+        batch_tensor_pool.release(tensor)
+
+    with stage("filter"):
+        boxes, scores, class_ids = [], [], []
+        for row, (params, offset) in enumerate(geometry):
+            candidates = bboxs_filter(outputs[row:row + 1],
+                                      input_size.width,
+                                      input_size.height,
+                                      input_size.width,
+                                      input_size.height,
+                                      conf_threshold=confidence,
+                                      top_k=config.NMS_TOP_K)
+            # letterboxed xywh -> image xyxy
+            view_boxes = xywh2xyxy(candidates["boxes"].astype(np.float32))
+            view_boxes = (view_boxes - np.tile(params["pad"], 2)) / np.tile(
+                params["scale"], 2) + np.tile(offset, 2)
+            boxes.append(view_boxes)
+            scores.append(candidates["scores"])
+            class_ids.append(candidates["class_ids"])
+        boxes = np.concatenate(boxes)
+        scores = np.concatenate(scores)
+        class_ids = np.concatenate(class_ids)
+
+    with stage("nms"):
+        indices = non_max_suppression(boxes,
+                                      scores,
+                                      iou_threshold=iou_threshold)
+    candidates_total.inc(len(scores))
+    boxes_total.inc(len(indices))
+
+    prediction = Prediction(image_name,
+                            np.rint(boxes[indices]),
+                            scores[indices],
+                            class_ids[indices],
+                            extra={"tiles": len(tiles)})
+
+    if cache is not None and cache.enabled:
+        cache.put(key, prediction)
+    images_total.inc(result="predicted")
+    return prediction
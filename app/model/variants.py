@@ -0,0 +1,169 @@
+"""
+Build the precision variants of the remx model next to the fp32 export.
+
+    python -m app.model.variants optimize
+    python -m app.model.variants quantize --mode static --images tests/tst.zip
+
+`optimize` writes the graph as optimized by ONNX Runtime, so sessions skip
+the optimization passes at load. `quantize` writes an INT8 model, weights
+only (dynamic) or weights and activations calibrated on sample images
+(static). Compare them against fp32 with `benchmarks/precision_report.py`.
+"""
+import argparse
+import logging
+import os
+import tempfile
+import zipfile
+from typing import Iterable, Iterator, List, Optional
+
+import numpy as np
+
+from app import config
+from app.model.model import model_path
+from app.utils.decode import is_image_name
+from app.utils.images_predict_fn import (final_image_pre_process,
+                                         ort_session_options)
+
+logger = logging.getLogger(__name__)
+
+
+def optimize_model(source: str,
+                   destination: str,
+                   graph_optimization: str = "extended") -> str:
+    """
+    Serialize the graph optimized by ONNX Runtime at `graph_optimization`.
+    Levels above `basic` may use kernels specific to the execution provider
+    and CPU of the machine running this, build on the serving hardware.
+    "all" also saves layouts specific to this CPU, and .opt.onnx files are
+    loaded with no further optimization: "extended" by default, as for the
+    graphs of `optimized_model_cache`.
+    """
+    import onnxruntime as ort
+
+    session_options = ort_session_options(
+        graph_optimization=graph_optimization)
+    session_options.optimized_model_filepath = destination
+    ort.InferenceSession(source,
+                         sess_options=session_options,
+                         providers=[config.ORT_PROVIDER])
+    return destination
+
+
+def iter_calibration_images(paths: Iterable[str]) -> Iterator[bytes]:
+    # Image files, directories and ZIP archives of images
+    for path in paths:
+        if zipfile.is_zipfile(path):
+            with zipfile.ZipFile(path) as zip_file:
+                for name in sorted(zip_file.namelist()):
+                    if is_image_name(name):
+                        yield zip_file.read(name)
+        elif os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if is_image_name(name):
+                    with open(os.path.join(path, name), "rb") as f:
+                        yield f.read()
+        else:
+            with open(path, "rb") as f:
+                yield f.read()
+
+
+def calibration_reader(source: str, images: List[str], limit: int = 200):
+    """
+    `CalibrationDataReader` feeding images preprocessed exactly like the
+    served ones, one per call.
+    """
+    import onnxruntime as ort
+    from onnxruntime.quantization import CalibrationDataReader
+
+    session = ort.InferenceSession(source, providers=["CPUExecutionProvider"])
+    model_input = session.get_inputs()[0]
+
+    class Reader(CalibrationDataReader):
+
+        def __init__(self) -> None:
+            self.contents = iter_calibration_images(images)
+            self.count = 0
+
+        def get_next(self):
+            if self.count >= limit:
+                return None
+            content = next(self.contents, None)
+            if content is None:
+                return None
+            self.count += 1
+            pre_process_image = final_image_pre_process(
+                content, model_input.shape)
+            # copy, the preprocessing reuses its buffer for the next image
+            return {model_input.name: np.array(pre_process_image["input_tensor"])}
+
+    return Reader()
+
+
+def quantize_model(source: str,
+                   destination: str,
+                   mode: str = "dynamic",
+                   images: Optional[List[str]] = None,
+                   limit: int = 200) -> str:
+    """
+    INT8 quantization of `source`. `dynamic` quantizes the weights and
+    computes activation ranges at run time; `static` calibrates activation
+    ranges on up to `limit` of the `images` and writes a QDQ model, usually
+    the faster one on CPU.
+    """
+    from onnxruntime.quantization import (CalibrationMethod, QuantFormat,
+                                          QuantType, quantize_dynamic,
+                                          quantize_static)
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    with tempfile.TemporaryDirectory() as directory:
+        # Shape inference and graph cleanup the quantizer expects
+        prepared = os.path.join(directory, "prepared.onnx")
+        quant_pre_process(source, prepared)
+
+        if mode == "dynamic":
+            quantize_dynamic(prepared, destination, weight_type=QuantType.QUInt8)
+        elif mode == "static":
+            if not images:
+                raise ValueError("Static quantization needs calibration images")
+            quantize_static(prepared,
+                            destination,
+                            calibration_reader(prepared, images, limit),
+                            quant_format=QuantFormat.QDQ,
+                            per_channel=True,
+                            activation_type=QuantType.QUInt8,
+                            weight_type=QuantType.QInt8,
+                            calibrate_method=CalibrationMethod.MinMax)
+        else:
+            raise ValueError(f"Unknown quantization mode: {mode!r}, "
+                             "expected dynamic or static")
+    return destination
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("command", choices=["optimize", "quantize"])
+    parser.add_argument("--source", default=model_path("fp32"))
+    parser.add_argument("--output", help="defaults to the variant path")
+    parser.add_argument("--graph-optimization", default="extended",
+                        choices=["basic", "extended", "all"])
+    parser.add_argument("--mode", default="static",
+                        choices=["dynamic", "static"])
+    parser.add_argument("--images", nargs="+", default=["tests"],
+                        help="calibration images, directories or ZIPs")
+    parser.add_argument("--limit", type=int, default=200)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.command == "optimize":
+        output = optimize_model(args.source,
+                                args.output or model_path("optimized"),
+                                args.graph_optimization)
+    else:
+        output = quantize_model(args.source,
+                                args.output or model_path("int8"), args.mode,
+                                args.images, args.limit)
+    logger.info("Wrote %s", output)
+
+
+if __name__ == "__main__":
+    main()
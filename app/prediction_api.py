@@ -1,34 +1,200 @@
-from fastapi import APIRouter, UploadFile, File
-from typing import List
+from fastapi import APIRouter, Depends, UploadFile, File, Request, HTTPException, Query
+from fastapi.responses import Response, StreamingResponse
+from typing import List, Optional
 import zipfile
 import io
 import os
-from app.model.model import predict_images
+import time
+from app.executor import prediction_executor
+from app.metrics import stage
+from app import config
+from app.model.model import MODEL, PRECISIONS, available_precisions, predict_images, predict_images_batch
+from app.model.batcher import predict_image_batched
+from app.model.parallel import predict_images_parallel
+from app.model.tiling import predict_images_tiled
+from app.results import NPZ_MEDIA_TYPE, dumps, dumps_npz
+from app.startup import startup
+from app.utils.decode import image_format, is_image_name
+from app.utils.dedup import predict_deduplicated
 
 prediction_router = APIRouter()
 
-def format_prediction(content: bytes, filename: str):
-    return predict_images(content=content, image_name=filename, confidence=0.6)
+# `options` below are keyword arguments of the predict functions (MODEL,
+# confidence, iou_threshold), see `prediction_options`
 
-@prediction_router.post("/predict/upload", summary="Upload ZIP or image(s) for prediction")
-async def predict_images_from_upload(files: List[UploadFile] = File(...)):
-    results = []
+def format_prediction(content: bytes, filename: str, dedup=False, tiled=False, **options):
+    if tiled:
+        return predict_images_tiled(content=content, image_name=filename, **options)
+    return predict_images(content=content, image_name=filename, **options)
+
+def format_predictions(images, count=None, dedup=False, tiled=False, **options):
+    # images: iterable of (content, filename), predicted in batches. Archives
+    # of `count` images or more are spread over the worker processes. With
+    # `dedup` near duplicate frames inherit the prediction of the first one.
+    # `tiled` images are one batch of tiles each, predicted one at a time.
+    def predict(images):
+        if tiled:
+            return (predict_images_tiled(content, filename, **options) for content, filename in images)
+        if config.PROCESS_WORKERS > 0 and count is not None and count >= config.PROCESS_MIN_IMAGES:
+            return predict_images_parallel(images=images, **options)
+        return predict_images_batch(images=images, **options)
+
+    if dedup:
+        return predict_deduplicated(images, predict, config.DEDUP_THRESHOLD, config.DEDUP_WINDOW)
+    return predict(images)
+
+def resolve_model(precision: Optional[str]):
+    # Model path of the requested precision variant, the configured one by default
+    if precision is None:
+        return MODEL
+    if precision not in PRECISIONS:
+        raise HTTPException(status_code=400, detail=f"Unknown precision: {precision}, expected one of {sorted(PRECISIONS)}")
+    variants = available_precisions()
+    if precision not in variants:
+        raise HTTPException(status_code=400, detail=f"Model variant not available: {precision}")
+    return variants[precision]
+
+def prediction_options(
+    precision: Optional[str] = Query(None, description="Model variant: fp32, optimized or int8"),
+    confidence: Optional[float] = Query(
+        None, ge=0, le=1, description="Minimum score of a box, defaults to REMX_CONFIDENCE_THRESHOLD"),
+    iou: Optional[float] = Query(
+        None, ge=0, le=1, description="Overlap above which boxes are merged, defaults to REMX_IOU_THRESHOLD"),
+    dedup: bool = Query(
+        False, description="Predict only the first of near duplicate frames in ZIPs, the others inherit its boxes"),
+    tiled: bool = Query(
+        False, description="Also predict on overlapping full resolution tiles, for small animals in large images"),
+):
+    # Query parameters shared by the prediction endpoints
+    return {"MODEL": resolve_model(precision), "confidence": confidence, "iou_threshold": iou, "dedup": dedup, "tiled": tiled}
 
+def zip_image_infos(zip_file: zipfile.ZipFile):
+    # Image members by extension, whatever its case. macOS resource forks
+    # (__MACOSX/, ._IMG_0001.JPG) are not images.
+    return [zip_info for zip_info in zip_file.infolist()
+            if not zip_info.is_dir() and is_image_name(zip_info.filename)
+            and not zip_info.filename.startswith("__MACOSX/")
+            and not os.path.basename(zip_info.filename).startswith("._")]
+
+def zip_images(zip_file: zipfile.ZipFile, zip_infos=None):
+    # Members are opened and read one at a time, only when consumed
+    for zip_info in zip_infos if zip_infos is not None else zip_image_infos(zip_file):
+        with stage("zip_extract"), zip_file.open(zip_info) as image_file:
+            content = image_file.read()
+        yield content, zip_info.filename
+
+def iter_upload_predictions(files: List[UploadFile], **options):
+    # Yields (upload filename, index within the upload, prediction) as each
+    # image finishes. Reads from the spooled temporary files Starlette already
+    # wrote the uploads to instead of loading them in memory.
     for file in files:
         filename = file.filename.lower()
 
         if filename.endswith(".zip"):
-            zip_content = await file.read()
-            with zipfile.ZipFile(io.BytesIO(zip_content)) as zip_file:
-                for zip_filename in zip_file.namelist():
-                    if zip_filename.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp', '.gif')):
-                        with zip_file.open(zip_filename) as image_file:
-                            image_content = image_file.read()
-                            results.append(format_prediction(image_content, zip_filename))
-        elif filename.endswith(('.png', '.jpg', '.jpeg', '.bmp', '.gif')):
-            image_content = await file.read()
-            results.append(format_prediction(image_content, file.filename))
+            file.file.seek(0)
+            with zipfile.ZipFile(file.file) as zip_file:
+                zip_infos = zip_image_infos(zip_file)
+                predictions = format_predictions(zip_images(zip_file, zip_infos), len(zip_infos), **options)
+                for index, result in enumerate(predictions):
+                    yield file.filename, index, result
         else:
-            results.append({"error": f"Unsupported file: {file.filename}"})
+            with stage("upload_read"):
+                file.file.seek(0)
+                content = file.file.read()
+            # The decoder goes by content, a misnamed image is predicted too
+            if is_image_name(filename) or image_format(content) is not None:
+                yield file.filename, 0, format_prediction(content, file.filename, **options)
+            else:
+                yield file.filename, 0, {"error": f"Unsupported file: {file.filename}"}
+
+def single_image_upload(files: List[UploadFile]) -> bool:
+    return len(files) == 1 and is_image_name(files[0].filename)
+
+def predict_uploads(files: List[UploadFile], **options):
+    # Runs on the prediction executor
+    return [result for _, _, result in iter_upload_predictions(files, **options)]
+
+def detach_uploads(files: List[UploadFile]) -> List[UploadFile]:
+    # FastAPI closes the request files as soon as the endpoint returns, before
+    # a streaming body runs. Hand the spooled files over to the stream, which
+    # closes them when it is done.
+    detached = []
+    for file in files:
+        detached.append(UploadFile(file.file, size=file.size, filename=file.filename, headers=file.headers))
+        file.file = io.BytesIO()
+    return detached
+
+def stream_records(files: List[UploadFile], **options):
+    # One record per image, then a summary record
+    start = time.perf_counter()
+    images = errors = 0
+
+    try:
+        for upload, index, result in iter_upload_predictions(files, **options):
+            images += 1
+            if "error" in result:
+                errors += 1
+            yield "prediction", {"file": upload, "index": index, **result}
+    except Exception as error:
+        errors += 1
+        yield "error", {"error": str(error)}
+    finally:
+        for file in files:
+            file.file.close()
+
+    yield "summary", {
+        "summary": {
+            "images": images,
+            "errors": errors,
+            "seconds": round(time.perf_counter() - start, 3),
+        }
+    }
+
+def results_response(results: List, accept: str) -> Response:
+    # Columnar NumPy arrays (one row per box) for clients that accept them,
+    # JSON otherwise
+    if NPZ_MEDIA_TYPE in accept:
+        return Response(dumps_npz(results), media_type=NPZ_MEDIA_TYPE)
+    return Response(dumps(results if len(results) > 1 else results[0]), media_type="application/json")
+
+@prediction_router.post("/predict/upload", summary="Upload ZIP or image(s) for prediction")
+async def predict_images_from_upload(request: Request, files: List[UploadFile] = File(...),
+                                     options: dict = Depends(prediction_options)):
+    # Prediction is CPU-bound, keep it off the event loop
+    if config.MICRO_BATCH_SIZE > 1 and single_image_upload(files) and not options["tiled"]:
+        # Only decoding and post-processing hold an executor slot, the
+        # inference is batched with that of other single image requests
+        with stage("upload_read"):
+            content = await files[0].read()
+        results = [await predict_image_batched(
+            content, files[0].filename, prediction_executor, confidence=options["confidence"],
+            iou_threshold=options["iou_threshold"], MODEL=options["MODEL"])]
+    else:
+        results = await prediction_executor.run(predict_uploads, files, **options)
+    startup.mark("first_prediction")
+
+    with stage("serialize"):
+        return results_response(results, request.headers.get("accept", ""))
+
+@prediction_router.post("/predict/stream", summary="Upload ZIP or image(s) and stream predictions as they finish")
+async def stream_predictions_from_upload(request: Request, files: List[UploadFile] = File(...),
+                                         options: dict = Depends(prediction_options)):
+    # NDJSON by default, Server-Sent Events when the client accepts them
+    sse = "text/event-stream" in request.headers.get("accept", "")
+    detached = detach_uploads(files)
+    try:
+        records = prediction_executor.stream(stream_records, detached, **options)
+    except HTTPException:
+        # rejected (queue full), the stream that would close them never runs
+        for file in detached:
+            file.file.close()
+        raise
+
+    async def body():
+        async for event, record in records:
+            startup.mark("first_prediction")
+            with stage("serialize"):
+                data = dumps(record)
+            yield b"event: " + event.encode() + b"\ndata: " + data + b"\n\n" if sse else data + b"\n"
 
-    return results if len(results) > 1 else results[0]
+    return StreamingResponse(body(), media_type="text/event-stream" if sse else "application/x-ndjson")
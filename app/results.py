@@ -0,0 +1,198 @@
+import io
+from collections.abc import Mapping
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+import orjson
+
+# Columnar response, one row per box: a NumPy .npz archive of the COLUMNS
+# arrays plus per-image `image` names and `error` messages ("" when none)
+NPZ_MEDIA_TYPE = "application/x-npz"
+COLUMNS = ("image_idx", "x1", "y1", "x2", "y2", "score", "class_id")
+
+
+class Prediction(Mapping):
+    """
+    Prediction of one image, with its kept boxes as an `(K, 4)` int32 xyxy
+    array and their scores and class ids.
+
+    Reads like the prediction dict it replaces: "coordinates" (a list of
+    tuples) and "max_confidence_coordinate" are only built when asked for,
+    so nothing is converted until a response needs it. Other fields (such
+    as "tiles" or "inferred") are in `extra`.
+    """
+    __slots__ = ("image", "boxes", "scores", "class_ids", "extra", "best")
+
+    def __init__(self,
+                 image: str,
+                 boxes: np.ndarray,
+                 scores: np.ndarray,
+                 class_ids: np.ndarray,
+                 extra: Optional[Dict] = None) -> None:
+        self.image = image
+        self.boxes = np.ascontiguousarray(boxes, dtype=np.int32).reshape(-1, 4)
+        self.scores = np.asarray(scores, dtype=np.float32)
+        self.class_ids = np.asarray(class_ids, dtype=np.int32)
+        self.extra = extra or {}
+        # index of the highest scoring box, -1 without boxes
+        self.best = int(np.argmax(self.scores)) if len(self.scores) else -1
+
+    def best_coordinate(self) -> tuple:
+        if self.best < 0:
+            return (-1, -1, -1, -1)  # Negative for does exist
+        return tuple(self.boxes[self.best].tolist())
+
+    def __getitem__(self, key):
+        if key == "image":
+            return self.image
+        if key == "coordinates":
+            return [tuple(bbox) for bbox in self.boxes.tolist()]
+        if key == "max_confidence_coordinate":
+            return self.best_coordinate()
+        return self.extra[key]
+
+    def __iter__(self):
+        yield "image"
+        yield "coordinates"
+        yield "max_confidence_coordinate"
+        yield from self.extra
+
+    def __len__(self) -> int:
+        return 3 + len(self.extra)
+
+    def __repr__(self) -> str:
+        return f"Prediction({dict(self)!r})"
+
+    def __reduce__(self):
+        # raw buffers, about half the pickled size of the arrays themselves
+        return (_unpickle_prediction,
+                (self.image, self.boxes.tobytes(), self.scores.tobytes(),
+                 self.class_ids.tobytes(), self.extra))
+
+    def to_bytes(self) -> bytes:
+        """
+        Stored form of the prediction cache, without the image name: the box
+        count, the boxes, scores and class ids as raw little-endian buffers,
+        then the other fields as JSON. Read back with `from_bytes`, nothing
+        is unpickled from the shared cache file.
+        """
+        return b"".join((
+            np.array([len(self.scores)], "<u4").tobytes(),
+            self.boxes.astype("<i4").tobytes(),
+            self.scores.astype("<f4").tobytes(),
+            self.class_ids.astype("<i4").tobytes(),
+            orjson.dumps(self.extra, option=orjson.OPT_SERIALIZE_NUMPY),
+        ))
+
+    @classmethod
+    def from_bytes(cls, data: bytes, image: str) -> "Prediction":
+        # Raises ValueError when `data` is not a `to_bytes` record
+        count = int(np.frombuffer(data, "<u4", 1)[0])
+        boxes = np.frombuffer(data, "<i4", 4 * count, 4)
+        scores = np.frombuffer(data, "<f4", count, 4 + 16 * count)
+        class_ids = np.frombuffer(data, "<i4", count, 4 + 20 * count)
+        extra = orjson.loads(data[4 + 24 * count:])
+        if not isinstance(extra, dict):
+            raise ValueError("Not a prediction record")
+        return cls(image, boxes, scores, class_ids, extra)
+
+    def replace(self, image: Optional[str] = None, **extra) -> "Prediction":
+        # Same boxes, another image name and/or more fields
+        return Prediction(self.image if image is None else image, self.boxes,
+                          self.scores, self.class_ids, {
+                              **self.extra,
+                              **extra
+                          })
+
+    def to_json(self) -> Dict:
+        # Same fields as the mapping, with plain lists for orjson
+        coordinates = self.boxes.tolist()
+        return {
+            "image": self.image,
+            "coordinates": coordinates,
+            "max_confidence_coordinate":
+            coordinates[self.best] if self.best >= 0 else (-1, -1, -1, -1),
+            **self.extra,
+        }
+
+
+def _unpickle_prediction(image, boxes, scores, class_ids, extra):
+    return Prediction(image, np.frombuffer(boxes, np.int32),
+                      np.frombuffer(scores, np.float32),
+                      np.frombuffer(class_ids, np.int32), extra)
+
+
+def annotate(prediction: Mapping, **fields) -> Mapping:
+    """`prediction` with more (or replaced) fields, arrays kept if any."""
+    if isinstance(prediction, Prediction):
+        return prediction.replace(**fields)
+    return {**prediction, **fields}
+
+
+def _default(value):
+    if isinstance(value, Prediction):
+        return value.to_json()
+    if isinstance(value, Mapping):
+        return dict(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def dumps(content) -> bytes:
+    """JSON encoding of responses and records, predictions included."""
+    return orjson.dumps(content,
+                        default=_default,
+                        option=orjson.OPT_SERIALIZE_NUMPY)
+
+
+def columns(predictions: Iterable[Mapping]) -> Dict[str, np.ndarray]:
+    """
+    Columnar form of a list of predictions: one row per box for the
+    COLUMNS arrays, `image_idx` pointing into the per-image `image` and
+    `error` arrays. Boxes of predictions without scores get a NaN score
+    and class -1.
+    """
+    images, errors = [], []
+    boxes, scores, class_ids, image_idx = [], [], [], []
+
+    for index, prediction in enumerate(predictions):
+        if "error" in prediction:
+            images.append(prediction.get("image", prediction.get("file", "")))
+            errors.append(str(prediction["error"]))
+            continue
+
+        images.append(prediction["image"])
+        errors.append("")
+        if isinstance(prediction, Prediction):
+            boxes.append(prediction.boxes)
+            scores.append(prediction.scores)
+            class_ids.append(prediction.class_ids)
+        else:
+            image_boxes = np.asarray(prediction["coordinates"],
+                                     dtype=np.int32).reshape(-1, 4)
+            boxes.append(image_boxes)
+            scores.append(np.full(len(image_boxes), np.nan, np.float32))
+            class_ids.append(np.full(len(image_boxes), -1, np.int32))
+        image_idx.append(np.full(len(boxes[-1]), index, np.int32))
+
+    boxes = np.concatenate(boxes) if boxes else np.empty((0, 4), np.int32)
+    return {
+        "image": np.asarray(images, dtype=str),
+        "error": np.asarray(errors, dtype=str),
+        "image_idx": np.concatenate(image_idx) if image_idx else np.empty(
+            0, np.int32),
+        "x1": boxes[:, 0].copy(),
+        "y1": boxes[:, 1].copy(),
+        "x2": boxes[:, 2].copy(),
+        "y2": boxes[:, 3].copy(),
+        "score": np.concatenate(scores) if scores else np.empty(
+            0, np.float32),
+        "class_id": np.concatenate(class_ids) if class_ids else np.empty(
+            0, np.int32),
+    }
+
+
+def dumps_npz(predictions: Iterable[Mapping]) -> bytes:
+    """`columns` of the predictions as an uncompressed .npz archive."""
+    buffer = io.BytesIO()
+    np.savez(buffer, **columns(predictions))
+    return buffer.getvalue()
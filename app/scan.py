@@ -0,0 +1,185 @@
+import fnmatch
+import json
+import mmap
+import os
+import time
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from app import config
+from app.metrics import stage
+from app.prediction_api import format_predictions
+from app.results import dumps
+from app.utils.decode import is_image_name
+
+# Results file written in the scanned directory unless another one is given,
+# which must be JSON Lines too
+OUTPUT_NAME = "remx_predictions.jsonl"
+RESULTS_EXTENSION = ".jsonl"
+
+
+def scan_roots() -> List[str]:
+    # Allow-listed directories, none when scanning is disabled
+    return [os.path.realpath(root)
+            for root in config.SCAN_ROOTS.split(os.pathsep) if root]
+
+
+def within_roots(path: str, roots: List[str]) -> bool:
+    return any(os.path.commonpath([root, path]) == root for root in roots)
+
+
+def resolve_scan_path(path: str, roots: List[str]) -> str:
+    """
+    Real path of `path`, relative paths being taken from the first root.
+    Raises PermissionError when it is outside every root, symbolic links
+    and ".." included.
+    """
+    if not roots:
+        raise PermissionError("Directory scans are disabled")
+    resolved = os.path.realpath(os.path.join(roots[0], path))
+    if not within_roots(resolved, roots):
+        raise PermissionError(f"Not within an allowed scan root: {path}")
+    return resolved
+
+
+def image_files(directory: str,
+                pattern: Optional[str] = None,
+                roots: Optional[List[str]] = None) -> Iterator[Tuple[str, str]]:
+    """
+    Yields `(path, name)` of the images below `directory`, walked lazily in
+    name order, `name` being the path relative to `directory`. `pattern`
+    is matched against the name with fnmatch, so "*" also spans
+    directories. Linked directories are not followed, linked files only
+    when they point within `roots`.
+    """
+    def walk(directory: str, prefix: str):
+        with os.scandir(directory) as scan:
+            entries = sorted(scan, key=lambda entry: entry.name)
+        for entry in entries:
+            name = prefix + entry.name
+            if entry.is_dir(follow_symlinks=False):
+                yield from walk(entry.path, name + "/")
+                continue
+            if not entry.is_file() or not is_image_name(entry.name):
+                continue
+            if pattern is not None and not fnmatch.fnmatchcase(name, pattern):
+                continue
+            if (entry.is_symlink() and roots is not None
+                    and not within_roots(os.path.realpath(entry.path), roots)):
+                continue
+            yield entry.path, name
+
+    return walk(directory, "")
+
+
+def mapped_images(files: Iterator[Tuple[str, str]]):
+    """
+    `(content, name)` of each file for the predict functions, the content
+    being a read-only memory map of the file: the decoder reads the page
+    cache directly, nothing is copied into Python bytes. A map is released
+    once the pipeline dropped it.
+    """
+    for path, name in files:
+        with stage("scan_read"), open(path, "rb") as f:
+            try:
+                content = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # empty file, reported as undecodable
+                content = b""
+        yield content, name
+
+
+def is_result_record(record) -> bool:
+    return (isinstance(record, dict) and isinstance(record.get("image"), str)
+            and ("coordinates" in record or "error" in record))
+
+
+def recorded_images(output: str) -> Set[str]:
+    """
+    Images already in the results file of an earlier scan. Raises
+    ValueError when `output` is not a ".jsonl" file holding only result
+    records, it is then neither truncated nor appended to. A last line cut
+    short by an interrupted scan, the start of a record, is dropped from
+    the file.
+    """
+    if not output.lower().endswith(RESULTS_EXTENSION):
+        raise ValueError(f"Results file must be a {RESULTS_EXTENSION} file: "
+                         f"{output}")
+    recorded = set()
+    if not os.path.exists(output):
+        return recorded
+    if not os.path.isfile(output):
+        raise ValueError(f"Not a results file: {output}")
+    complete = 0
+    partial = None
+    with open(output, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                partial = line
+                break
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            if not is_result_record(record):
+                raise ValueError(f"Not a results file: {output}")
+            recorded.add(record["image"])
+            complete += len(line)
+    if partial is not None:
+        if not partial.startswith(b'{"image":'):
+            raise ValueError(f"Not a results file: {output}")
+        os.truncate(output, complete)
+    return recorded
+
+
+def scan_directory(directory: str,
+                   output: str,
+                   pattern: Optional[str] = None,
+                   roots: Optional[List[str]] = None,
+                   recorded: Optional[Set[str]] = None,
+                   **options) -> Iterator[Dict]:
+    """
+    Predict the images below `directory` and append one JSON line per image
+    to `output`, keyed by its path relative to `directory`. Images already
+    in `output` (`recorded`, read from it when not given) are skipped, so a
+    scan that was interrupted picks up where it stopped when run again.
+
+    Yields a progress record after each batch of results is written, then
+    a summary. `options` are those of `format_predictions`.
+    """
+    start = time.perf_counter()
+    if recorded is None:
+        recorded = recorded_images(output)
+    skipped = images = errors = 0
+
+    def pending():
+        nonlocal skipped
+        for path, name in image_files(directory, pattern, roots):
+            if name in recorded:
+                skipped += 1
+                continue
+            yield path, name
+
+    def progress():
+        return {"images": images, "errors": errors, "skipped": skipped,
+                "seconds": round(time.perf_counter() - start, 3)}
+
+    predictions = format_predictions(mapped_images(pending()), **options)
+    try:
+        with open(output, "ab") as f:
+            lines = []
+            for prediction in predictions:
+                images += 1
+                if "error" in prediction:
+                    errors += 1
+                with stage("serialize"):
+                    lines.append(dumps(prediction) + b"\n")
+                if len(lines) >= config.BATCH_SIZE:
+                    f.writelines(lines)
+                    f.flush()
+                    lines = []
+                    yield {"progress": progress()}
+            f.writelines(lines)
+    finally:
+        predictions.close()
+
+    yield {"summary": {**progress(), "output": output}}
@@ -0,0 +1,53 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from typing import Optional
+import os
+
+from app.executor import prediction_executor
+from app.prediction_api import prediction_options
+from app.results import dumps
+from app.scan import OUTPUT_NAME, recorded_images, resolve_scan_path, scan_directory, scan_roots
+
+scan_router = APIRouter()
+
+def scan_paths(path: str, output: Optional[str]):
+    # (directory, results file, roots, images already in it), both paths
+    # within the allowed roots
+    roots = scan_roots()
+    try:
+        directory = resolve_scan_path(path, roots)
+        output = resolve_scan_path(output or os.path.join(directory, OUTPUT_NAME), roots)
+    except PermissionError as error:
+        raise HTTPException(status_code=403, detail=str(error))
+    if not os.path.isdir(directory):
+        raise HTTPException(status_code=404, detail=f"Not a directory: {path}")
+    if not os.access(output if os.path.exists(output) else os.path.dirname(output), os.W_OK):
+        raise HTTPException(status_code=400, detail=f"Results file is not writable: {output}")
+    try:
+        recorded = recorded_images(output)
+    except ValueError as error:
+        # never written to, whatever the file is
+        raise HTTPException(status_code=400, detail=str(error))
+    return directory, output, roots, recorded
+
+@scan_router.post("/predict/scan", summary="Predict the images of a directory on the server, results appended to a JSONL file")
+async def scan_directory_on_server(
+    path: str = Query(..., description="Directory within REMX_SCAN_ROOTS, relative to the first root or absolute"),
+    pattern: Optional[str] = Query(
+        None, description="Glob the image paths relative to the directory must match, e.g. site1/*.JPG"),
+    output: Optional[str] = Query(
+        None, description=f"Results file (.jsonl), {OUTPUT_NAME} in the directory by default. "
+        "Images already in it are skipped."),
+    options: dict = Depends(prediction_options),
+):
+    # NDJSON progress records while the scan runs, then a summary. A scan
+    # stopped by a disconnect resumes from the results file when posted again.
+    directory, output, roots, recorded = await run_in_threadpool(scan_paths, path, output)
+    records = prediction_executor.stream(scan_directory, directory, output, pattern, roots, recorded, **options)
+
+    async def body():
+        async for record in records:
+            yield dumps(record) + b"\n"
+
+    return StreamingResponse(body(), media_type="application/x-ndjson")
@@ -0,0 +1,78 @@
+import logging
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# First import of the `app` package, the earliest point of a worker we control
+STARTED = time.perf_counter()
+
+
+class Startup:
+    """
+    Readiness and cold start timings of the worker.
+
+    Phases are recorded once, in seconds since the `app` package was first
+    imported: "imported" (application built), "model_loaded" (session
+    built and warmed up, the worker is ready) and "first_prediction".
+    """
+
+    def __init__(self) -> None:
+        self.timings: Dict[str, float] = {}
+        self.error: Optional[str] = None
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def mark(self, phase: str) -> None:
+        # only the first time a phase is reached counts
+        if phase in self.timings:
+            return
+        with self._lock:
+            self.timings.setdefault(phase, time.perf_counter() - STARTED)
+
+    def load(self, load_model: Callable[[], Dict]) -> None:
+        try:
+            model = load_model()
+        except Exception as error:
+            self.error = f"{type(error).__name__}: {error}"
+            raise
+        self.mark("model_loaded")
+        self._ready.set()
+        logger.info(
+            "Model %s loaded in %.3fs, warm-up took %.3fs, ready %.3fs "
+            "after import", model["version"], model["load_seconds"],
+            model["warmup_seconds"], self.timings["model_loaded"])
+
+    def load_in_background(self,
+                           load_model: Callable[[], Dict]) -> threading.Thread:
+        # The server answers (liveness, /ready) while the model loads
+        def load():
+            try:
+                self.load(load_model)
+            except Exception:
+                logger.exception("Model loading failed")
+
+        thread = threading.Thread(target=load,
+                                  name="remx-startup",
+                                  daemon=True)
+        thread.start()
+        return thread
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._ready.wait(timeout)
+
+    def report(self) -> Dict:
+        return {
+            "ready": self.ready,
+            "error": self.error,
+            "seconds": {phase: round(seconds, 6)
+                        for phase, seconds in self.timings.items()},
+        }
+
+
+startup = Startup()
@@ -0,0 +1,12 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+from app.startup import startup
+
+startup_router = APIRouter()
+
+
+@startup_router.get("/ready", summary="Readiness: 200 once the model is loaded and warmed up, 503 before")
+async def ready():
+    report = startup.report()
+    return JSONResponse(report, status_code=200 if report["ready"] else 503)
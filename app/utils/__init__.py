@@ -1,15 +1,31 @@
 from app.utils.images import (
     letterbox,
+    letterbox_params,
+    letterbox_resize,
+    letterbox_tensor,
     inverse_letterbox_coordinate_transform,
+    inverse_letterbox_transform,
+    jpeg_size,
+    reduced_decode_factor,
+    tile_grid,
 )
 
+from app.utils.decode import DecodeError, decode_image, image_format
+
 from app.utils.images_predict_fn import (map_lb_original_img, bboxs_filter,
                                          nms, compute_iou, xywh2xyxy,
                                          model_ort_session,
                                          final_image_pre_process,
+                                         decode_letterbox, fill_input_tensor,
                                          letterboxed_result)
 
-__all__ = ("letterbox", "inverse_letterbox_coordinate_transform",
+__all__ = ("letterbox", "letterbox_params", "letterbox_resize",
+           "letterbox_tensor",
+           "inverse_letterbox_coordinate_transform",
+           "inverse_letterbox_transform", "jpeg_size",
+           "reduced_decode_factor", "tile_grid",
+           "DecodeError", "decode_image", "image_format",
            "map_lb_original_img", "bboxs_filter", "nms", "compute_iou",
            "xywh2xyxy", "model_ort_session", "final_image_pre_process",
+           "decode_letterbox", "fill_input_tensor",
            "letterboxed_result")
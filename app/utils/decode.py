@@ -0,0 +1,84 @@
+import io
+from typing import Optional
+
+import numpy as np
+
+# Leading bytes of each supported format
+SIGNATURES = (
+    (b"\xff\xd8\xff", "jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"GIF87a", "gif"),
+    (b"GIF89a", "gif"),
+    (b"BM", "bmp"),
+    (b"II*\x00", "tiff"),
+    (b"MM\x00*", "tiff"),
+)
+
+# Extensions of the image members of an archive, a hint only: the format is
+# always detected from the content
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".jpe", ".png", ".bmp", ".dib", ".gif",
+                    ".webp", ".tif", ".tiff")
+
+
+class DecodeError(ValueError):
+    """The content is not an image in a supported format, or is corrupt."""
+
+
+def image_format(content: bytes) -> Optional[str]:
+    """Format of an encoded image from its magic bytes, None if unknown."""
+    # any buffer, memory maps included
+    head = bytes(content[:12])
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    for signature, name in SIGNATURES:
+        if head.startswith(signature):
+            return name
+    return None
+
+
+def is_image_name(name: str) -> bool:
+    return name.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def decode_image(content: bytes, reduce: int = 1) -> np.ndarray:
+    """
+    Decode an image of any supported format to a 3-channel uint8 BGR array
+    in its display orientation (EXIF orientation applied).
+
+    OpenCV decodes straight to 3-channel 8-bit BGR, grayscale, alpha and
+    16-bit images included, with no separate conversion; JPEGs are decoded
+    at 1/`reduce` of their size when `reduce` is 2, 4 or 8. GIFs (first
+    frame) and anything OpenCV cannot read go through Pillow. Raises
+    DecodeError.
+    """
+    import cv2
+
+    image_type = image_format(content)
+    if image_type is None:
+        raise DecodeError("Unsupported image format")
+
+    img = None
+    if image_type != "gif":
+        flags = cv2.IMREAD_COLOR
+        if image_type == "jpeg" and reduce > 1:
+            flags = getattr(cv2, f"IMREAD_REDUCED_COLOR_{reduce}")
+        img = cv2.imdecode(np.frombuffer(content, np.uint8), flags)
+    if img is None:
+        img = _decode_with_pillow(content, image_type)
+    return img
+
+
+def _decode_with_pillow(content: bytes, image_type: str) -> np.ndarray:
+    import cv2
+    from PIL import Image, ImageOps
+
+    try:
+        with Image.open(io.BytesIO(content)) as image:
+            image = ImageOps.exif_transpose(image)
+            if image.mode != "RGB":
+                image = image.convert("RGB")
+            img = np.array(image)
+    except (OSError, ValueError, SyntaxError) as error:
+        raise DecodeError(f"Cannot decode {image_type} image: {error}")
+    # in place, np.array already made the only copy
+    return cv2.cvtColor(img, cv2.COLOR_RGB2BGR, dst=img)
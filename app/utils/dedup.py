@@ -0,0 +1,136 @@
+import itertools
+import threading
+from collections import deque
+from typing import Callable, Dict, Iterable, Iterator, Optional, Tuple
+
+import numpy as np
+
+from app.metrics import images_total, stage
+from app.results import annotate
+from app.utils.decode import DecodeError, decode_image
+from app.utils.images import jpeg_size
+
+
+def perceptual_hash(content: bytes) -> Optional[Tuple[int, Tuple[int, int]]]:
+    """
+    64-bit difference hash (dHash) of an image with its `(width, height)`,
+    or None when it cannot be decoded. JPEGs are decoded at 1/8 resolution.
+    """
+    import cv2
+
+    if not content:
+        return None
+    size = jpeg_size(content)
+    buffer = np.frombuffer(content, np.uint8)
+    if size is not None:
+        # smallest decode of a JPEG, the hash only needs a 9x8 thumbnail
+        img = cv2.imdecode(
+            buffer,
+            cv2.IMREAD_REDUCED_GRAYSCALE_8 | cv2.IMREAD_IGNORE_ORIENTATION)
+    else:
+        img = cv2.imdecode(buffer, cv2.IMREAD_GRAYSCALE)
+        if img is None:
+            # GIFs, and what OpenCV cannot read
+            try:
+                img = cv2.cvtColor(decode_image(content), cv2.COLOR_BGR2GRAY)
+            except DecodeError:
+                return None
+        size = (img.shape[1], img.shape[0])
+    if img is None:
+        return None
+
+    thumbnail = cv2.resize(img, (9, 8), interpolation=cv2.INTER_AREA)
+    # one bit per pixel: brighter than its right neighbour
+    bits = np.packbits(thumbnail[:, 1:] > thumbnail[:, :-1])
+    return int.from_bytes(bits.tobytes(), "big"), size
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def predict_deduplicated(
+        images: Iterable[Tuple[bytes, str]],
+        predict: Callable[[Iterable[Tuple[bytes, str]]], Iterator[Dict]],
+        threshold: int,
+        window: int = 8) -> Iterator[Dict]:
+    """
+    Run `predict` only on one representative of each group of near
+    duplicate frames, as fired in bursts by camera traps.
+
+    A frame joins the group of one of the last `window` representatives
+    when it has the same size and their perceptual hashes differ by at most
+    `threshold` bits; the first frame of a group is its representative.
+    Predictions are yielded in input order, flagged with `inferred`; other
+    members of a group get a copy of their representative's boxes with
+    `inferred: false` and `duplicate_of`.
+    """
+    # `representatives` runs on the prefetch thread of `predict`
+    lock = threading.Lock()
+    # per input image: (image name, group id, is representative)
+    plan = deque()
+    # groups still open to new members: (group id, hash, size)
+    recent = deque()
+    # group id -> [representative name, prediction, members not yielded yet]
+    groups: Dict[int, list] = {}
+    awaiting = deque()  # groups sent to `predict`, in order
+    group_ids = itertools.count()
+
+    def representatives():
+        for content, image_name in images:
+            with stage("dedup"):
+                fingerprint = perceptual_hash(content)
+
+            with lock:
+                group = None
+                if fingerprint is not None:
+                    image_hash, size = fingerprint
+                    for group_id, group_hash, group_size in recent:
+                        if group_size == size and hamming_distance(
+                                image_hash, group_hash) <= threshold:
+                            group = group_id
+                            break
+
+                if group is not None:
+                    groups[group][2] += 1
+                    plan.append((image_name, group, False))
+                    continue
+
+                group = next(group_ids)
+                groups[group] = [image_name, None, 1]
+                if fingerprint is not None:
+                    recent.appendleft((group, image_hash, size))
+                    if len(recent) > window:
+                        closed = recent.pop()[0]
+                        if groups[closed][2] == 0:
+                            del groups[closed]
+                plan.append((image_name, group, True))
+                awaiting.append(group)
+            yield content, image_name
+
+    def ready():
+        while True:
+            with lock:
+                if not plan or plan[0][1] in awaiting:
+                    return
+                image_name, group, inferred = plan.popleft()
+                representative, prediction, members = groups[group]
+                groups[group][2] = members - 1
+                if members == 1 and all(group != open_group
+                                        for open_group, _, _ in recent):
+                    del groups[group]
+
+            if inferred:
+                yield annotate(prediction, inferred=True)
+            else:
+                images_total.inc(result="duplicate")
+                yield annotate(prediction,
+                               image=image_name,
+                               inferred=False,
+                               duplicate_of=representative)
+
+    for prediction in predict(representatives()):
+        with lock:
+            groups[awaiting.popleft()][1] = prediction
+        yield from ready()
+    yield from ready()
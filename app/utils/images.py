@@ -1,4 +1,5 @@
-import cv2
+from typing import List, Optional, Tuple
+
 import numpy as np
 
 
@@ -12,58 +13,195 @@ class ImgSize:
     def get_tuple(self) -> tuple:
         return (self.width, self.height, self.channel)
 
+    @property
+    def shape(self) -> tuple:
+        # numpy HWC shape of an image of this size
+        return (self.height, self.width, self.channel)
 
-def letterbox(img: np.ndarray,
-              new_size: ImgSize,
-              fill_value: int = 114) -> np.ndarray:
-    # [why fill_value = 114](https://github.com/ultralytics/ultralytics/blob/796bac229eb5040159d7dff549f136f8c7e1c64e/ultralytics/data/augment.py#L587)
-    aspect_ratio = min(new_size.height / img.shape[1],
-                       new_size.width / img.shape[0])
 
-    new_size_with_ar = int(img.shape[1] * aspect_ratio), int(img.shape[0] *
-                                                             aspect_ratio)
+def letterbox_params(width: int, height: int, new_size: ImgSize) -> dict:
+    """
+    Geometry of the letterbox operation for an image of `width` x `height`
+    placed into `new_size`: the resized size, the per-axis scale from the
+    original image and the (left, top) padding.
+    """
+    aspect_ratio = min(new_size.width / width, new_size.height / height)
+
+    resized_w = int(width * aspect_ratio)
+    resized_h = int(height * aspect_ratio)
+
+    return {
+        "resized": (resized_w, resized_h),
+        "scale": (resized_w / width, resized_h / height),
+        "pad": ((new_size.width - resized_w) // 2,
+                (new_size.height - resized_h) // 2),
+    }
+
+
+def jpeg_size(content: bytes) -> Optional[Tuple[int, int]]:
+    """
+    `(width, height)` of a JPEG from its frame header, without decoding it,
+    or None when `content` is not a readable JPEG.
+    """
+    if content[:2] != b"\xff\xd8":
+        return None
+    i = 2
+    while i + 9 < len(content):
+        if content[i] != 0xFF:
+            return None
+        marker = content[i + 1]
+        if marker == 0xFF:  # fill byte
+            i += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD9:  # no length field
+            i += 2
+            continue
+        # SOF0-SOF15, except DHT (C4), JPG (C8) and DAC (CC)
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height = int.from_bytes(content[i + 5:i + 7], "big")
+            width = int.from_bytes(content[i + 7:i + 9], "big")
+            return (width, height) if width and height else None
+        i += 2 + int.from_bytes(content[i + 2:i + 4], "big")
+    return None
+
+
+def reduced_decode_factor(width: int, height: int,
+                          resized: Tuple[int, int]) -> int:
+    """
+    Largest JPEG decode reduction (1, 2, 4 or 8) that keeps a `width` x
+    `height` image at least as large as its `resized` letterbox size, so the
+    image is still only ever downscaled.
+    """
+    for factor in (8, 4, 2):
+        # libjpeg rounds the reduced size up
+        if (-(-width // factor) >= resized[0]
+                and -(-height // factor) >= resized[1]):
+            return factor
+    return 1
+
+
+def tile_grid(width: int,
+              height: int,
+              tile_size: int,
+              overlap: float = 0.2,
+              max_tiles: int = 16) -> List[Tuple[int, int, int, int]]:
+    """
+    `(x1, y1, x2, y2)` square tiles of `tile_size` covering a `width` x
+    `height` image, neighbours overlapping by at least `overlap` of a tile.
+    When that takes more than `max_tiles` tiles, the tiles are made larger
+    (and coarser once resized to the model input) until it does not. An
+    image that fits in one tile, or a `max_tiles` of 0, gives no tiles.
+    """
+    if not 0 <= overlap < 1:
+        raise ValueError(f"Tile overlap must be in [0, 1), got {overlap}")
+    if max_tiles <= 0 or (width <= tile_size and height <= tile_size):
+        return []
+
+    def count(length, size):
+        if length <= size:
+            return 1
+        return int(np.ceil((length - size) / (size * (1 - overlap)))) + 1
+
+    size = tile_size
+    while count(width, size) * count(height, size) > max_tiles:
+        size = int(size * 1.25) + 1
+    if width <= size and height <= size:
+        return []
+
+    tile_w, tile_h = min(size, width), min(size, height)
+    xs = np.linspace(0, width - tile_w, count(width, size)).round().astype(int)
+    ys = np.linspace(0, height - tile_h, count(height, size)).round().astype(int)
+    return [(int(x), int(y), int(x) + tile_w, int(y) + tile_h)
+            for y in ys for x in xs]
+
+
+def letterbox_resize(img: np.ndarray, new_size: ImgSize):
+    """
+    First half of the letterbox: resize `img` to fit `new_size` keeping its
+    aspect ratio. Returns the resized image and its `letterbox_params`.
+    """
+    import cv2
+
+    params = letterbox_params(img.shape[1], img.shape[0], new_size)
+    return cv2.resize(img, params["resized"]), params
 
-    # Image resize to new_size
-    resized_img = np.asarray(cv2.resize(img, new_size_with_ar))
-    resized_h, resized_w, _ = resized_img.shape
 
-    padded_img = np.full(new_size.get_tuple(), fill_value)
-    center_x = new_size.width / 2
-    center_y = new_size.height / 2
+def letterbox(img: np.ndarray,
+              new_size: ImgSize,
+              fill_value: int = 114,
+              out: np.ndarray = None) -> np.ndarray:
+    """
+    Letterbox `img` into a `new_size` uint8 HWC image, written into `out`
+    when given so callers can reuse one buffer. Only the padding is filled,
+    the resized image is copied once into the middle.
+    """
+    # [why fill_value = 114](https://github.com/ultralytics/ultralytics/blob/796bac229eb5040159d7dff549f136f8c7e1c64e/ultralytics/data/augment.py#L587)
+    resized_img, params = letterbox_resize(img, new_size)
+    resized_h, resized_w = resized_img.shape[:2]
 
-    x_range_start = int(center_x - (resized_w / 2))
-    x_range_end = int(center_x + (resized_w / 2))
+    if out is None:
+        out = np.empty(new_size.shape, dtype=np.uint8)
 
-    y_range_start = int(center_y - (resized_h / 2))
-    y_range_end = int(center_y + (resized_h / 2))
+    x_range_start, y_range_start = params["pad"]
+    x_range_end = x_range_start + resized_w
+    y_range_end = y_range_start + resized_h
 
-    padding_width = new_size.width - resized_w
-    padding_height = new_size.height - resized_h
+    out[:y_range_start] = fill_value
+    out[y_range_end:] = fill_value
+    out[y_range_start:y_range_end, :x_range_start] = fill_value
+    out[y_range_start:y_range_end, x_range_end:] = fill_value
+    out[y_range_start:y_range_end,
+        x_range_start:x_range_end] = resized_img.reshape(resized_h, resized_w, -1)
 
-    padded_img[y_range_start:y_range_end,
-               x_range_start:x_range_end, :] = resized_img
+    return out
 
-    return padded_img
 
+def letterbox_tensor(resized_img: np.ndarray,
+                     pad: Tuple[int, int],
+                     out: np.ndarray,
+                     fill_value: int = 114) -> np.ndarray:
+    """
+    Second half of the letterbox, straight into the model input: write the
+    `resized_img` (HWC, from `letterbox_resize`) at `pad` into the float32
+    `(3, H, W)` tensor `out`, scaled to 0-1, and fill the padding. No
+    intermediate letterboxed image is allocated.
+    """
+    resized_h, resized_w = resized_img.shape[:2]
+    x_range_start, y_range_start = pad
+    x_range_end = x_range_start + resized_w
+    y_range_end = y_range_start + resized_h
+    fill = fill_value / 255.0
+
+    out[:, :y_range_start] = fill
+    out[:, y_range_end:] = fill
+    out[:, y_range_start:y_range_end, :x_range_start] = fill
+    out[:, y_range_start:y_range_end, x_range_end:] = fill
+    # Scale input pixel value to 0 to 1, HWC -> CHW
+    np.multiply(resized_img.transpose(2, 0, 1),
+                1 / 255.0,
+                out=out[:, y_range_start:y_range_end,
+                        x_range_start:x_range_end],
+                casting="unsafe")
+
+    return out
 
-from typing import List, Tuple
 
 # type alias BBox as a tuple of four floats representing
 # the coordinates of a bounding box in the format (x, y, w, h),
 BBox = Tuple[float, float, float, float]  # (x, y, wh) for single bounding box
 
 
-def letterbox_coordinate_transform(bboxes: List[BBox], original_size: ImgSize,
-                                   letterboxed_size: ImgSize) -> List[BBox]:
+def letterbox_coordinate_transform(bboxes, original_size: ImgSize,
+                                   letterboxed_size: ImgSize) -> np.ndarray:
     """
     The function `letterbox_coordinate_transform` takes a list of bounding boxes, the original size of
     an image, and the letterboxed size of the image, and returns a list of transformed bounding boxes
     that correspond to the letterboxed image.
 
-    :param bboxes: The `bboxes` parameter is a list of bounding boxes. Each bounding box is represented
-    as a tuple of four values: `(x1, y1, x2, y2)`. `x1` and `y1` are the coordinates of the top-left
-    corner of the bounding box
-    :type bboxes: List[BBox]
+    :param bboxes: The `bboxes` parameter is an `(N, 4)` array (or list) of bounding boxes. Each
+    bounding box is a row of four values: `(x1, y1, x2, y2)`. `x1` and `y1` are the coordinates of
+    the top-left corner of the bounding box
+    :type bboxes: np.ndarray
     :param original_size: The original_size parameter represents the size of the original image. It is
     an object of type ImgSize, which typically contains the width and height of the image
     :type original_size: ImgSize
@@ -71,44 +209,30 @@ def letterbox_coordinate_transform(bboxes: List[BBox], original_size: ImgSize,
     letterboxed image. It is an instance of the `ImgSize` class, which typically contains the `width`
     and `height` attributes
     :type letterboxed_size: ImgSize
-    :return: a list of transformed bounding boxes in the letterboxed image dimensions.
+    :return: an `(N, 4)` integer array of bounding boxes in the letterboxed image dimensions.
     """
 
-    # Calculate the aspect ratio of the original and letterboxed sizes
-    aspect_ratio = min(
-        letterboxed_size.height / original_size.width,
-        letterboxed_size.width / original_size.height,
-    )
-
-    # Calculate the amount of padding added during the letterbox operation
-    pad_w = letterboxed_size.width - (aspect_ratio * original_size.width)
-    pad_h = letterboxed_size.height - (aspect_ratio * original_size.height)
+    params = letterbox_params(original_size.width, original_size.height,
+                              letterboxed_size)
 
-    # Convert the bounding box coordinates to the letterboxed image dimensions
-    letterboxed_bboxes = []
-    for bbox in bboxes:
-        x1, y1, x2, y2 = bbox
-        # (x1, y1) is the top-left corner of single bounding box
-        map_x1 = round((x1 + pad_w / (2 * aspect_ratio)) * aspect_ratio)
-        map_y1 = round((y1 + pad_h / (2 * aspect_ratio)) * aspect_ratio)
+    # Convert the (N, 4) bounding box coordinates to the letterboxed image dimensions
+    scale = np.tile(params["scale"], 2)
+    pad = np.tile(params["pad"], 2)
+    bboxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
 
-        # (x2, y2) is the bottom-right corner of single bounding box
-        map_x2 = round((x2 + pad_w / (2 * aspect_ratio)) * aspect_ratio)
-        map_y2 = round((y2 + pad_h / (2 * aspect_ratio)) * aspect_ratio)
-        letterboxed_bboxes.append((map_x1, map_y1, map_x2, map_y2))
-    return letterboxed_bboxes
+    return np.rint(bboxes * scale + pad).astype(np.int64)
 
 
-def coordinate_normalize(bboxes: List[BBox], original_size: ImgSize,
-                         letterboxed_size: ImgSize):
+def coordinate_normalize(bboxes, original_size: ImgSize,
+                         letterboxed_size: ImgSize) -> np.ndarray:
     """
     The `coordinate_normalize` function takes a list of bounding boxes, the original image size, and the
     letterboxed image size, and returns the normalized coordinates of the bounding boxes.
 
-    :param bboxes: The `bboxes` parameter is a list of bounding boxes. Each bounding box is represented
-    as a tuple of four values: `(x1, y1, x2, y2)`. `x1` and `y1` are the coordinates of the top-left
-    corner of the bounding box
-    :type bboxes: List[BBox]
+    :param bboxes: The `bboxes` parameter is an `(N, 4)` array (or list) of bounding boxes. Each
+    bounding box is a row of four values: `(x1, y1, x2, y2)`. `x1` and `y1` are the coordinates of
+    the top-left corner of the bounding box
+    :type bboxes: np.ndarray
     :param original_size: The original_size parameter represents the size of the original image before
     any letterboxing or resizing was applied. It is an object of type ImgSize, which likely contains the
     width and height of the original image
@@ -118,7 +242,7 @@ def coordinate_normalize(bboxes: List[BBox], original_size: ImgSize,
     adding black bars to the top and bottom or sides of the image. The `letterboxed_size` parameter
     should be an object
     :type letterboxed_size: ImgSize
-    :return: a list of normalized coordinates.
+    :return: an `(N, 4)` array of normalized coordinates.
     """
 
     letterbox_coordinate = letterbox_coordinate_transform(
@@ -126,17 +250,8 @@ def coordinate_normalize(bboxes: List[BBox], original_size: ImgSize,
         original_size=original_size,
         letterboxed_size=letterboxed_size)
 
-    normalized_coordinate = []
-    for bbox in letterbox_coordinate:
-        x1, y1, x2, y2 = bbox
-        normalized_coordinate.append((
-            x1 / letterboxed_size.width,
-            y1 / letterboxed_size.height,
-            x2 / letterboxed_size.width,
-            y2 / letterboxed_size.height,
-        ))
-
-    return normalized_coordinate
+    return letterbox_coordinate / np.tile(
+        (letterboxed_size.width, letterboxed_size.height), 2)
 
 
 def xyxy2xywh(x: np.array):
@@ -152,17 +267,17 @@ def xyxy2xywh(x: np.array):
 
 
 def inverse_letterbox_coordinate_transform(
-        bboxes: List[BBox], original_size: ImgSize,
-        letterboxed_size: ImgSize) -> List[BBox]:
+        bboxes, original_size: ImgSize,
+        letterboxed_size: ImgSize) -> np.ndarray:
     """
     The `inverse_letterbox_coordinate_transform` function takes a list of bounding boxes, the original
     image size, and the letterboxed image size, and returns the bounding boxes transformed back to the
     original image dimensions.
 
-    :param bboxes: The `bboxes` parameter is a list of bounding boxes. Each bounding box is represented
-    as a tuple of four values: `(x1, y1, x2, y2)`. `x1` and `y1` are the coordinates of the top-left
-    corner of the bounding box
-    :type bboxes: List[BBox]
+    :param bboxes: The `bboxes` parameter is an `(N, 4)` array (or list) of bounding boxes. Each
+    bounding box is a row of four values: `(x1, y1, x2, y2)`. `x1` and `y1` are the coordinates of
+    the top-left corner of the bounding box
+    :type bboxes: np.ndarray
     :param original_size: The original_size parameter represents the dimensions of the original image
     before it was letterboxed. It is an ImgSize object that contains the width and height of the
     original image
@@ -171,30 +286,26 @@ def inverse_letterbox_coordinate_transform(
     has been letterboxed. It is an `ImgSize` object that contains the width and height of the
     letterboxed image
     :type letterboxed_size: ImgSize
-    :return: a list of bounding boxes in the original image dimensions.
-    """
-
-    # Calculate the aspect ratio of the original and letterboxed sizes
-    aspect_ratio = min(
-        letterboxed_size.height / original_size.width,
-        letterboxed_size.width / original_size.height,
-    )
-
-    # Calculate the amount of padding added during the letterbox operation
-    pad_w = letterboxed_size.width - (aspect_ratio * original_size.width)
-    pad_h = letterboxed_size.height - (aspect_ratio * original_size.height)
-
-    # Convert the bounding box coordinates back to the original image dimensions
-    inverse_bboxes = []
-    for bbox in bboxes:
-        x1, y1, x2, y2 = bbox
-        # TODO(Adam-Al-Rahman): Better method than `round`
-        # (x1, y1) is the top-left corner of single bounding box
-        map_x1 = round(x1 / aspect_ratio - pad_w / (2 * aspect_ratio))
-        map_y1 = round(y1 / aspect_ratio - pad_h / (2 * aspect_ratio))
-
-        # (x2, y2) is the bottom-right corner of single bounding box
-        map_x2 = round(x2 / aspect_ratio - pad_w / (2 * aspect_ratio))
-        map_y2 = round(y2 / aspect_ratio - pad_h / (2 * aspect_ratio))
-        inverse_bboxes.append((map_x1, map_y1, map_x2, map_y2))
-    return inverse_bboxes
+    :return: an `(N, 4)` integer array of bounding boxes in the original image dimensions.
+    """
+
+    params = letterbox_params(original_size.width, original_size.height,
+                              letterboxed_size)
+
+    return inverse_letterbox_transform(bboxes, params["scale"], params["pad"])
+
+
+def inverse_letterbox_transform(bboxes, scale: Tuple[float, float],
+                                pad: Tuple[int, int]) -> np.ndarray:
+    """
+    Map `(N, 4)` `(x1, y1, x2, y2)` boxes from the letterboxed image back to
+    the original image, given the per-axis `scale` and `(left, top)` padding
+    returned by `letterbox_params`. Returns an `(N, 4)` integer array.
+    """
+    # Convert the (N, 4) bounding box coordinates back to the original image dimensions
+    scale = np.tile(scale, 2)
+    pad = np.tile(pad, 2)
+    bboxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+
+    # TODO(Adam-Al-Rahman): Better method than `round`
+    return np.rint((bboxes - pad) / scale).astype(np.int64)
@@ -1,12 +1,52 @@
-import cv2
+import threading
+
 import numpy as np
 
+from app import config
+from app.metrics import stage
+from app.utils.decode import decode_image
 from app.utils.images import (
-    letterbox,
+    jpeg_size,
+    letterbox_params,
+    reduced_decode_factor,
+    letterbox_resize,
+    letterbox_tensor,
     ImgSize,
-    inverse_letterbox_coordinate_transform,
+    inverse_letterbox_transform,
 )
 
+# Per-thread float32 NCHW input buffers, reused across images of same shape
+_input_buffers = threading.local()
+
+
+class TensorPool:
+    """
+    Free list of float32 batch tensors, so batch buffers are reused across
+    requests instead of being allocated for each one. A tensor is owned by
+    whoever acquired it until it is released.
+    """
+
+    def __init__(self, max_free: int = 4) -> None:
+        self.max_free = max_free
+        self._free = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, shape) -> np.ndarray:
+        with self._lock:
+            free = self._free.get(shape)
+            if free:
+                return free.pop()
+        return np.empty(shape, dtype=np.float32)
+
+    def release(self, tensor: np.ndarray) -> None:
+        with self._lock:
+            free = self._free.setdefault(tensor.shape, [])
+            if len(free) < self.max_free:
+                free.append(tensor)
+
+
+batch_tensor_pool = TensorPool()
+
 
 def compute_iou(box, boxes):
     # compute xmin, ymin, xmax, ymax for both boxes
@@ -70,10 +110,37 @@ def xywh2xyxy(x: np.array):
     return y
 
 
-def model_ort_session(MODEL: str):
+def ort_session_options(intra_op_threads: int = 0,
+                        inter_op_threads: int = 0,
+                        graph_optimization: str = "all"):
     import onnxruntime as ort
 
-    ort_session = ort.InferenceSession(MODEL)
+    optimization_levels = {
+        "disable": ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+        "basic": ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+        "extended": ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+        "all": ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+    }
+    if graph_optimization not in optimization_levels:
+        raise ValueError(
+            f"Unknown graph optimization level: {graph_optimization!r}, "
+            f"expected one of {sorted(optimization_levels)}")
+
+    session_options = ort.SessionOptions()
+    session_options.intra_op_num_threads = intra_op_threads
+    session_options.inter_op_num_threads = inter_op_threads
+    session_options.graph_optimization_level = optimization_levels[
+        graph_optimization]
+
+    return session_options
+
+
+def model_ort_session(MODEL: str, session_options=None, providers=None):
+    import onnxruntime as ort
+
+    ort_session = ort.InferenceSession(MODEL,
+                                       sess_options=session_options,
+                                       providers=providers)
 
     model_inputs = ort_session.get_inputs()
     input_names = [model_inputs[i].name for i in range(len(model_inputs))]
@@ -90,59 +157,144 @@ def model_ort_session(MODEL: str):
     }
 
 
-def final_image_pre_process(img_content, input_shape):
+def model_input_size(input_shape) -> ImgSize:
+    # Dynamic spatial axes are exported as names, fall back to 640x640
+    input_height, input_width = (
+        dim if isinstance(dim, int) and dim > 0 else 640
+        for dim in input_shape[2:])
+    return ImgSize(input_width, input_height)
+
+
+def input_buffer(shape) -> np.ndarray:
+    buffers = getattr(_input_buffers, "buffers", None)
+    if buffers is None:
+        buffers = _input_buffers.buffers = {}
+    buffer = buffers.get(shape)
+    if buffer is None:
+        buffer = buffers[shape] = np.empty(shape, dtype=np.float32)
+    return buffer
+
+
+def decode_letterbox(img_content, input_size: ImgSize):
+    """
+    Decode the image once and resize it for the letterbox to the model input
+    size. Returns the resized HWC image (no padding yet, that is written
+    straight into the input tensor by `fill_input_tensor`) with the geometry
+    needed to map the boxes back to the original image, as displayed (EXIF
+    orientation applied). Raises DecodeError.
+    """
+
+    import cv2
 
     # img_content: bytes
+    size = jpeg_size(img_content) if config.REDUCED_DECODE else None
+    factor = 1
+    if size is not None:
+        # Geometry from the original size, boxes map back exactly whatever
+        # resolution the image is decoded at
+        params = letterbox_params(size[0], size[1], input_size)
+        factor = reduced_decode_factor(size[0], size[1], params["resized"])
+
+    if factor > 1:
+        # libjpeg decodes straight at 1/2, 1/4 or 1/8 of the resolution
+        with stage("decode"):
+            img = decode_image(img_content, factor)
+        if (img.shape[1], img.shape[0]) != (-(-size[0] // factor),
+                                            -(-size[1] // factor)):
+            # turned a quarter by its EXIF orientation
+            size = (size[1], size[0])
+            params = letterbox_params(size[0], size[1], input_size)
+        with stage("preprocess"):
+            resized = cv2.resize(img, params["resized"])
+        original_width, original_height = size
+    else:
+        # read the image from the byte stream, any format, always 3 channels
+        with stage("decode"):
+            img = decode_image(img_content)
+
+        # Resize to the model input size without losing its aspect ratio
+        with stage("preprocess"):
+            resized, params = letterbox_resize(img, input_size)
+        original_height, original_width = img.shape[:2]
 
-    # read the image from the byte stream
-    img = cv2.imdecode(np.frombuffer(img_content, np.uint8),
-                       cv2.IMREAD_UNCHANGED)  # return ndarray, original image
+    return {
+        "resized": resized,
+        "image_height": input_size.height,
+        "image_width": input_size.width,
+        "input_height": input_size.height,
+        "input_width": input_size.width,
+        "original_height": original_height,
+        "original_width": original_width,
+        "scale": params["scale"],
+        "pad": params["pad"],
+    }
 
-    # Converting original image into 640x640 size without losing its aspect ratio
-    img_letterboxed = letterbox(np.asarray(img), ImgSize(640, 640))
 
-    # Convert the np.ndarray to a byte stream
-    img_bytes = cv2.imencode(".jpg", img_letterboxed)[1].tobytes()
+def fill_input_tensor(pre_process_image, out) -> np.ndarray:
+    # Letterbox the resized image straight into `out`, a (3, H, W) or
+    # (1, 3, H, W) float32 view
+    with stage("preprocess"):
+        letterbox_tensor(
+            pre_process_image.pop("resized"), pre_process_image["pad"],
+            out.reshape(3, pre_process_image["input_height"],
+                        pre_process_image["input_width"]))
+    return out
 
-    # read the image from the byte stream
-    image = cv2.imdecode(np.frombuffer(img_bytes, np.uint8),
-                         cv2.IMREAD_UNCHANGED)
 
-    image_height, image_width = image.shape[:2]
-    input_height, input_width = input_shape[2:]
+def final_image_pre_process(img_content, input_shape, out=None):
+    """
+    Decode the image once and letterbox it into a float32 NCHW tensor.
 
-    resized = cv2.resize(image, (input_width, input_height))
+    The tensor is written into `out` (a `(3, H, W)` or `(1, 3, H, W)` view)
+    when given, otherwise into a per-thread buffer that is reused by the next
+    call on the same thread. The letterbox geometry is returned alongside so
+    the boxes can be mapped back without decoding the image again.
+    """
+    input_size = model_input_size(input_shape)
+    pre_process_image = decode_letterbox(img_content, input_size)
 
-    # Scale input pixel value to 0 to 1
-    input_image = resized / 255.0
-    input_image = input_image.transpose(2, 0, 1)
-    input_tensor = input_image[np.newaxis, :, :, :].astype(np.float32)
+    if out is None:
+        out = input_buffer((1, 3, input_size.height, input_size.width))
 
-    return {
-        "input_tensor": input_tensor,
-        "image_height": image_height,
-        "image_width": image_width,
-        "input_height": input_height,
-        "input_width": input_width,
-    }
+    pre_process_image["input_tensor"] = fill_input_tensor(
+        pre_process_image, out)
 
+    return pre_process_image
 
-def bboxs_filter(outputs, input_width, input_height, image_width,
-                 image_height):
-    # Threshold
-    predictions = np.squeeze(outputs).T
-    conf_thresold = 0.5  # confidence score [testing phase]
 
-    # Filter out object confidence scores below threshold
-    scores = np.max(predictions[:, 4:], axis=1)
-    predictions = predictions[scores > conf_thresold, :]
-    scores = scores[scores > conf_thresold]
+def bboxs_filter(outputs,
+                 input_width,
+                 input_height,
+                 image_width,
+                 image_height,
+                 conf_threshold=0.5,
+                 top_k=0):
+    """
+    Candidate boxes of a `(1, 4+C, anchors)` output above `conf_threshold`,
+    at most the `top_k` best scoring ones (0 = all).
+
+    Works on the anchor axis as exported, without transposing the whole
+    output: one argmax over the class rows gives each anchor's class and
+    its score is gathered from it. Only the surviving columns are copied.
+    """
+    predictions = outputs[0]  # (4+C, anchors)
+    class_scores = predictions[4:]
+
+    # Get the class with the highest confidence, and its score
+    if len(class_scores) == 1:
+        scores = class_scores[0]
+        class_ids = np.zeros(len(scores), dtype=np.intp)
+    else:
+        class_ids = np.argmax(class_scores, axis=0)
+        scores = np.take_along_axis(class_scores, class_ids[None], axis=0)[0]
 
-    # Get the class with the highest confidence
-    class_ids = np.argmax(predictions[:, 4:], axis=1)
+    # Filter out object confidence scores below threshold
+    keep = np.flatnonzero(scores > conf_threshold)
+    if 0 < top_k < len(keep):
+        keep = keep[np.argpartition(scores[keep], -top_k)[-top_k:]]
 
-    # Get bounding boxes for each object
-    boxes = predictions[:, :4]
+    # Get bounding boxes for each object, (K, 4) xywh
+    boxes = predictions[:4, keep].T
 
     # rescale box
     input_shape = np.array(
@@ -151,42 +303,38 @@ def bboxs_filter(outputs, input_width, input_height, image_width,
     boxes *= np.array([image_width, image_height, image_width, image_height])
     boxes = boxes.astype(np.int32)
 
-    return {"scores": scores, "boxes": boxes, "class_ids": class_ids}
-
+    return {
+        "scores": scores[keep],
+        "boxes": boxes,
+        "class_ids": class_ids[keep]
+    }
 
-def map_lb_original_img(img_content, letterboxed_boxes):
-    # read the image from the byte stream
-    img = cv2.imdecode(np.frombuffer(img_content, np.uint8),
-                       cv2.IMREAD_UNCHANGED)  # return ndarray, original image
 
-    inverse_coordinates = inverse_letterbox_coordinate_transform(
+def map_lb_original_img(pre_process_image, letterboxed_boxes):
+    # letterbox geometry comes from `final_image_pre_process`
+    inverse_coordinates = inverse_letterbox_transform(
         # [(x1, y1, x2, y2)]
         letterboxed_boxes,
-        ImgSize(img.shape[1], img.shape[0]),
-        ImgSize(640, 640),
+        pre_process_image["scale"],
+        pre_process_image["pad"],
     )
 
     return inverse_coordinates
 
 
 def letterboxed_result(boxes, indices, scores, class_ids, CLASSES=None):
-    letterboxed_boxes = []
-    new_scores = []
-    labels = []
-
-    for bbox, score, label in zip(xywh2xyxy(boxes[indices]), scores[indices],
-                                  class_ids[indices]):
-        bbox = bbox.round().astype(np.int32).tolist()
-        letterboxed_boxes.append(tuple(bbox))
-        new_scores.append(score)  # <-- Append to the new list
+    # Kept boxes as an (K, 4) int32 xyxy array in the letterboxed image
+    indices = np.asarray(indices, dtype=np.intp)
+    letterboxed_boxes = np.rint(xywh2xyxy(boxes[indices])).astype(np.int32)
+    new_scores = scores[indices]
 
     return {
         "letterboxed_boxes":
         letterboxed_boxes,
         "labels":
-        labels,
+        class_ids[indices],
         "scores":
         new_scores,
         "max_score_index":
-        new_scores.index(max(new_scores)) if new_scores else "None",
+        int(np.argmax(new_scores)) if len(new_scores) else None,
     }
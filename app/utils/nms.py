@@ -0,0 +1,111 @@
+import numpy as np
+
+from app import config
+from app.utils.images_predict_fn import nms as greedy_nms
+
+
+def pre_nms_top_k(scores: np.ndarray, top_k: int) -> np.ndarray:
+    """
+    Indices of the `top_k` highest scores (unordered), or of every score when
+    there are fewer candidates.
+    """
+    if top_k <= 0 or len(scores) <= top_k:
+        return np.arange(len(scores))
+    return np.argpartition(scores, -top_k)[-top_k:]
+
+
+def iou_matrix(boxes: np.ndarray) -> np.ndarray:
+    # boxes: (N, 4) xyxy -> (N, N) pairwise IoU
+    boxes = boxes.astype(np.float32, copy=False)
+    x1, y1, x2, y2 = boxes.T
+    areas = (x2 - x1) * (y2 - y1)
+
+    inter_w = np.minimum(x2[:, None], x2[None, :]) - np.maximum(
+        x1[:, None], x1[None, :])
+    inter_h = np.minimum(y2[:, None], y2[None, :]) - np.maximum(
+        y1[:, None], y1[None, :])
+    intersection = np.clip(inter_w, 0, None) * np.clip(inter_h, 0, None)
+    union = areas[:, None] + areas[None, :] - intersection
+
+    return np.divide(intersection,
+                     union,
+                     out=np.zeros_like(intersection),
+                     where=union > 0)
+
+
+def matrix_nms(boxes: np.ndarray, scores: np.ndarray,
+               iou_threshold: float) -> np.ndarray:
+    """
+    Greedy NMS on a precomputed IoU matrix: same result as `nms`, but the
+    per kept box work is a row lookup instead of a fresh IoU computation and
+    re-indexing of the remaining boxes. The matrix is O(N^2) in time and
+    memory, only worth it for small candidate sets.
+    """
+    order = np.argsort(scores, kind="stable")[::-1]
+    overlaps = iou_matrix(boxes[order]) >= iou_threshold
+
+    suppressed = np.zeros(len(order), dtype=bool)
+    keep = []
+    for i in range(len(order)):
+        if suppressed[i]:
+            continue
+        keep.append(i)
+        suppressed |= overlaps[i]
+    return order[keep]
+
+
+def cv2_nms(boxes: np.ndarray, scores: np.ndarray,
+            iou_threshold: float) -> np.ndarray:
+    import cv2
+
+    # cv2.dnn.NMSBoxes wants (x, y, w, h) with (x, y) the top-left corner
+    boxes = boxes.astype(np.float64, copy=False)
+    rects = np.column_stack([boxes[:, :2], boxes[:, 2:] - boxes[:, :2]])
+    indices = cv2.dnn.NMSBoxes(rects.tolist(),
+                               scores.astype(np.float32).tolist(), 0.0,
+                               iou_threshold)
+    return np.asarray(indices, dtype=np.intp).reshape(-1)
+
+
+BACKENDS = {
+    "greedy": lambda boxes, scores, iou_threshold: np.asarray(
+        greedy_nms(boxes, scores, iou_threshold), dtype=np.intp),
+    "matrix": matrix_nms,
+    "cv2": cv2_nms,
+}
+
+
+def non_max_suppression(boxes: np.ndarray,
+                        scores: np.ndarray,
+                        iou_threshold: float,
+                        class_ids: np.ndarray = None,
+                        backend: str = None,
+                        top_k: int = None) -> np.ndarray:
+    """
+    Indices of the `(N, 4)` xyxy `boxes` kept by non-maximum suppression,
+    highest score first.
+
+    Only the `top_k` best scoring candidates are considered. With
+    `class_ids` the suppression is class-aware: boxes of different classes
+    are shifted apart by a per-class offset so they never overlap, and a
+    single NMS call handles every class.
+    """
+    backend = backend or config.NMS_BACKEND
+    top_k = config.NMS_TOP_K if top_k is None else top_k
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown NMS backend: {backend!r}, "
+                         f"expected one of {sorted(BACKENDS)}")
+
+    if len(boxes) == 0:
+        return np.empty(0, dtype=np.intp)
+
+    candidates = pre_nms_top_k(scores, top_k)
+    boxes, scores = boxes[candidates], scores[candidates]
+
+    if class_ids is not None:
+        offsets = class_ids[candidates].astype(np.float32) * (
+            float(boxes.max()) + 1)
+        boxes = boxes + offsets[:, None]
+
+    keep = BACKENDS[backend](boxes, scores, iou_threshold)
+    return candidates[keep]
@@ -0,0 +1,66 @@
+import contextvars
+import queue
+import threading
+from typing import Iterable, Iterator, TypeVar
+
+T = TypeVar("T")
+
+_DONE = object()
+
+
+class _Failure:
+
+    def __init__(self, error: BaseException) -> None:
+        self.error = error
+
+
+def prefetch(items: Iterable[T], maxsize: int) -> Iterator[T]:
+    """
+    Consume `items` on a background thread, at most `maxsize` items ahead of
+    the caller. Lets a producer stage (ZIP reading, decoding) overlap with
+    the consumer stage (inference) while keeping memory bounded.
+
+    Errors raised by the producer are re-raised to the caller, and closing
+    the returned generator early stops the producer.
+    """
+    buffer = queue.Queue(maxsize=max(1, maxsize))
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in items:
+                if not put(item):
+                    return
+        except BaseException as error:
+            put(_Failure(error))
+        else:
+            put(_DONE)
+
+    # The producer sees the caller's context, e.g. its request timings
+    context = contextvars.copy_context()
+    producer = threading.Thread(target=context.run,
+                                args=(produce, ),
+                                name="remx-prefetch",
+                                daemon=True)
+    producer.start()
+
+    try:
+        while True:
+            item = buffer.get()
+            if item is _DONE:
+                return
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
+        producer.join()
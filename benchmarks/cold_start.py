@@ -0,0 +1,116 @@
+"""
+Cold start of a server worker: time to ready and to the first prediction.
+
+    python -m benchmarks.cold_start --runs 5
+    REMX_ORT_CACHE_DIR=/tmp/remx-ort python -m benchmarks.cold_start
+
+Starts `uvicorn app.main:app` in a fresh process for each run and reports,
+from the process spawn: the first answer of /ready (listening), /ready
+turning 200 and the first prediction of tests/sample_image1.jpg. The
+server's own phases (seconds since `app` was imported, see app/startup.py)
+and the time to import app.main alone are reported alongside.
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+
+from benchmarks.common import metadata, save_results, summarize
+
+SAMPLE_IMAGE = os.path.join("tests", "sample_image1.jpg")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def import_seconds() -> float:
+    # in a fresh interpreter, as the server worker does
+    code = ("import time; start = time.perf_counter(); import app.main; "
+            "print(time.perf_counter() - start)")
+    output = subprocess.run([sys.executable, "-c", code],
+                            capture_output=True, text=True, check=True)
+    return float(output.stdout.strip())
+
+
+def cold_start(content: bytes, timeout: float) -> dict:
+    port = free_port()
+    url = f"http://127.0.0.1:{port}"
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port),
+         "--log-level", "warning"])
+    listening = ready = None
+    try:
+        with httpx.Client(base_url=url, timeout=timeout) as client:
+            while ready is None:
+                if time.perf_counter() - start > timeout:
+                    raise TimeoutError(f"not ready after {timeout}s")
+                if server.poll() is not None:
+                    raise RuntimeError(f"server exited with {server.returncode}")
+                try:
+                    response = client.get("/ready")
+                except httpx.TransportError:
+                    time.sleep(0.01)
+                    continue
+                if listening is None:
+                    listening = time.perf_counter() - start
+                if response.status_code == 200:
+                    ready = time.perf_counter() - start
+                    phases = response.json()["seconds"]
+                else:
+                    time.sleep(0.01)
+
+            response = client.post(
+                "/api/predict/upload",
+                files=[("files", ("sample_image1.jpg", content))])
+            response.raise_for_status()
+            first_prediction = time.perf_counter() - start
+    finally:
+        server.terminate()
+        server.wait()
+
+    return {
+        "listening": listening,
+        "ready": ready,
+        "first_prediction": first_prediction,
+        **{f"server_{phase}": seconds for phase, seconds in phases.items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--output", help="write results as JSON")
+    args = parser.parse_args()
+
+    with open(SAMPLE_IMAGE, "rb") as f:
+        content = f.read()
+
+    runs = [cold_start(content, args.timeout) for _ in range(args.runs)]
+    imports = [import_seconds() for _ in range(args.runs)]
+    results = {
+        "meta": {**metadata(), "ort_cache_dir": os.environ.get(
+            "REMX_ORT_CACHE_DIR", "")},
+        "import_app_main": summarize(imports),
+    }
+    for name in runs[0]:
+        results[name] = summarize([run[name] for run in runs if name in run])
+    for name, summary in results.items():
+        if name != "meta":
+            print(f"{name:<26} p50 {summary['p50_ms']:>9.1f} ms  "
+                  f"min {summary['min_ms']:>9.1f} ms")
+
+    if args.output:
+        save_results(results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Helpers shared by the benchmark scripts: stats, result files, baselines."""
+import json
+import os
+import platform
+import subprocess
+import time
+from typing import Dict, List
+
+import numpy as np
+
+
+def summarize(seconds: List[float]) -> Dict[str, float]:
+    # Latency summary in milliseconds
+    ms = np.asarray(seconds) * 1000
+    return {
+        "count": int(ms.size),
+        "mean_ms": round(float(ms.mean()), 3),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "min_ms": round(float(ms.min()), 3),
+    }
+
+
+def metadata() -> Dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                                capture_output=True,
+                                text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    import cv2
+    import onnxruntime
+
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "onnxruntime": onnxruntime.__version__,
+    }
+
+
+def save_results(results: Dict, path: str) -> None:
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"results written to {path}")
+
+
+def flatten(results: Dict, prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    for key, value in results.items():
+        if key == "meta":
+            continue
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare_to_baseline(results: Dict, baseline_path: str,
+                        tolerance: float) -> List[str]:
+    """
+    Compare latency (`*_ms`, lower is better) and throughput
+    (`*_per_second`, higher is better) metrics against a previous result
+    file. Returns the metrics that regressed by more than `tolerance`.
+    """
+    with open(baseline_path) as f:
+        baseline = flatten(json.load(f))
+    current = flatten(results)
+
+    regressions = []
+    for name, before in sorted(baseline.items()):
+        after = current.get(name)
+        if after is None or before == 0:
+            continue
+        if name.endswith("_ms"):
+            change = (after - before) / before
+        elif name.endswith("_per_second"):
+            change = (before - after) / before
+        else:
+            continue
+        marker = ""
+        if change > tolerance:
+            marker = "  REGRESSION"
+            regressions.append(name)
+        # positive change = worse than the baseline
+        print(f"{name:<60} {before:>12.3f} -> {after:>12.3f} "
+              f"{change:>+8.1%}{marker}")
+    return regressions
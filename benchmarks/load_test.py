@@ -0,0 +1,125 @@
+"""
+End-to-end load test of /api/predict/upload.
+
+    python -m benchmarks.load_test --concurrency 1 4 16 --requests 64
+    python -m benchmarks.load_test --url http://localhost:8000 --zip
+
+Runs in process against the ASGI app by default, or against a running
+server with --url. For each concurrency level it reports p50/p95/p99
+request latency and images/sec.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import httpx
+
+from benchmarks.common import (compare_to_baseline, metadata, save_results,
+                               summarize)
+
+SAMPLE_IMAGE = os.path.join("tests", "sample_image1.jpg")
+SAMPLE_ZIP = os.path.join("tests", "tst.zip")
+
+
+def make_client(url: str = None) -> httpx.AsyncClient:
+    if url:
+        return httpx.AsyncClient(base_url=url, timeout=600)
+
+    from app.main import app
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app),
+                             base_url="http://remx",
+                             timeout=600)
+
+
+async def post(client, filename: str, content: bytes):
+    start = time.perf_counter()
+    response = await client.post("/api/predict/upload",
+                                 files=[("files", (filename, content))])
+    elapsed = time.perf_counter() - start
+
+    if response.status_code != 200:
+        return elapsed, 0, response.status_code
+    body = response.json()
+    return elapsed, len(body) if isinstance(body, list) else 1, 200
+
+
+async def run_level(client, filename, content, concurrency, requests):
+    queue = asyncio.Queue()
+    for _ in range(requests):
+        queue.put_nowait(None)
+    samples = []
+
+    async def worker():
+        while not queue.empty():
+            queue.get_nowait()
+            samples.append(await post(client, filename, content))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - start
+
+    ok = [sample for sample in samples if sample[2] == 200]
+    images = sum(sample[1] for sample in ok)
+    return {
+        **(summarize([sample[0] for sample in ok]) if ok else {}),
+        "requests": len(samples),
+        "errors": len(samples) - len(ok),
+        "images_per_second": round(images / wall, 3),
+        "requests_per_second": round(len(samples) / wall, 3),
+    }
+
+
+async def load_test(args):
+    path = SAMPLE_ZIP if args.zip else SAMPLE_IMAGE
+    with open(path, "rb") as f:
+        content = f.read()
+    filename = os.path.basename(path)
+
+    results = {"meta": {**metadata(), "url": args.url, "upload": filename}}
+    async with make_client(args.url) as client:
+        # first request loads and warms up the model
+        await post(client, filename, content)
+
+        for concurrency in args.concurrency:
+            level = await run_level(client, filename, content, concurrency,
+                                    args.requests)
+            results[f"concurrency_{concurrency}"] = level
+            print(f"concurrency {concurrency:>3}: "
+                  f"p50 {level.get('p50_ms', 0):>9.1f} ms  "
+                  f"p95 {level.get('p95_ms', 0):>9.1f} ms  "
+                  f"p99 {level.get('p99_ms', 0):>9.1f} ms  "
+                  f"{level['images_per_second']:>8.2f} images/s  "
+                  f"errors {level['errors']}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--url", help="server to test, in process if unset")
+    parser.add_argument("--zip", action="store_true",
+                        help=f"upload {SAMPLE_ZIP} instead of one image")
+    parser.add_argument("--concurrency", type=int, nargs="+",
+                        default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=64,
+                        help="requests per concurrency level")
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--baseline", help="compare with a previous JSON")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    args = parser.parse_args()
+
+    results = asyncio.run(load_test(args))
+
+    if args.output:
+        save_results(results, args.output)
+    if args.baseline:
+        regressions = compare_to_baseline(results, args.baseline,
+                                          args.tolerance)
+        if regressions:
+            sys.exit(f"{len(regressions)} metric(s) regressed by more than "
+                     f"{args.tolerance:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Microbenchmark of the NMS backends on synthetic candidate sets.
+
+    python -m benchmarks.nms_benchmark --sizes 100 1000 5000 --repeat 5
+
+Boxes are clustered around a few "animals" to mimic a dense herd, where most
+candidates overlap and NMS does the most work.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from app.utils.nms import BACKENDS, non_max_suppression
+
+
+def clustered_boxes(n: int, clusters: int = 30, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    centers = rng.uniform(60, 580, size=(clusters, 2))
+    sizes = rng.uniform(30, 120, size=(clusters, 2))
+
+    member = rng.integers(0, clusters, size=n)
+    jitter = rng.normal(0, 6, size=(n, 2))
+    box_centers = centers[member] + jitter
+    box_sizes = sizes[member] * rng.uniform(0.8, 1.2, size=(n, 2))
+
+    boxes = np.hstack(
+        [box_centers - box_sizes / 2, box_centers + box_sizes / 2])
+    return boxes.astype(np.float32), rng.uniform(0.5, 1.0, size=n)
+
+
+def benchmark(backend: str, boxes, scores, iou_threshold: float,
+              repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        non_max_suppression(boxes, scores, iou_threshold, backend=backend,
+                            top_k=0)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        default=[100, 1000, 3000, 8400])
+    parser.add_argument("--backends", nargs="+", default=sorted(BACKENDS))
+    parser.add_argument("--iou", type=float, default=0.6)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'boxes':>8} " + " ".join(f"{b:>10}" for b in args.backends) +
+          "   (ms, best of repeat)")
+    for size in args.sizes:
+        boxes, scores = clustered_boxes(size)
+        reference = set(
+            non_max_suppression(boxes, scores, args.iou, backend="greedy",
+                                top_k=0).tolist())
+
+        row = []
+        for backend in args.backends:
+            kept = set(
+                non_max_suppression(boxes, scores, args.iou, backend=backend,
+                                    top_k=0).tolist())
+            mark = "" if kept == reference else "*"
+            seconds = benchmark(backend, boxes, scores, args.iou, args.repeat)
+            row.append(f"{seconds * 1000:>9.2f}{mark or ' '}")
+        print(f"{size:>8} " + " ".join(row))
+    print("* result differs from the greedy reference")
+
+
+if __name__ == "__main__":
+    main()
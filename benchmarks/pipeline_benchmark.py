@@ -0,0 +1,173 @@
+"""
+Per-stage benchmark of the prediction pipeline.
+
+    python -m benchmarks.pipeline_benchmark --output bench.json
+    python -m benchmarks.pipeline_benchmark --baseline bench.json
+
+Times each stage separately (decode, final_image_pre_process, ORT run,
+bboxs_filter, nms, letterboxed_result, map_lb_original_img) on the sample
+images and on synthetic camera-trap sized frames, then measures batched
+throughput of predict_images_batch for a few batch sizes.
+"""
+import argparse
+import os
+import sys
+import time
+import zipfile
+from collections import defaultdict
+
+import cv2
+import numpy as np
+
+from app.cache import PredictionCache
+from app.model.model import MODEL, load_model, predict_images_batch, run_model
+from app.utils.images_predict_fn import (bboxs_filter, final_image_pre_process,
+                                         letterboxed_result,
+                                         map_lb_original_img, xywh2xyxy)
+from app.utils.nms import non_max_suppression
+from benchmarks.common import (compare_to_baseline, metadata, save_results,
+                               summarize)
+
+SAMPLE_IMAGE = os.path.join("tests", "sample_image1.jpg")
+SAMPLE_ZIP = os.path.join("tests", "tst.zip")
+SYNTHETIC_SIZES = {"1080p": (1920, 1080), "12mp": (4000, 3000)}
+
+
+def sample_images():
+    images = {}
+    with open(SAMPLE_IMAGE, "rb") as f:
+        images["sample_image1"] = f.read()
+    with zipfile.ZipFile(SAMPLE_ZIP) as zip_file:
+        for name in zip_file.namelist():
+            if name.lower().endswith(".jpg"):
+                images[os.path.basename(name)] = zip_file.read(name)
+
+    rng = np.random.default_rng(0)
+    for label, (width, height) in SYNTHETIC_SIZES.items():
+        # smooth noise compresses like a natural photo
+        small = rng.integers(0, 256, size=(height // 16, width // 16, 3),
+                             dtype=np.uint8)
+        img = cv2.resize(small, (width, height), interpolation=cv2.INTER_CUBIC)
+        images[f"synthetic_{label}"] = cv2.imencode(".jpg", img)[1].tobytes()
+    return images
+
+
+def time_stages(model, content: bytes, repeat: int, confidence: float,
+                iou_threshold: float):
+    timings = defaultdict(list)
+    for _ in range(repeat):
+        start = time.perf_counter()
+        cv2.imdecode(np.frombuffer(content, np.uint8), cv2.IMREAD_UNCHANGED)
+        timings["decode"].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        pre_process_image = final_image_pre_process(content,
+                                                    model["input_shape"])
+        timings["final_image_pre_process"].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        outputs = run_model(model, pre_process_image["input_tensor"])
+        timings["ort_run"].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        bboxs_outputs = bboxs_filter(outputs,
+                                     pre_process_image["input_width"],
+                                     pre_process_image["input_height"],
+                                     pre_process_image["image_width"],
+                                     pre_process_image["image_height"],
+                                     conf_threshold=confidence)
+        timings["bboxs_filter"].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        indices = non_max_suppression(xywh2xyxy(bboxs_outputs["boxes"]),
+                                      bboxs_outputs["scores"],
+                                      iou_threshold=iou_threshold)
+        timings["nms"].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        letterboxed_output = letterboxed_result(bboxs_outputs["boxes"],
+                                                indices,
+                                                bboxs_outputs["scores"],
+                                                bboxs_outputs["class_ids"])
+        timings["letterboxed_result"].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        map_lb_original_img(pre_process_image,
+                            letterboxed_output["letterboxed_boxes"])
+        timings["map_lb_original_img"].append(time.perf_counter() - start)
+
+    return {stage: summarize(seconds) for stage, seconds in timings.items()}
+
+
+def batch_throughput(images, model_path: str, batch_size: int,
+                     copies: int) -> float:
+    items = [(content, f"{name}_{i}.jpg")
+             for i in range(copies) for name, content in images.items()]
+    # no cache, every image goes through the model
+    start = time.perf_counter()
+    for _ in predict_images_batch(items,
+                                  batch_size=batch_size,
+                                  MODEL=model_path,
+                                  cache=PredictionCache(max_bytes=0)):
+        pass
+    return len(items) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--model", default=MODEL)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--batch-sizes", type=int, nargs="+",
+                        default=[1, 4, 8, 16])
+    parser.add_argument("--copies", type=int, default=4,
+                        help="copies of every image in the throughput run")
+    parser.add_argument("--confidence", type=float, default=0.5)
+    parser.add_argument("--iou", type=float, default=0.6)
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--baseline", help="compare with a previous JSON")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    model = load_model(args.model)
+    images = sample_images()
+
+    results = {
+        "meta": {
+            **metadata(), "model": args.model,
+            "model_load_seconds": model["load_seconds"],
+            "model_warmup_seconds": model["warmup_seconds"],
+        },
+        "stages": {},
+        "throughput": {},
+    }
+    for name, content in images.items():
+        results["stages"][name] = time_stages(model, content, args.repeat,
+                                              args.confidence, args.iou)
+        print(f"\n{name}")
+        for stage, summary in results["stages"][name].items():
+            print(f"  {stage:<26} p50 {summary['p50_ms']:>9.3f} ms"
+                  f"   p95 {summary['p95_ms']:>9.3f} ms")
+
+    print()
+    for batch_size in args.batch_sizes:
+        images_per_second = batch_throughput(images, args.model, batch_size,
+                                             args.copies)
+        results["throughput"][f"batch_{batch_size}"] = {
+            "images_per_second": round(images_per_second, 3)
+        }
+        print(f"batch size {batch_size:>3}: {images_per_second:>8.2f} images/s")
+    print(f"\ntotal {time.perf_counter() - start:.1f}s")
+
+    if args.output:
+        save_results(results, args.output)
+    if args.baseline:
+        regressions = compare_to_baseline(results, args.baseline,
+                                          args.tolerance)
+        if regressions:
+            sys.exit(f"{len(regressions)} metric(s) regressed by more than "
+                     f"{args.tolerance:.0%}")
+
+
+if __name__ == "__main__":
+    main()
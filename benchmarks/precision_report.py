@@ -0,0 +1,136 @@
+"""
+Accuracy vs speed of the model precision variants against fp32.
+
+    python -m app.model.variants optimize
+    python -m app.model.variants quantize --images my_calibration_set/
+    python -m benchmarks.precision_report --images my_eval_set/ --output p.json
+
+Runs fp32 and every variant built next to it (or the ones given with
+--variant name=path) on the same images. For each variant, boxes are
+matched one to one with the fp32 boxes of the same image by IoU and the
+report gives the mean IoU of matched boxes, the share of fp32 boxes found
+(recall at --iou) and of variant boxes that match one (precision), the
+IoU of the best-confidence box, and throughput with its speedup.
+"""
+import argparse
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from app.model.model import (available_precisions, load_model, model_path,
+                             predict_images_batch)
+from app.model.variants import iter_calibration_images
+from app.utils.nms import iou_matrix
+from benchmarks.common import metadata, save_results
+
+
+def match_boxes(reference: List, boxes: List) -> np.ndarray:
+    # IoU of greedily matched (reference, box) pairs, best overlaps first
+    if not reference or not boxes:
+        return np.empty(0)
+    reference = np.asarray(reference, dtype=np.float32)
+    boxes = np.asarray(boxes, dtype=np.float32)
+    ious = iou_matrix(np.concatenate([reference, boxes]))[:len(reference),
+                                                           len(reference):]
+    matched = []
+    while ious.size and ious.max() > 0:
+        row, column = np.unravel_index(np.argmax(ious), ious.shape)
+        matched.append(ious[row, column])
+        ious[row, :] = 0
+        ious[:, column] = 0
+    return np.asarray(matched)
+
+
+def run_variant(path: str, images: List, repeat: int):
+    load_model(path)
+    predictions = None
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        predictions = list(predict_images_batch(images, MODEL=path, cache=None))
+        seconds.append(time.perf_counter() - start)
+    return predictions, min(seconds)
+
+
+def compare(reference: List[Dict], predictions: List[Dict],
+            iou_threshold: float) -> Dict:
+    ious, best_ious = [], []
+    reference_boxes = variant_boxes = 0
+    for expected, predicted in zip(reference, predictions):
+        if expected is None:
+            continue
+        matched = match_boxes(expected["coordinates"],
+                              predicted["coordinates"])
+        ious.extend(matched.tolist())
+        reference_boxes += len(expected["coordinates"])
+        variant_boxes += len(predicted["coordinates"])
+        if expected["coordinates"] and predicted["coordinates"]:
+            best = match_boxes([expected["max_confidence_coordinate"]],
+                               [predicted["max_confidence_coordinate"]])
+            best_ious.append(float(best[0]) if len(best) else 0.0)
+
+    ious = np.asarray(ious)
+    found = int((ious >= iou_threshold).sum())
+    return {
+        "mean_iou": round(float(ious.mean()), 4) if ious.size else None,
+        "recall": round(found / reference_boxes, 4) if reference_boxes else None,
+        "precision": round(found / variant_boxes, 4) if variant_boxes else None,
+        "best_box_iou": round(float(np.mean(best_ious)), 4)
+        if best_ious else None,
+        "boxes": variant_boxes,
+        "reference_boxes": reference_boxes,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--images", nargs="+", default=["tests"],
+                        help="images, directories or ZIPs to evaluate on")
+    parser.add_argument("--fp32", default=model_path("fp32"))
+    parser.add_argument("--variant", action="append", default=[],
+                        help="name=path, defaults to the built variants")
+    parser.add_argument("--iou", type=float, default=0.5)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="write results as JSON")
+    args = parser.parse_args()
+
+    variants = dict(variant.split("=", 1) for variant in args.variant)
+    if not variants:
+        variants = {name: path for name, path in available_precisions().items()
+                    if name != "fp32"}
+    images = [(content, f"{index}.jpg") for index, content in enumerate(
+        iter_calibration_images(args.images))]
+
+    reference, reference_seconds = run_variant(args.fp32, images, args.repeat)
+    results = {
+        "meta": {**metadata(), "images": len(images)},
+        "fp32": {"images_per_second": round(len(images) / reference_seconds, 3)},
+    }
+    print(f"{'variant':<12}{'mean IoU':>10}{'recall':>9}{'precision':>11}"
+          f"{'best IoU':>10}{'images/s':>10}{'speedup':>9}")
+    print(f"{'fp32':<12}{'':>40}{results['fp32']['images_per_second']:>10.2f}"
+          f"{1:>8.2f}x")
+
+    for name, path in variants.items():
+        predictions, seconds = run_variant(path, images, args.repeat)
+        report = compare(reference, predictions, args.iou)
+        report["images_per_second"] = round(len(images) / seconds, 3)
+        report["speedup"] = round(reference_seconds / seconds, 3)
+        results[name] = report
+
+        def cell(value):
+            return "n/a" if value is None else f"{value:.3f}"
+
+        print(f"{name:<12}{cell(report['mean_iou']):>10}"
+              f"{cell(report['recall']):>9}{cell(report['precision']):>11}"
+              f"{cell(report['best_box_iou']):>10}"
+              f"{report['images_per_second']:>10.2f}"
+              f"{report['speedup']:>8.2f}x")
+
+    if args.output:
+        save_results(results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+# Candidate boxes (x, y, w, h, score) the dummy model returns for every image,
+# all other anchors get a score below any sensible threshold
+DUMMY_DETECTIONS = [
+    (320.0, 320.0, 100.0, 80.0, 0.9),
+    (322.0, 318.0, 100.0, 80.0, 0.8),  # overlaps the first one
+    (100.0, 100.0, 40.0, 40.0, 0.7),
+]
+DUMMY_ANCHORS = 8400
+
+
+def make_dummy_model(path, batch="batch"):
+    """
+    Write a tiny ONNX model with the same signature as the remx YOLOv8 export,
+    images (N, 3, 640, 640) -> output0 (N, 5, 8400), returning a constant set
+    of candidate boxes for every image of the batch.
+    """
+    import onnx
+    from onnx import TensorProto, helper, numpy_helper
+
+    predictions = np.zeros((1, 5, DUMMY_ANCHORS), dtype=np.float32)
+    predictions[0, 2:4, :] = 1.0
+    predictions[0, 4, :] = 0.01
+    for anchor, detection in enumerate(DUMMY_DETECTIONS):
+        predictions[0, :, anchor] = detection
+
+    nodes = [
+        helper.make_node("ReduceMean", ["images"], ["mean"],
+                         axes=[1, 2, 3],
+                         keepdims=0),
+        helper.make_node("Mul", ["mean", "zero"], ["zeros"]),
+        helper.make_node("Unsqueeze", ["zeros", "unsqueeze_axes"],
+                         ["offset"]),
+        helper.make_node("Add", ["predictions", "offset"], ["output0"]),
+    ]
+    initializers = [
+        numpy_helper.from_array(predictions, "predictions"),
+        numpy_helper.from_array(np.zeros((), dtype=np.float32), "zero"),
+        numpy_helper.from_array(np.array([1, 2], dtype=np.int64),
+                                "unsqueeze_axes"),
+    ]
+    graph = helper.make_graph(
+        nodes,
+        "remx_dummy",
+        [
+            helper.make_tensor_value_info("images", TensorProto.FLOAT,
+                                          [batch, 3, 640, 640])
+        ],
+        [
+            helper.make_tensor_value_info("output0", TensorProto.FLOAT,
+                                          [batch, 5, DUMMY_ANCHORS])
+        ],
+        initializers,
+    )
+    model = helper.make_model(graph,
+                              opset_imports=[helper.make_opsetid("", 13)])
+    model.ir_version = 8
+    onnx.save(model, str(path))
+    return str(path)
+
+
+@pytest.fixture(scope="session")
+def dummy_model(tmp_path_factory):
+    return make_dummy_model(tmp_path_factory.mktemp("model") / "dummy.onnx")
+
+
+@pytest.fixture
+def served_dummy_model(dummy_model, monkeypatch):
+    """Serve the dummy model in place of the shipped remx model."""
+    from app.model.model import MODEL, __version__
+    from app.model.registry import registry
+
+    model = registry.load(dummy_model, __version__)
+    monkeypatch.setitem(registry._models, (MODEL, __version__), model)
+    return model
+
+
+@pytest.fixture(autouse=True)
+def clear_prediction_cache():
+    from app.cache import prediction_cache
+
+    prediction_cache.clear()
+    yield
+    prediction_cache.clear()
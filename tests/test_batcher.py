@@ -0,0 +1,108 @@
+import asyncio
+import os
+import threading
+
+import numpy as np
+import pytest
+from fastapi import HTTPException
+
+from app import config
+from app.executor import PredictionExecutor
+from app.metrics import microbatch_size
+from app.model.batcher import (MicroBatcher, predict_image_batched,
+                               shutdown_micro_batchers)
+from app.model.model import load_model, predict_images, run_model
+
+
+def read_sample():
+    with open(os.path.join("tests", "sample_image1.jpg"), "rb") as f:
+        return f.read()
+
+
+def test_micro_batcher_coalesces_concurrent_calls(dummy_model):
+    model = load_model(dummy_model)
+    rng = np.random.default_rng(0)
+    tensors = [rng.random((1, 3, 640, 640), dtype=np.float32)
+               for _ in range(3)]
+    batcher = MicroBatcher(dummy_model, max_batch=4, max_wait=0.2)
+    batches = microbatch_size.count()
+
+    async def scenario():
+        try:
+            return await asyncio.gather(*(batcher.infer(tensor)
+                                          for tensor in tensors))
+        finally:
+            await batcher.shutdown()
+
+    outputs = asyncio.run(scenario())
+
+    assert microbatch_size.count() == batches + 1
+    for tensor, output in zip(tensors, outputs):
+        np.testing.assert_allclose(output, run_model(model, tensor))
+
+
+def test_predict_image_batched_matches_predict_images(dummy_model):
+    content = read_sample()
+    executor = PredictionExecutor(max_workers=1, max_queue=0, timeout=5)
+
+    async def scenario():
+        try:
+            return await predict_image_batched(content, "a.jpg", executor,
+                                               MODEL=dummy_model, cache=None)
+        finally:
+            await shutdown_micro_batchers()
+
+    assert asyncio.run(scenario()) == predict_images(
+        content, "a.jpg", MODEL=dummy_model, cache=None)
+    assert executor.pending == 0
+
+
+def test_admitted_request_is_not_rejected_after_inference(
+        dummy_model, monkeypatch):
+    monkeypatch.setattr(config, "MICRO_BATCH_SIZE", 4)
+    monkeypatch.setattr(config, "MICRO_BATCH_WAIT_MS", 300)
+    content = read_sample()
+    executor = PredictionExecutor(max_workers=1, max_queue=1, timeout=5)
+    release = threading.Event()
+
+    async def scenario():
+        try:
+            request = asyncio.ensure_future(predict_image_batched(
+                content, "a.jpg", executor, MODEL=dummy_model, cache=None))
+            await asyncio.sleep(0.1)
+            # the queue fills up while the request waits for its batch
+            blockers = [asyncio.ensure_future(executor.run(release.wait))
+                        for _ in range(2)]
+            await asyncio.sleep(0.05)
+            with pytest.raises(HTTPException) as rejected:
+                await executor.run(lambda: None)
+            asyncio.get_running_loop().call_later(0.4, release.set)
+            prediction = await request
+            await asyncio.gather(*blockers)
+            return rejected.value, prediction
+        finally:
+            release.set()
+            await shutdown_micro_batchers()
+
+    rejected, prediction = asyncio.run(scenario())
+    assert rejected.status_code == 503
+    assert prediction == predict_images(content, "a.jpg", MODEL=dummy_model,
+                                        cache=None)
+    assert executor.pending == 0
+
+
+def test_batch_wait_times_out(dummy_model, monkeypatch):
+    monkeypatch.setattr(config, "MICRO_BATCH_SIZE", 4)
+    monkeypatch.setattr(config, "MICRO_BATCH_WAIT_MS", 1000)
+    executor = PredictionExecutor(max_workers=1, max_queue=0, timeout=0.2)
+
+    async def scenario():
+        try:
+            with pytest.raises(HTTPException) as error:
+                await predict_image_batched(read_sample(), "a.jpg", executor,
+                                            MODEL=dummy_model, cache=None)
+            return error.value
+        finally:
+            await shutdown_micro_batchers()
+
+    assert asyncio.run(scenario()).status_code == 504
@@ -0,0 +1,95 @@
+import os
+
+import numpy as np
+import pytest
+
+from app.cache import PredictionCache, prediction_key
+from app.model.model import predict_images, predict_images_batch
+from app.results import Prediction
+
+PREDICTION = Prediction("a.jpg", np.array([[1, 2, 3, 4]]), np.array([0.9]),
+                        np.array([0]), {"tiles": 4})
+
+
+@pytest.fixture
+def sample_image_bytes():
+    with open(os.path.join("tests", "sample_image1.jpg"), "rb") as f:
+        return f.read()
+
+
+def test_prediction_key_depends_on_model_and_thresholds():
+    key = prediction_key(b"image", "model@1.0.0", confidence=0.5)
+
+    assert key == prediction_key(b"image", "model@1.0.0", confidence=0.5)
+    assert key != prediction_key(b"image", "model@1.0.1", confidence=0.5)
+    assert key != prediction_key(b"image", "model@1.0.0", confidence=0.6)
+    assert key != prediction_key(b"other", "model@1.0.0", confidence=0.5)
+
+
+def test_cache_returns_prediction_under_new_name():
+    cache = PredictionCache(max_bytes=1024)
+    cache.put("key", PREDICTION)
+
+    cached = cache.get("key", "b.jpg")
+    assert cached == {**PREDICTION, "image": "b.jpg"}
+    assert cached["tiles"] == 4
+    assert cache.get("missing", "b.jpg") is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_cache_evicts_least_recently_used():
+    cache = PredictionCache(max_bytes=1024)
+    cache.put("a", PREDICTION)
+    entry_size = cache.stats()["bytes"]
+
+    cache = PredictionCache(max_bytes=2 * entry_size)
+    for key in ("a", "b", "c"):
+        cache.put(key, PREDICTION)
+        cache.get("a", "a.jpg")
+
+    assert cache.get("a", "a.jpg") is not None
+    assert cache.get("b", "b.jpg") is None
+    assert cache.get("c", "c.jpg") is not None
+    assert cache.stats()["bytes"] == 2 * entry_size
+
+
+def test_disk_tier_survives_restart(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    PredictionCache(max_bytes=0, disk_path=path).put("key", PREDICTION)
+
+    cache = PredictionCache(max_bytes=1024, disk_path=path)
+    assert cache.get("key", "a.jpg") == PREDICTION
+    assert cache.stats()["disk_hits"] == 1
+
+
+def test_cache_hit_skips_inference(dummy_model, sample_image_bytes,
+                                   monkeypatch):
+    cache = PredictionCache(max_bytes=1024 * 1024)
+    first = predict_images(sample_image_bytes, "first.jpg",
+                           MODEL=dummy_model, cache=cache)
+
+    monkeypatch.setattr("app.model.model.run_model", None)
+    second = predict_images(sample_image_bytes, "second.jpg",
+                            MODEL=dummy_model, cache=cache)
+    batch = list(
+        predict_images_batch([(sample_image_bytes, "third.jpg")],
+                             MODEL=dummy_model, cache=cache))
+
+    assert second == {**first, "image": "second.jpg"}
+    assert batch == [{**first, "image": "third.jpg"}]
+    assert cache.stats()["hits"] == 2
+
+
+def test_disk_tier_is_never_unpickled(tmp_path):
+    import pickle
+    import sqlite3
+
+    path = str(tmp_path / "cache.sqlite3")
+    PredictionCache(max_bytes=0, disk_path=path).put("key", PREDICTION)
+    with sqlite3.connect(path) as connection:
+        connection.execute("UPDATE predictions SET value = ?",
+                           (pickle.dumps(PREDICTION), ))
+
+    assert PredictionCache(max_bytes=0, disk_path=path).get("key",
+                                                            "a.jpg") is None
+
@@ -0,0 +1,59 @@
+import io
+
+import cv2
+import numpy as np
+import pytest
+from PIL import Image
+
+from app.utils.decode import DecodeError, decode_image, image_format
+from app.utils.images import ImgSize
+from app.utils.images_predict_fn import decode_letterbox
+
+
+def pillow_bytes(image, format, **params):
+    buffer = io.BytesIO()
+    image.save(buffer, format, **params)
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize("format", ["JPEG", "PNG", "BMP", "GIF", "WEBP", "TIFF"])
+def test_every_format_decodes_to_bgr(format):
+    image = Image.new("RGB", (40, 30), (255, 0, 0))
+    content = pillow_bytes(image, format)
+
+    img = decode_image(content)
+
+    assert image_format(content) == {"JPEG": "jpeg"}.get(format, format.lower())
+    assert img.shape == (30, 40, 3) and img.dtype == np.uint8
+    # red, in OpenCV's channel order
+    assert img[15, 20, 2] > 200 and img[15, 20, 0] < 60
+
+
+def test_grayscale_alpha_and_16_bit_become_3_channels():
+    for img in (np.zeros((30, 40), np.uint8), np.zeros((30, 40, 4), np.uint8),
+                np.zeros((30, 40, 3), np.uint16)):
+        content = cv2.imencode(".png", img)[1].tobytes()
+        decoded = decode_image(content)
+        assert decoded.shape == (30, 40, 3) and decoded.dtype == np.uint8
+
+
+def test_exif_orientation_applied():
+    exif = Image.Exif()
+    exif[0x0112] = 6  # rotated 90 degrees clockwise
+    content = pillow_bytes(Image.new("RGB", (4000, 3000)), "JPEG", exif=exif)
+
+    assert decode_image(content).shape[:2] == (4000, 3000)
+    # the reduced decode maps boxes back to the image as displayed too
+    pre_process_image = decode_letterbox(content, ImgSize(640, 640))
+    assert (pre_process_image["original_width"],
+            pre_process_image["original_height"]) == (3000, 4000)
+    assert pre_process_image["resized"].shape[:2] == (640, 480)
+
+
+def test_undecodable_content_raises_decode_error():
+    content = pillow_bytes(Image.new("RGB", (40, 30)), "JPEG")
+
+    with pytest.raises(DecodeError, match="Unsupported image format"):
+        decode_image(b"just some notes")
+    with pytest.raises(DecodeError):
+        decode_image(content[:40])
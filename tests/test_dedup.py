@@ -0,0 +1,82 @@
+import io
+import zipfile
+
+import cv2
+import numpy as np
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.utils.dedup import (hamming_distance, perceptual_hash,
+                             predict_deduplicated)
+
+
+def frame(seed, shift=0, size=(480, 640)):
+    rng = np.random.default_rng(seed)
+    small = rng.integers(0, 256, size=(12, 16, 3), dtype=np.uint8)
+    img = cv2.resize(small, size[::-1], interpolation=cv2.INTER_CUBIC)
+    img = np.clip(img.astype(int) + shift, 0, 255).astype(np.uint8)
+    return cv2.imencode(".jpg", img)[1].tobytes()
+
+
+def test_perceptual_hash_tolerates_small_changes():
+    base, size = perceptual_hash(frame(0))
+
+    assert size == (640, 480)
+    assert hamming_distance(base, perceptual_hash(frame(0, shift=6))[0]) <= 4
+    assert hamming_distance(base, perceptual_hash(frame(1))[0]) > 10
+    assert perceptual_hash(b"not an image") is None
+
+
+def test_predict_deduplicated_groups_bursts():
+    images = [
+        (frame(0), "a1.jpg"),
+        (frame(0, shift=5), "a2.jpg"),
+        (frame(1), "b1.jpg"),
+        (b"", "notes.txt"),
+        (frame(0, shift=-5), "a3.jpg"),
+        (frame(0, size=(240, 320)), "small.jpg"),
+    ]
+    predicted = []
+
+    def predict(images):
+        for _, image_name in images:
+            predicted.append(image_name)
+            yield {
+                "image": image_name,
+                "error": "Unsupported image format"
+            } if image_name.endswith(".txt") else {
+                "image": image_name,
+                "coordinates": [(1, 2, 3, 4)],
+            }
+
+    results = list(predict_deduplicated(images, predict, threshold=4))
+
+    assert predicted == ["a1.jpg", "b1.jpg", "notes.txt", "small.jpg"]
+    assert [r["image"] for r in results] == [
+        "a1.jpg", "a2.jpg", "b1.jpg", "notes.txt", "a3.jpg", "small.jpg"
+    ]
+    assert [r["inferred"] for r in results] == [
+        True, False, True, True, False, True
+    ]
+    assert "error" in results[3]
+    assert results[1]["duplicate_of"] == "a1.jpg"
+    assert results[4]["coordinates"] == [(1, 2, 3, 4)]
+
+
+def test_upload_zip_dedup(served_dummy_model):
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as zip_file:
+        zip_file.writestr("burst/1.jpg", frame(0))
+        zip_file.writestr("burst/2.jpg", frame(0, shift=4))
+        zip_file.writestr("burst/3.jpg", frame(2))
+    archive.seek(0)
+
+    response = TestClient(app).post(
+        "/api/predict/upload?dedup=true",
+        files=[("files", ("burst.zip", archive, "application/zip"))])
+
+    assert response.status_code == 200
+    results = response.json()
+    assert [r["inferred"] for r in results] == [True, False, True]
+    assert results[1]["duplicate_of"] == "burst/1.jpg"
+    assert results[1]["coordinates"] == results[0]["coordinates"]
@@ -0,0 +1,42 @@
+import asyncio
+import threading
+
+import pytest
+from fastapi import HTTPException
+
+from app.executor import PredictionExecutor
+
+
+def test_executor_rejects_when_full():
+    executor = PredictionExecutor(max_workers=1, max_queue=0, timeout=5)
+    release = threading.Event()
+
+    async def scenario():
+        running = asyncio.ensure_future(executor.run(release.wait))
+        await asyncio.sleep(0.05)
+        with pytest.raises(HTTPException) as error:
+            await executor.run(lambda: None)
+        release.set()
+        await running
+        return error.value
+
+    error = asyncio.run(scenario())
+    assert error.status_code == 503
+    assert executor.pending == 0
+
+
+def test_executor_times_out():
+    executor = PredictionExecutor(max_workers=1, max_queue=0, timeout=0.05)
+    release = threading.Event()
+
+    async def scenario():
+        with pytest.raises(HTTPException) as error:
+            await executor.run(release.wait)
+        # the slot is held until the thread finishes
+        assert executor.pending == 1
+        release.set()
+        return error.value
+
+    assert asyncio.run(scenario()).status_code == 504
+    executor.shutdown()
+    assert executor.pending == 0
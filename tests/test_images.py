@@ -0,0 +1,187 @@
+import numpy as np
+import pytest
+
+from app.utils.images import (ImgSize, letterbox, letterbox_params,
+                              letterbox_resize, letterbox_tensor,
+                              letterbox_coordinate_transform,
+                              inverse_letterbox_coordinate_transform,
+                              inverse_letterbox_transform, jpeg_size,
+                              reduced_decode_factor, tile_grid)
+from app.utils.images_predict_fn import (bboxs_filter, decode_letterbox,
+                                         final_image_pre_process,
+                                         letterboxed_result)
+
+
+def test_letterbox_params_wide_image():
+    params = letterbox_params(1280, 720, ImgSize(640, 640))
+
+    assert params["resized"] == (640, 360)
+    assert params["scale"] == (0.5, 0.5)
+    assert params["pad"] == (0, 140)
+
+
+def test_letterbox_places_image_at_padding():
+    img = np.full((720, 1280, 3), 200, dtype=np.uint8)
+    padded = letterbox(img, ImgSize(640, 640))
+
+    assert padded.shape == (640, 640, 3)
+    assert (padded[:140] == 114).all() and (padded[500:] == 114).all()
+    assert (padded[140:500] == 200).all()
+
+
+def test_letterbox_non_square_into_buffer():
+    img = np.full((720, 1280, 3), 200, dtype=np.uint8)
+    size = ImgSize(640, 384)
+    out = np.zeros(size.shape, dtype=np.uint8)
+
+    padded = letterbox(img, size, out=out)
+
+    assert padded is out and padded.shape == (384, 640, 3)
+    assert (padded[:12] == 114).all() and (padded[372:] == 114).all()
+    assert (padded[12:372] == 200).all()
+
+
+def test_letterbox_tensor_matches_letterbox():
+    rng = np.random.default_rng(0)
+    img = rng.integers(0, 256, size=(300, 500, 3), dtype=np.uint8)
+    size = ImgSize(320, 256)
+    resized, params = letterbox_resize(img, size)
+    out = np.full((3, 256, 320), -1, dtype=np.float32)
+
+    letterbox_tensor(resized, params["pad"], out)
+
+    expected = letterbox(img, size).transpose(2, 0, 1) / 255.0
+    np.testing.assert_allclose(out, expected, atol=1e-6)
+
+
+def test_inverse_letterbox_transform_round_trip():
+    params = letterbox_params(1280, 720, ImgSize(640, 640))
+    boxes = [(0, 140, 640, 500), (100, 200, 150, 260)]
+
+    assert inverse_letterbox_transform(boxes, params["scale"],
+                                       params["pad"]).tolist() == [
+                                           [0, 0, 1280, 720],
+                                           [200, 120, 300, 240],
+                                       ]
+
+
+def test_letterbox_coordinate_transform_inverts():
+    original, letterboxed = ImgSize(1000, 750), ImgSize(640, 640)
+    boxes = np.array([[0, 0, 1000, 750], [250, 100, 500, 400]])
+
+    mapped = letterbox_coordinate_transform(boxes, original, letterboxed)
+
+    assert mapped.shape == (2, 4)
+    assert inverse_letterbox_coordinate_transform(
+        mapped, original, letterboxed).tolist() == boxes.tolist()
+
+
+def test_letterboxed_result_picks_best_box():
+    boxes = np.array([[10, 10, 4, 4], [20, 20, 6, 8], [5, 5, 2, 2]])
+    scores = np.array([0.6, 0.9, 0.7])
+
+    result = letterboxed_result(boxes, [0, 1], scores, np.zeros(3, int))
+
+    assert result["letterboxed_boxes"].tolist() == [[8, 8, 12, 12],
+                                                    [17, 16, 23, 24]]
+    assert result["max_score_index"] == 1
+    assert letterboxed_result(boxes, [], scores,
+                              np.zeros(3, int))["max_score_index"] is None
+
+
+def test_final_image_pre_process_single_decode():
+    import cv2
+
+    img = np.zeros((300, 400, 3), dtype=np.uint8)
+    img[:, :, 2] = 255
+    content = cv2.imencode(".png", img)[1].tobytes()
+
+    pre_process_image = final_image_pre_process(content, [1, 3, 640, 640])
+    tensor = pre_process_image["input_tensor"]
+
+    assert tensor.shape == (1, 3, 640, 640) and tensor.dtype == np.float32
+    assert (pre_process_image["original_width"],
+            pre_process_image["original_height"]) == (400, 300)
+    assert pre_process_image["pad"] == (0, 80)
+    assert tensor[0, 2, 320, 320] == 1.0 and tensor[0, 0, 320, 320] == 0.0
+    assert np.isclose(tensor[0, 0, 0, 0], 114 / 255.0)
+
+
+def test_jpeg_size_reads_frame_header():
+    import cv2
+
+    img = np.zeros((300, 500, 3), dtype=np.uint8)
+
+    assert jpeg_size(cv2.imencode(".jpg", img)[1].tobytes()) == (500, 300)
+    assert jpeg_size(cv2.imencode(".png", img)[1].tobytes()) is None
+    assert jpeg_size(b"\xff\xd8\xff") is None
+
+
+def test_reduced_decode_factor_covers_resized_size():
+    assert reduced_decode_factor(4000, 3000, (640, 480)) == 4
+    assert reduced_decode_factor(5120, 3840, (640, 480)) == 8
+    assert reduced_decode_factor(1280, 720, (640, 360)) == 2
+    assert reduced_decode_factor(1000, 750, (640, 480)) == 1
+
+
+def test_reduced_decode_keeps_geometry(monkeypatch):
+    import cv2
+    from app import config
+
+    y, x = np.mgrid[0:3000, 0:4000]
+    img = np.stack([x % 256, y % 256, (x + y) % 256], axis=2).astype(np.uint8)
+    content = cv2.imencode(".jpg", img)[1].tobytes()
+    size = ImgSize(640, 640)
+
+    reduced = decode_letterbox(content, size)
+    monkeypatch.setattr(config, "REDUCED_DECODE", 0)
+    full = decode_letterbox(content, size)
+
+    for name in ("original_width", "original_height", "scale", "pad"):
+        assert reduced[name] == full[name]
+    assert reduced["resized"].shape == full["resized"].shape == (480, 640, 3)
+
+
+def test_tile_grid_covers_image_with_overlap():
+    tiles = tile_grid(1920, 1080, 640, overlap=0.2)
+
+    assert len(tiles) == 8
+    assert all(x2 - x1 == y2 - y1 == 640 for x1, y1, x2, y2 in tiles)
+    assert max(x2 for _, _, x2, _ in tiles) == 1920
+    assert max(y2 for _, _, _, y2 in tiles) == 1080
+    xs = sorted({x1 for x1, _, _, _ in tiles})
+    assert all(b - a <= 640 * 0.8 for a, b in zip(xs, xs[1:]))
+
+    assert tile_grid(640, 480, 640) == []
+
+
+def test_tile_grid_caps_tile_count():
+    tiles = tile_grid(3840, 2160, 640, max_tiles=16)
+
+    assert len(tiles) <= 16
+    assert tiles[0][2] - tiles[0][0] > 640
+
+
+def test_tile_grid_rejects_degenerate_settings():
+    assert tile_grid(1920, 1080, 640, max_tiles=0) == []
+    for overlap in (1.0, 1.5, -0.1):
+        with pytest.raises(ValueError):
+            tile_grid(1920, 1080, 640, overlap=overlap)
+
+
+def test_bboxs_filter_thresholds_and_top_k():
+    outputs = np.zeros((1, 6, 10), dtype=np.float32)
+    outputs[0, :4] = np.arange(10) + 1  # boxes (i+1, i+1, i+1, i+1)
+    outputs[0, 4] = np.linspace(0, 0.9, 10)  # class 0
+    outputs[0, 5, 3] = 0.95  # class 1 wins at anchor 3
+
+    result = bboxs_filter(outputs, 640, 640, 640, 640, conf_threshold=0.5)
+
+    assert sorted(result["scores"].tolist()) == pytest.approx(
+        [0.6, 0.7, 0.8, 0.9, 0.95])
+    assert result["class_ids"][result["scores"].argmax()] == 1
+    assert result["boxes"].shape == (5, 4) and result["boxes"].dtype == np.int32
+
+    top = bboxs_filter(outputs, 640, 640, 640, 640, 0.5, top_k=2)
+    assert sorted(top["scores"].tolist()) == pytest.approx([0.9, 0.95])
+    assert sorted(top["boxes"][:, 0].tolist()) == [4, 10]
@@ -0,0 +1,96 @@
+import os
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.jobs import DONE, JobManager, JobStore, job_manager
+from app.main import app
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / "jobs"))
+
+
+@pytest.fixture
+def client(store, monkeypatch):
+    monkeypatch.setattr(job_manager, "store", store)
+    return TestClient(app)
+
+
+def wait_for(store, job_id, status=DONE, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = store.get(job_id)
+        if job["status"] == status:
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"job {job_id} did not reach {status}")
+
+
+def test_job_runs_to_completion(store, served_dummy_model):
+    manager = JobManager(store, workers=1)
+    manager.start()
+    try:
+        with open(os.path.join("tests", "tst.zip"), "rb") as f:
+            job = manager.submit(f, "tst.zip")
+        assert job["total"] == 3
+
+        job = wait_for(store, job["id"])
+    finally:
+        manager.stop()
+
+    assert job["done"] == 3
+    results = store.results(job["id"], offset=1, limit=10)
+    assert [r["index"] for r in results] == [1, 2]
+    assert not os.path.exists(job["archive_path"])
+
+
+def test_job_resumes_after_restart(store, served_dummy_model):
+    with open(os.path.join("tests", "tst.zip"), "rb") as f:
+        job = store.create(f, "tst.zip")
+
+    # a previous worker got through the first image and was killed
+    claimed = store.claim(lease=60)
+    store.add_results(job["id"], [(0, "first.jpg", {"image": "first.jpg"})])
+    assert claimed["id"] == job["id"]
+    assert store.claim(lease=60) is None
+
+    manager = JobManager(store, workers=1, lease=0)
+    manager.start()
+    try:
+        job = wait_for(store, job["id"])
+    finally:
+        manager.stop()
+
+    results = store.results(job["id"], offset=0, limit=10)
+    assert results[0]["image"] == "first.jpg"
+    assert [r["index"] for r in results] == [0, 1, 2]
+
+
+def test_jobs_api(client, store, served_dummy_model):
+    job_manager.start()
+    try:
+        with open(os.path.join("tests", "tst.zip"), "rb") as f:
+            response = client.post("/api/jobs",
+                                   files=[("file", ("tst.zip", f))])
+        assert response.status_code == 202
+        job_id = response.json()["id"]
+        wait_for(store, job_id)
+    finally:
+        job_manager.stop()
+
+    response = client.get(f"/api/jobs/{job_id}")
+    assert response.json()["done"] == 3
+    response = client.get(f"/api/jobs/{job_id}/results", params={"limit": 2})
+    assert len(response.json()["results"]) == 2
+    assert client.get("/api/jobs/missing").status_code == 404
+
+
+def test_jobs_api_rejects_non_zip(client, tmp_path):
+    bad = tmp_path / "bad.zip"
+    bad.write_bytes(b"not a zip")
+    with open(bad, "rb") as f:
+        response = client.post("/api/jobs", files=[("file", ("bad.zip", f))])
+    assert response.status_code == 400
@@ -1,6 +1,7 @@
 import pytest
 from fastapi.testclient import TestClient
 from app.main import app
+import json
 import os
 
 @pytest.fixture
@@ -32,4 +33,112 @@ def test_upload_zip(client,sample_zip):
     response_data=response.json()
     assert isinstance(response_data, (list,dict)) 
 
-#according to CI pipeline my onnx file i corrupted but it is running fine in my device ,I have no idea why
\ No newline at end of file
+#according to CI pipeline my onnx file i corrupted but it is running fine in my device ,I have no idea why
+
+def test_upload_zip_batched(client, sample_zip, served_dummy_model):
+    files = [("files", sample_zip)]
+    response = client.post("/api/predict/upload", files=files)
+    assert response.status_code == 200
+    response_data = response.json()
+    assert isinstance(response_data, (list, dict))
+
+
+def test_stream_zip_ndjson(client, sample_zip, served_dummy_model):
+    files = [("files", sample_zip)]
+    response = client.post("/api/predict/stream", files=files)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+
+    records = [json.loads(line) for line in response.text.splitlines()]
+    assert [r["index"] for r in records[:-1]] == [0, 1, 2]
+    assert all(r["file"] == "tst.zip" for r in records[:-1])
+    assert records[-1]["summary"]["images"] == 3
+
+
+def test_stream_image_sse(client, sample_image, served_dummy_model):
+    files = [("files", sample_image)]
+    response = client.post("/api/predict/stream",
+                           files=files,
+                           headers={"Accept": "text/event-stream"})
+    assert response.status_code == 200
+    events = [line for line in response.text.splitlines()
+              if line.startswith("event: ")]
+    assert events == ["event: prediction", "event: summary"]
+
+def test_stream_rejected_closes_uploads(client, sample_image, monkeypatch):
+    from fastapi import HTTPException
+    from app import prediction_api
+
+    detached = []
+    original = prediction_api.detach_uploads
+    def detach_uploads(files):
+        detached.extend(original(files))
+        return detached
+    def stream(*args, **kwargs):
+        raise HTTPException(status_code=503, detail="Prediction queue is full, retry later")
+    monkeypatch.setattr(prediction_api, "detach_uploads", detach_uploads)
+    monkeypatch.setattr(prediction_api.prediction_executor, "stream", stream)
+
+    response = client.post("/api/predict/stream", files=[("files", sample_image)])
+    assert response.status_code == 503
+    assert detached and all(file.file.closed for file in detached)
+
+def test_upload_unknown_precision(client, sample_image):
+    response = client.post("/api/predict/upload?precision=fp16", files=[("files", sample_image)])
+    assert response.status_code == 400
+
+def test_upload_confidence_threshold(client, sample_image, served_dummy_model):
+    response = client.post("/api/predict/upload?confidence=0.75&iou=0.6", files=[("files", sample_image)])
+    assert response.status_code == 200
+    assert len(response.json()["coordinates"]) == 1
+
+def test_upload_tiled(client, sample_image, served_dummy_model):
+    response = client.post("/api/predict/upload?tiled=true", files=[("files", sample_image)])
+    assert response.status_code == 200
+    assert "tiles" in response.json()
+
+def test_upload_columnar(client, sample_image, served_dummy_model):
+    import io
+    import numpy as np
+
+    response = client.post("/api/predict/upload", files=[("files", sample_image)], headers={"accept": "application/x-npz"})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-npz"
+    arrays = np.load(io.BytesIO(response.content))
+    assert arrays["image_idx"].tolist() == [0, 0]
+    assert arrays["score"].max() > 0.85
+
+def test_upload_micro_batched(client, sample_image, served_dummy_model, monkeypatch):
+    from app import config
+
+    monkeypatch.setattr(config, "MICRO_BATCH_SIZE", 4)
+    response = client.post("/api/predict/upload", files=[("files", sample_image)])
+    assert response.status_code == 200
+    assert len(response.json()["coordinates"]) == 2
+
+def test_upload_zip_any_case_and_format(client, served_dummy_model):
+    import io
+    import zipfile
+    import numpy as np
+    from PIL import Image
+
+    def encoded(format):
+        buffer = io.BytesIO()
+        Image.fromarray(np.full((60, 80, 3), 90, np.uint8)).save(buffer, format)
+        return buffer.getvalue()
+
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as zip_file:
+        zip_file.writestr("IMG_0001.JPG", encoded("JPEG"))
+        zip_file.writestr("trap/IMG_0002.gif", encoded("GIF"))
+        zip_file.writestr("trap/IMG_0003.jpg", encoded("JPEG")[:40])
+        zip_file.writestr("__MACOSX/trap/._IMG_0002.gif", b"\x00\x05\x16\x07")
+        zip_file.writestr("notes.txt", b"camera 4")
+
+    response = client.post("/api/predict/upload", files=[("files", ("trap.zip", archive.getvalue(), "application/zip"))])
+    assert response.status_code == 200
+    results = response.json()
+    assert [result["image"] for result in results] == ["IMG_0001.JPG", "trap/IMG_0002.gif", "trap/IMG_0003.jpg"]
+    assert len(results[0]["coordinates"]) == len(results[1]["coordinates"]) == 2
+    # a corrupt image is reported, the rest of the archive is predicted
+    assert "error" in results[2]
@@ -0,0 +1,76 @@
+import os
+import threading
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.main import app, server_timing
+from app.metrics import (MetricsRegistry, collect_request_timings, stage,
+                         stage_seconds)
+from app.prediction_api import prediction_router
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = MetricsRegistry()
+    histogram = registry.histogram("t_seconds", "test", buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 5.0):
+        histogram.observe(value, stage="a")
+
+    lines = registry.render().splitlines()
+
+    assert 't_seconds_bucket{stage="a",le="0.1"} 1' in lines
+    assert 't_seconds_bucket{stage="a",le="1.0"} 3' in lines
+    assert 't_seconds_bucket{stage="a",le="+Inf"} 4' in lines
+    assert 't_seconds_count{stage="a"} 4' in lines
+
+
+def test_request_timings_follow_worker_threads():
+    import contextvars
+
+    def work():
+        with stage("test"):
+            pass
+
+    before = stage_seconds.count(stage="test")
+    with collect_request_timings() as timings:
+        work()
+        worker = threading.Thread(target=contextvars.copy_context().run,
+                                  args=(work, ))
+        worker.start()
+        worker.join()
+    work()
+
+    assert list(timings.seconds) == ["test"]
+    assert timings.server_timing().startswith("test;dur=")
+    assert stage_seconds.count(stage="test") == before + 3
+
+
+def test_server_timing(served_dummy_model):
+    # registered at import when REMX_SERVER_TIMING is set
+    timed = FastAPI()
+    timed.include_router(prediction_router, prefix="/api")
+    timed.middleware("http")(server_timing)
+
+    with open(os.path.join("tests", "sample_image1.jpg"), "rb") as f:
+        response = TestClient(timed).post("/api/predict/upload",
+                                          files=[("files", ("a.jpg", f))])
+    assert response.status_code == 200
+    assert "inference;dur=" in response.headers["Server-Timing"]
+
+
+def test_metrics_endpoint(served_dummy_model):
+    client = TestClient(app)
+    with open(os.path.join("tests", "sample_image1.jpg"), "rb") as f:
+        response = client.post("/api/predict/upload",
+                               files=[("files", ("a.jpg", f))])
+    assert response.status_code == 200
+    assert "Server-Timing" not in response.headers
+
+    body = client.get("/metrics").text
+    assert 'remx_stage_seconds_count{stage="nms"}' in body
+    assert 'remx_images_total{result="predicted"}' in body
+    assert "# TYPE remx_cache_lookups_total counter" in body
+    assert 'remx_cache_lookups_total{result="miss"}' in body
+    assert "remx_model_info{" in body
+    assert 'remx_model_load_seconds{path="' in body
+    assert 'remx_executor_slots{state="workers"} 2' in body
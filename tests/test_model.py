@@ -0,0 +1,146 @@
+import os
+
+import numpy as np
+import pytest
+
+from app import config
+from app.model.registry import ModelRegistry
+from app.model.model import (cache_key, model_path, predict_images,
+                             predict_images_batch, run_model)
+
+
+@pytest.fixture
+def sample_image_bytes():
+    with open(os.path.join("tests", "sample_image1.jpg"), "rb") as f:
+        return f.read()
+
+
+def test_registry_reuses_session(dummy_model):
+    registry = ModelRegistry()
+    model = registry.get(dummy_model, "test")
+
+    assert registry.get(dummy_model, "test") is model
+    assert registry.get(dummy_model, "other") is not model
+    assert model["warmup_seconds"] > 0
+
+
+def test_predict_images(dummy_model, sample_image_bytes):
+    prediction = predict_images(sample_image_bytes,
+                                "sample_image1.jpg",
+                                MODEL=dummy_model)
+
+    assert prediction["image"] == "sample_image1.jpg"
+    # the two overlapping candidates are merged by NMS
+    assert len(prediction["coordinates"]) == 2
+    assert prediction["max_confidence_coordinate"] == prediction[
+        "coordinates"][0]
+
+
+@pytest.mark.parametrize("batch_size", [1, 2, 4])
+def test_predict_images_batch_matches_single(dummy_model, sample_image_bytes,
+                                             batch_size):
+    images = [(sample_image_bytes, f"image{i}.jpg") for i in range(5)]
+    images.insert(2, (b"", "notes.txt"))
+
+    predictions = list(
+        predict_images_batch(images, batch_size=batch_size,
+                             MODEL=dummy_model))
+
+    single = predict_images(sample_image_bytes, "image0.jpg",
+                            MODEL=dummy_model)
+    assert len(predictions) == 6
+    # not an image: an error record in its place, the batch goes on
+    assert predictions[2] == {"image": "notes.txt",
+                               "error": "Unsupported image format"}
+    assert [p["image"] for p in predictions if "error" not in p] == [
+        f"image{i}.jpg" for i in range(5)
+    ]
+    assert all(p["coordinates"] == single["coordinates"]
+               for p in predictions if "error" not in p)
+
+
+def test_run_model_fixed_batch_axis(tmp_path):
+    from tests.conftest import make_dummy_model
+
+    model = ModelRegistry().get(
+        make_dummy_model(tmp_path / "fixed.onnx", batch=2), "test")
+    outputs = run_model(model, np.zeros((3, 3, 640, 640), dtype=np.float32))
+
+    assert outputs.shape == (3, 5, 8400)
+
+
+def test_model_path_variants():
+    assert model_path("fp32").endswith("remx_model_1.0.0.onnx")
+    assert model_path("int8").endswith("remx_model_1.0.0.int8.onnx")
+    with pytest.raises(ValueError):
+        model_path("fp16")
+
+
+def test_optimized_variant_matches_fp32(dummy_model, sample_image_bytes,
+                                        tmp_path):
+    from app.model.variants import optimize_model
+
+    optimized = optimize_model(dummy_model, str(tmp_path / "dummy.opt.onnx"))
+
+    assert predict_images(sample_image_bytes, "a.jpg", MODEL=optimized,
+                          cache=None) == predict_images(
+                              sample_image_bytes, "a.jpg", MODEL=dummy_model,
+                              cache=None)
+    # predictions of each variant are cached separately
+    assert cache_key(sample_image_bytes, 0.5, 0.6, optimized) != cache_key(
+        sample_image_bytes, 0.5, 0.6, dummy_model)
+
+
+def test_cache_key_depends_on_result_settings(sample_image_bytes,
+                                              monkeypatch):
+    key = cache_key(sample_image_bytes, 0.5, 0.6)
+    for name, value in (("REDUCED_DECODE", 0), ("NMS_BACKEND", "greedy"),
+                        ("NMS_TOP_K", 10)):
+        with monkeypatch.context() as patch:
+            patch.setattr(config, name, value)
+            assert cache_key(sample_image_bytes, 0.5, 0.6) != key
+    assert cache_key(sample_image_bytes, 0.5, 0.6) == key
+
+
+def test_predict_images_thresholds(dummy_model, sample_image_bytes):
+    def boxes(**thresholds):
+        return len(
+            predict_images(sample_image_bytes, "a.jpg", MODEL=dummy_model,
+                           **thresholds)["coordinates"])
+
+    assert boxes(confidence=0.75) == 1
+    # the two overlapping candidates are only merged above their IoU
+    assert boxes(iou_threshold=0.99) == 3
+
+
+def test_predict_images_tiled(dummy_model, sample_image_bytes, monkeypatch):
+    import cv2
+    from app import config
+    from app.model.tiling import predict_images_tiled
+
+    rng = np.random.default_rng(0)
+    noise = rng.integers(0, 256, (1080, 1920, 3), dtype=np.uint8)
+    content = cv2.imencode(".png", noise)[1].tobytes()
+
+    whole = predict_images(content, "a.png", MODEL=dummy_model, cache=None)
+    tiled = predict_images_tiled(content, "a.png", MODEL=dummy_model,
+                                 cache=None)
+
+    assert tiled["tiles"] == 8
+    assert len(tiled["coordinates"]) > len(whole["coordinates"])
+    # boxes found in the tiles (at full resolution, so not 3x larger as in
+    # the whole image) are in image coordinates
+    tile_boxes = [(x1, y1, x2, y2) for x1, y1, x2, y2 in tiled["coordinates"]
+                  if x2 - x1 <= 101]
+    assert len(tile_boxes) == 2 * 8
+    for x1, y1, x2, y2 in tile_boxes:
+        assert 0 <= x1 < x2 <= 1920 and 0 <= y1 < y2 <= 1080
+    for box in whole["coordinates"]:
+        assert any(np.abs(np.subtract(box, other)).max() <= 1
+                   for other in tiled["coordinates"])
+
+    # featureless tiles are skipped
+    flat = cv2.imencode(".png", np.full((1080, 1920, 3), 90, np.uint8))[1]
+    monkeypatch.setattr(config, "TILE_MIN_STD", 6.0)
+    assert predict_images_tiled(flat.tobytes(), "b.png", MODEL=dummy_model,
+                                cache=None)["tiles"] == 0
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from app.utils.nms import (BACKENDS, iou_matrix, non_max_suppression,
+                           pre_nms_top_k)
+from app.utils.images_predict_fn import compute_iou
+
+
+def synthetic_boxes(n, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.uniform(50, 590, size=(n, 2))
+    sizes = rng.uniform(20, 120, size=(n, 2))
+    boxes = np.hstack([centers - sizes / 2, centers + sizes / 2])
+    return boxes.astype(np.float32), rng.uniform(0.5, 1.0, size=n)
+
+
+def test_iou_matrix_matches_compute_iou():
+    boxes, _ = synthetic_boxes(50)
+    matrix = iou_matrix(boxes)
+
+    for i in range(len(boxes)):
+        np.testing.assert_allclose(matrix[i], compute_iou(boxes[i], boxes),
+                                   atol=1e-5)
+
+
+@pytest.mark.parametrize("backend", sorted(BACKENDS))
+def test_backends_agree_with_greedy(backend):
+    boxes, scores = synthetic_boxes(500)
+
+    expected = non_max_suppression(boxes, scores, 0.5, backend="greedy")
+    kept = non_max_suppression(boxes, scores, 0.5, backend=backend)
+
+    assert sorted(kept.tolist()) == sorted(expected.tolist())
+    assert scores[kept[0]] == scores.max()
+
+
+def test_class_aware_keeps_overlapping_boxes_of_other_classes():
+    boxes = np.array([[10, 10, 50, 50], [12, 12, 52, 52]], dtype=np.float32)
+    scores = np.array([0.9, 0.8])
+
+    assert non_max_suppression(boxes, scores, 0.5).tolist() == [0]
+    assert sorted(
+        non_max_suppression(boxes, scores, 0.5,
+                            class_ids=np.array([0, 1])).tolist()) == [0, 1]
+
+
+def test_pre_nms_top_k():
+    scores = np.array([0.1, 0.9, 0.5, 0.7])
+
+    assert sorted(pre_nms_top_k(scores, 2).tolist()) == [1, 3]
+    assert pre_nms_top_k(scores, 0).tolist() == [0, 1, 2, 3]
+
+
+def test_empty_and_unknown_backend():
+    empty = np.empty((0, 4), dtype=np.float32)
+    assert non_max_suppression(empty, np.empty(0), 0.5).size == 0
+    with pytest.raises(ValueError):
+        non_max_suppression(empty, np.empty(0), 0.5, backend="fast")
@@ -0,0 +1,88 @@
+import cv2
+import numpy as np
+import pytest
+
+from app.model.model import predict_images_batch
+from app.model.parallel import (get_parallel_predictor,
+                                predict_images_parallel,
+                                shutdown_parallel_predictor,
+                                worker_intra_op_threads)
+
+
+@pytest.fixture
+def parallel_pool():
+    yield
+    shutdown_parallel_predictor()
+
+
+def test_parallel_matches_batch_in_archive_order(dummy_model, parallel_pool):
+    images = []
+    for i in range(11):
+        img = np.zeros((300 + 20 * i, 400, 3), dtype=np.uint8)
+        images.append((cv2.imencode(".jpg", img)[1].tobytes(), f"{i}.jpg"))
+    images.insert(5, (b"", "notes.txt"))
+
+    expected = list(
+        predict_images_batch(images, MODEL=dummy_model, cache=None))
+    predictions = list(
+        predict_images_parallel(images,
+                                workers=2,
+                                batch_size=4,
+                                MODEL=dummy_model,
+                                cache=None))
+
+    assert predictions == expected
+    # not an image: an error record in its place, the batch goes on
+    assert predictions[5] == {"image": "notes.txt",
+                               "error": "Unsupported image format"}
+    assert [p["image"] for p in predictions if "error" not in p] == [
+        f"{i}.jpg" for i in range(11)
+    ]
+
+
+def test_parallel_metrics_are_counted_in_the_parent(dummy_model,
+                                                    parallel_pool):
+    from app.cache import PredictionCache
+    from app.metrics import boxes_total, images_total, stage_seconds
+
+    images = [(cv2.imencode(".jpg", np.full((64, 64 + i, 3), i, np.uint8))[1]
+               .tobytes(), f"{i}.jpg") for i in range(3)]
+    cache = PredictionCache(max_bytes=1024 * 1024)
+    predicted = images_total.value(result="predicted")
+    cached = images_total.value(result="cached")
+    boxes = boxes_total.value()
+    nms = stage_seconds.count(stage="nms")
+
+    for _ in range(2):
+        list(predict_images_parallel(images, workers=1, batch_size=2,
+                                     MODEL=dummy_model, cache=cache))
+
+    assert images_total.value(result="predicted") == predicted + 3
+    assert images_total.value(result="cached") == cached + 3
+    assert boxes_total.value() == boxes + 3 * 2
+    assert stage_seconds.count(stage="nms") == nms + 3
+
+
+def test_pools_of_other_variants_leave_running_ones(dummy_model, tmp_path,
+                                                    parallel_pool):
+    from tests.conftest import make_dummy_model
+
+    other_model = make_dummy_model(tmp_path / "other.onnx")
+    pool = get_parallel_predictor(dummy_model, workers=1, batch_size=2)
+    images = [(cv2.imencode(".jpg", np.zeros((64, 64, 3), np.uint8))[1]
+               .tobytes(), f"{i}.jpg") for i in range(3)]
+    predictions = pool.predict(images, model_path=dummy_model)
+    first = next(predictions)
+
+    # a request for another precision meanwhile gets a pool of its own
+    assert get_parallel_predictor(other_model, 1, 2) is not pool
+    assert get_parallel_predictor(dummy_model, 1, 2) is pool
+    assert [first["image"]] + [p["image"] for p in predictions] == [
+        "0.jpg", "1.jpg", "2.jpg"]
+
+
+def test_worker_intra_op_threads_share_cores(monkeypatch):
+    monkeypatch.setattr("os.cpu_count", lambda: 32)
+
+    assert worker_intra_op_threads(4) == 8
+    assert worker_intra_op_threads(64) == 1
@@ -0,0 +1,35 @@
+import itertools
+
+import pytest
+
+from app.utils.pipeline import prefetch
+
+
+def test_prefetch_keeps_order():
+    assert list(prefetch(range(100), maxsize=3)) == list(range(100))
+
+
+def test_prefetch_reraises_producer_error():
+
+    def items():
+        yield 1
+        raise ValueError("corrupt member")
+
+    with pytest.raises(ValueError, match="corrupt member"):
+        list(prefetch(items(), maxsize=2))
+
+
+def test_prefetch_stops_producer_on_close():
+    produced = []
+
+    def items():
+        for i in itertools.count():
+            produced.append(i)
+            yield i
+
+    prefetched = prefetch(items(), maxsize=2)
+    assert next(prefetched) == 0
+    prefetched.close()
+
+    # bounded by the queue size, the producer stopped
+    assert len(produced) <= 5
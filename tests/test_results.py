@@ -0,0 +1,64 @@
+import io
+import json
+import pickle
+
+import numpy as np
+
+from app.cache import PredictionCache
+from app.results import Prediction, annotate, columns, dumps, dumps_npz
+
+
+def make_prediction(image="a.jpg"):
+    return Prediction(image, [[10, 20, 30, 40], [1, 2, 3, 4]], [0.6, 0.9],
+                      [0, 2])
+
+
+def test_prediction_reads_like_dict():
+    prediction = make_prediction()
+
+    assert prediction == {
+        "image": "a.jpg",
+        "coordinates": [(10, 20, 30, 40), (1, 2, 3, 4)],
+        "max_confidence_coordinate": (1, 2, 3, 4),
+    }
+    assert annotate(prediction, inferred=True)["inferred"] is True
+    empty = Prediction("b.jpg", np.empty((0, 4)), [], [])
+    assert empty["max_confidence_coordinate"] == (-1, -1, -1, -1)
+    assert json.loads(dumps(empty))["coordinates"] == []
+
+
+def test_dumps_matches_json():
+    results = [make_prediction(), annotate(make_prediction("b.jpg"), tiles=3),
+               None, {"error": "Unsupported file: c.txt"}]
+
+    assert json.loads(dumps(results)) == json.loads(
+        json.dumps([None if result is None else dict(result)
+                    for result in results]))
+
+
+def test_prediction_cached_with_arrays():
+    cache = PredictionCache(1024 * 1024)
+    cache.put("key", make_prediction())
+
+    cached = cache.get("key", "other.jpg")
+    assert isinstance(cached, Prediction)
+    assert cached["image"] == "other.jpg"
+    assert cached.scores.tolist() == make_prediction().scores.tolist()
+    assert pickle.loads(pickle.dumps(cached)) == cached
+
+
+def test_columns_one_row_per_box():
+    legacy = {"image": "b.jpg", "coordinates": [(5, 6, 7, 8)],
+              "max_confidence_coordinate": (5, 6, 7, 8)}
+    failed = {"image": "c.gif", "error": "Unsupported image format"}
+    table = columns([make_prediction(), failed, legacy])
+
+    assert table["image"].tolist() == ["a.jpg", "c.gif", "b.jpg"]
+    assert table["error"].tolist() == ["", "Unsupported image format", ""]
+    assert table["image_idx"].tolist() == [0, 0, 2]
+    assert table["x1"].tolist() == [10, 1, 5]
+    assert table["class_id"].tolist() == [0, 2, -1]
+    assert np.isnan(table["score"][2])
+
+    arrays = np.load(io.BytesIO(dumps_npz([make_prediction()])))
+    assert arrays["y2"].tolist() == [40, 4]
@@ -0,0 +1,117 @@
+import json
+import os
+import shutil
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import config
+from app.main import app
+from app.scan import (OUTPUT_NAME, image_files, mapped_images,
+                      recorded_images, resolve_scan_path, scan_directory)
+from app.utils.decode import image_format
+
+SAMPLE_IMAGE = os.path.join("tests", "sample_image1.jpg")
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    # root/field/{a.jpg, B.JPG, site/c.jpg, notes.txt, empty.jpg}
+    directory = tmp_path / "root" / "field"
+    (directory / "site").mkdir(parents=True)
+    for name in ("a.jpg", "B.JPG", "site/c.jpg"):
+        shutil.copy(SAMPLE_IMAGE, directory / name)
+    (directory / "notes.txt").write_text("not an image")
+    (directory / "empty.jpg").write_bytes(b"")
+    return directory
+
+
+def read_results(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_image_files_walks_in_name_order(dataset):
+    names = [name for _, name in image_files(str(dataset))]
+    assert names == ["B.JPG", "a.jpg", "empty.jpg", "site/c.jpg"]
+    assert [name for _, name in image_files(str(dataset), "*c.jpg")
+            ] == ["site/c.jpg"]
+
+
+def test_mapped_images_are_decodable(dataset):
+    (content, name), = mapped_images(iter([(str(dataset / "a.jpg"), "a")]))
+    assert image_format(content) == "jpeg"
+    with open(SAMPLE_IMAGE, "rb") as f:
+        assert content[:] == f.read()
+
+
+def test_resolve_scan_path_stays_within_roots(dataset):
+    root = str(dataset.parent)
+    assert resolve_scan_path("field", [root]) == str(dataset)
+    (dataset / "outside").symlink_to(dataset.parent.parent)
+    for path in ("..", "field/outside", "/etc"):
+        with pytest.raises(PermissionError):
+            resolve_scan_path(path, [root])
+    with pytest.raises(PermissionError):
+        resolve_scan_path("field", [])
+
+
+def test_scan_writes_jsonl_and_resumes(dataset, served_dummy_model):
+    output = str(dataset / OUTPUT_NAME)
+    records = list(scan_directory(str(dataset), output))
+    summary = records[-1]["summary"]
+    assert summary["images"] == 4 and summary["errors"] == 1
+    results = read_results(output)
+    assert [r["image"] for r in results] == [
+        "B.JPG", "a.jpg", "empty.jpg", "site/c.jpg"]
+    assert "error" in results[2] and results[1]["coordinates"]
+
+    # interrupted while writing the last line, then c.jpg was added again
+    with open(output, "rb+") as f:
+        f.truncate(os.path.getsize(output) - 10)
+    assert recorded_images(output) == {"B.JPG", "a.jpg", "empty.jpg"}
+
+    summary = list(scan_directory(str(dataset), output))[-1]["summary"]
+    assert (summary["images"], summary["skipped"]) == (1, 3)
+    assert [r["image"] for r in read_results(output)][-1] == "site/c.jpg"
+
+
+def test_scan_endpoint(dataset, served_dummy_model, monkeypatch):
+    client = TestClient(app)
+    response = client.post("/api/predict/scan", params={"path": "field"})
+    assert response.status_code == 403
+
+    monkeypatch.setattr(config, "SCAN_ROOTS", str(dataset.parent))
+    response = client.post("/api/predict/scan",
+                           params={"path": "field", "pattern": "*.jpg"})
+    assert response.status_code == 200
+    summary = json.loads(response.text.splitlines()[-1])["summary"]
+    assert summary["images"] == 3
+    assert summary["output"] == str(dataset / OUTPUT_NAME)
+
+    response = client.post("/api/predict/scan", params={"path": "missing"})
+    assert response.status_code == 404
+
+
+def test_scan_refuses_files_it_did_not_write(dataset, served_dummy_model,
+                                             monkeypatch):
+    monkeypatch.setattr(config, "SCAN_ROOTS", str(dataset.parent))
+    client = TestClient(app)
+    notes = dataset / "notes.jsonl"
+    notes.write_bytes(b'{"id": 1}\n{"id": 2')
+    one_line = dataset / "one.jsonl"
+    one_line.write_bytes(b'{"id": 1}')
+    with open(SAMPLE_IMAGE, "rb") as f:
+        image = f.read()
+
+    for output in ("field/a.jpg", "field/notes.jsonl", "field/one.jsonl",
+                   "field/site"):
+        response = client.post("/api/predict/scan",
+                               params={"path": "field", "output": output})
+        assert response.status_code == 400, output
+    assert (dataset / "a.jpg").read_bytes() == image
+    assert notes.read_bytes() == b'{"id": 1}\n{"id": 2'
+    assert one_line.read_bytes() == b'{"id": 1}'
+    with pytest.raises(ValueError):
+        recorded_images(str(one_line))
+
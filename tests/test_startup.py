@@ -0,0 +1,78 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+from fastapi.testclient import TestClient
+
+from app import config
+from app.main import app
+from app.model.model import warm_up
+from app.model.registry import ModelRegistry, optimized_model_cache
+from app.startup import Startup
+
+
+def test_import_is_lazy():
+    # submodules do not pull in the application or the heavy libraries
+    code = ("import sys, app.config, app.utils.images; "
+            "print(sorted({'fastapi', 'cv2', 'onnxruntime'} & set(sys.modules)))")
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True,
+                            text=True, check=True).stdout
+    assert output.strip() == "[]"
+
+
+def test_ready_after_model_load(served_dummy_model, monkeypatch):
+    startup = Startup()
+    monkeypatch.setattr("app.startup_api.startup", startup)
+    client = TestClient(app)
+
+    assert client.get("/ready").status_code == 503
+    startup.load(lambda: served_dummy_model)
+
+    response = client.get("/ready")
+    assert response.status_code == 200
+    assert response.json()["seconds"]["model_loaded"] > 0
+
+
+def test_warm_up_runs_the_pre_processing(served_dummy_model, monkeypatch):
+    calls = []
+    monkeypatch.setattr("app.model.model.final_image_pre_process",
+                        lambda content, input_shape: calls.append(content))
+    warmup_seconds = served_dummy_model["warmup_seconds"]
+
+    assert warm_up() is served_dummy_model
+    assert len(calls) == 1 and calls[0][:3] == b"\xff\xd8\xff"
+    assert served_dummy_model["warmup_seconds"] > warmup_seconds
+
+
+def test_failed_load_is_reported():
+    startup = Startup()
+
+    def load():
+        raise FileNotFoundError("no model")
+
+    startup.load_in_background(load).join()
+    assert not startup.ready
+    assert startup.report()["error"] == "FileNotFoundError: no model"
+
+
+def test_optimized_model_cache(dummy_model, tmp_path, monkeypatch):
+    path, level = optimized_model_cache(dummy_model, "all", str(tmp_path))
+    assert level == "all"  # layout optimizations are redone on load
+    mtime = os.stat(path).st_mtime_ns
+    assert optimized_model_cache(dummy_model, "all", str(tmp_path)) == (path, level)
+    assert os.stat(path).st_mtime_ns == mtime
+
+    _, level = optimized_model_cache(dummy_model, "extended", str(tmp_path))
+    assert level == "disable"
+
+    monkeypatch.setattr(config, "ORT_CACHE_DIR", str(tmp_path))
+    cached = ModelRegistry().load(dummy_model, "test")
+    monkeypatch.setattr(config, "ORT_CACHE_DIR", "")
+    plain = ModelRegistry().load(dummy_model, "test")
+    assert cached["session_path"] == path
+
+    tensor = np.random.default_rng(0).random((1, 3, 640, 640), dtype=np.float32)
+    outputs = [model["session"].run(None, {model["input_names"][0]: tensor})[0]
+               for model in (cached, plain)]
+    np.testing.assert_allclose(*outputs, rtol=1e-5)